@@ -1,195 +1,141 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
 import random
-import json
+import asyncio
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from logging.handlers import TimedRotatingFileHandler
 import re
 
+from utils.connectfour.bitboard import Bitboard, WIDTH
+from utils.connectfour.solver import best_move
+from utils.connectfour.games import GameRegistry
+from utils.connectfour.ranking import RatingIndex
+from utils.connectfour import glicko
 
-def winCheck(grid) -> int:
-    """Checks if a player has won."""
-    for row in grid:
-        for col in range(4):
-            if row[col] == row[col + 1] == row[col + 2] == row[col + 3] != 0:
-                return row[col]
+# wall clock limit on one bot move, well past the longest difficulty budget
+SOLVER_TIMEOUT = 15
 
-    for col in range(7):
-        for row in range(3):
-            if grid[row][col] == grid[row + 1][col] == grid[row + 2][col] == grid[row + 3][col] != 0:
-                return grid[row][col]
 
-    for row in range(3):
-        for col in range(4):
-            if grid[row][col] == grid[row + 1][col + 1] == grid[row + 2][col + 2] == grid[row + 3][col + 3] != 0:
-                return grid[row][col]
-            if grid[row + 3][col] == grid[row + 2][col + 1] == grid[row + 1][col + 2] == grid[row][col + 3] != 0:
-                return grid[row + 3][col]
-    return 0
-
-
-def displayGrid(grid) -> str:
+def displayGrid(board: Bitboard) -> str:
     emoji_map = {
         0: ":black_large_square:",
         1: ":red_circle:",
         2: ":blue_circle:"
     }
     number_emoji_row = "\n:one::two::three::four::five::six::seven:"
-    return "\n".join("".join(emoji_map[cell] for cell in row) for row in grid) + number_emoji_row
+    return "\n".join("".join(emoji_map[cell] for cell in row) for row in board.rows()) + number_emoji_row
 
 
-def drop_piece(grid, column, player):
-    for row in reversed(grid):
-        if row[column] == 0:
-            row[column] = player
-            return True
-    return False
-
 class ConnectFourUI(discord.ui.View):
-    def __init__(self, db):
+    def __init__(self, games):
         super().__init__(timeout=None)
 
-        self.db = db
+        self.games = games
 
 
-    @discord.ui.button(label="<", style=discord.ButtonStyle.primary)
-    async def cf_move_left(self, interaction: discord.Interaction, button: discord.ui.Button):
-        message_id = interaction.message.id
-        player_id = interaction.user.id
-
-        game = self.db.select_connect_four_game(message_id)
-
-        selected_column -= 1
+    async def fetch_turn(self, interaction: discord.Interaction):
+        """The game of the pressed board if it is the user's turn, otherwise answers the interaction and returns None."""
+        game = self.games.get(interaction.message.id)
 
         if not game:
             await interaction.response.send_message("You are not in a game!", ephemeral=True)
-            return
+            return None
 
-        grid = json.loads(game["grid"])
-
-        if (game["turn"] == 1 and player_id != game["player1_id"]) or (game["turn"] == 2 and player_id != game["player2_id"]):
+        if interaction.user.id != game.current_player_id:
             await interaction.response.send_message("It's not your turn!", ephemeral=True)
-            return
-
-        if selected_column < 1:
-            await interaction.response.send_message("Column out of range!", ephemeral=True)
-            return
-        
-        self.db.connectfour_update_selection(game["game_id"], selected_column)
+            return None
 
-        await interaction.response.edit_message(embed=render_board(grid, game["player1_id"], game["player2_id"], game["turn"], selected_column), view=self)
+        return game
 
 
-    @discord.ui.button(label="Place", style=discord.ButtonStyle.primary)
-    async def cf_place(self, interaction: discord.Interaction, button: discord.ui.Button):
-        message_id = interaction.message.id
-        player_id = interaction.user.id
+    @discord.ui.button(label="<", style=discord.ButtonStyle.primary, custom_id="connectfour:left")
+    async def cf_move_left(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.move_selection(interaction, -1)
 
-        game = self.db.select_connect_four_game(message_id)
 
-        if not game:
+    @discord.ui.button(label="Place", style=discord.ButtonStyle.primary, custom_id="connectfour:place")
+    async def cf_place(self, interaction: discord.Interaction, button: discord.ui.Button):
+        game = self.games.get(interaction.message.id)
+        if game is None:
             await interaction.response.send_message("You are not in a game!", ephemeral=True)
             return
 
-        grid = json.loads(grid)
+        async with game.lock:
+            if await self.fetch_turn(interaction) is None:
+                return
 
-        if (game["turn"] == 1 and player_id != game["player1_id"]) or (game["turn"] == 2 and player_id != game["player2_id"]):
-            await interaction.response.send_message("It's not your turn!", ephemeral=True)
-            return
+            if game.selected_column < 1 or game.selected_column > 7:
+                await interaction.response.send_message("Invalid column! Choose between 1 and 7.", ephemeral=True)
+                return
 
-        if game["selected_column"] < 1 or game["selected_column"] > 7:
-            await interaction.response.send_message("Invalid column! Choose between 1 and 7.", ephemeral=True)
-            return
+            board = game.board
+            col_idx = game.selected_column - 1
+            if not board.play(col_idx, game.turn):
+                await interaction.response.send_message("That column is full!", ephemeral=True)
+                return
 
-        col_idx = game["selected_column"] - 1
-        if not drop_piece(grid, col_idx, game["turn"]):
-            await interaction.response.send_message("That column is full!", ephemeral=True)
-            return
+            winner = board.winner()
+            draw = not winner and board.is_full()
 
-        winner = winCheck(grid)
-
-        next_turn = 1 if game["turn"] == 2 else 2
-
-        self.db.connectfour_check_game_state(winner, next_turn, grid, game)
-
-        if winner:
-            await self.disable_all(interaction) # disables the ui
-
-            player_a = self.db.connectfour_fetch_user(game["player1_id"])
-            player_b = self.db.connectfour_fetch_user(game["player2_id"])
-
-            k_a = k_factor(player_a["games_played"])
-            k_b = k_factor(player_b["games_played"])
+            game.turn = 1 if game.turn == 2 else 2
 
-            if winner == 1:
-                result_a = 1
-            elif winner == 2:
-                result_a = 0
+            if winner or draw:
+                self.games.finish(game)
+                await self.disable_all(interaction) # disables the ui
             else:
-                result_a = 0.5
-
-            new_rating_a, new_rating_b = update_ratings(
-                player_a["rating"], player_b["rating"], result_a, k_a, k_b
-            )
+                self.games.save(game)
 
-            new_rating_a = round(new_rating_a)
-            new_rating_b = round(new_rating_b)
+            await interaction.response.edit_message(embed=render_board(board, game.player1_id, game.player2_id, winner if winner else game.turn, game.selected_column, winner, draw), view=self)
 
-            games_played_a += 1
-            games_played_b += 1
-
-            if winner == 1:
-                wins_a += 1
-                losses_b += 1
-            elif winner == 2:
-                wins_b += 1
-                losses_a += 1
-            
-            self.db.connectfour_user_insert(game["player1_id"], new_rating_a, games_played_a, wins_a, losses_a)
-            self.db.connectfour_user_insert(game["player2_id"], new_rating_b, games_played_b, wins_b, losses_b)
+        cog = interaction.client.get_cog("ConnectFour")
+        if (winner or draw) and not game.difficulty:
+            await cog.record_result(game, winner)
 
-        await interaction.response.edit_message(embed=render_board(grid, game["player1_id"], game["player2_id"], winner if winner else next_turn, game["selected_column"], winner), view=self)
+        if game.difficulty and not (winner or draw):
+            await cog.play_bot_move(game, interaction.message, self)
 
 
-    @discord.ui.button(label=">", style=discord.ButtonStyle.primary)
+    @discord.ui.button(label=">", style=discord.ButtonStyle.primary, custom_id="connectfour:right")
     async def cf_move_right(self, interaction: discord.Interaction, button: discord.ui.Button):
-        message_id = interaction.message.id
-        player_id = interaction.user.id
-
-        game = self.db.select_connect_four_game(message_id)
+        await self.move_selection(interaction, 1)
 
-        selected_column += 1
 
-        if not game:
+    async def move_selection(self, interaction: discord.Interaction, step: int):
+        game = self.games.get(interaction.message.id)
+        if game is None:
             await interaction.response.send_message("You are not in a game!", ephemeral=True)
             return
 
-        grid = json.loads(grid)
+        async with game.lock:
+            if await self.fetch_turn(interaction) is None:
+                return
 
-        if (game["turn"] == 1 and player_id != game["player1_id"]) or (game["turn"] == 2 and player_id != game["player2_id"]):
-            await interaction.response.send_message("It's not your turn!", ephemeral=True)
-            return
+            selected_column = game.selected_column + step
+            if selected_column < 1 or selected_column > 7:
+                await interaction.response.send_message("Column out of range!", ephemeral=True)
+                return
 
-        if selected_column > 7:
-            await interaction.response.send_message("Column out of range!", ephemeral=True)
-            return
-        
-        self.db.connectfour_update_selection(game["game_id"], selected_column)
+            game.selected_column = selected_column
+            self.games.save(game)
 
-        await interaction.response.edit_message(embed=render_board(grid, game["player1_id"], game["player2_id"], game["turn"], selected_column), view=self)
+            await interaction.response.edit_message(embed=render_board(game.board, game.player1_id, game.player2_id, game.turn, selected_column), view=self)
 
 
-    async def disable_all(self, interaction: discord.Interaction):
+    async def disable_all(self, interaction: discord.Interaction = None):
         for item in self.children:
             if isinstance(item, discord.ui.Button):
                 item.disabled = True
 
 
 class ConnectFourRequestUI(discord.ui.View):
-    def __init__(self, db):
+    def __init__(self, games):
         super().__init__(timeout=300)
 
-        self.db = db
+        self.games = games
 
 
     @discord.ui.button(label="Accept", style=discord.ButtonStyle.success)
@@ -204,17 +150,17 @@ class ConnectFourRequestUI(discord.ui.View):
         player1 = interaction.message.interaction_metadata.user.id
         player2 = opponent_id
 
-        self.db.connectfour_game_exists(player1, player2)
+        self.games.end_player_games(player1, player2)
 
         # Initialize game state
-        grid = [[0] * 7 for _ in range(6)]
+        board = Bitboard()
         turn = random.randint(1, 2)
 
-        view = ConnectFourUI()
-        await interaction.response.edit_message(embed=render_board(grid, player1, player2, turn, 1), view=view)
+        view = ConnectFourUI(self.games)
+        await interaction.response.edit_message(embed=render_board(board, player1, player2, turn, 1), view=view)
         board_msg = interaction.message
 
-        self.db.connectfour_create_game(player1, player2, turn, grid, board_msg)
+        await self.games.create(player1, player2, turn, board, board_msg)
 
 
     @discord.ui.button(label="Decline", style=discord.ButtonStyle.danger)
@@ -235,7 +181,73 @@ class ConnectFour(commands.Cog):
         self.db = bot.database
         self.logger = bot.logger
         self.languages = bot.languages
-        
+
+        self.games = GameRegistry(self.db, self.logger)
+        self.ratings = RatingIndex()
+
+        # searches are CPU bound, they run in other processes so the event loop never waits on them
+        self.solver_pool = self._solver_pool()
+
+
+    @staticmethod
+    def _solver_pool():
+        # a fresh interpreter per worker rather than a fork of the running bot and its threads
+        return ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn"))
+
+
+    async def cog_load(self):
+        self.ratings.load(await self.db.connectfour_fetch_ratings())
+
+        # boards sent before a restart keep working once their views are registered again
+        for game in await self.games.load():
+            self.bot.add_view(ConnectFourUI(self.games), message_id=game.message_id)
+        self.logger.info(f"Restored {len(self.games)} Connect Four games")
+
+        self.rating_period.start()
+
+
+    async def cog_unload(self):
+        self.rating_period.cancel()
+        self.solver_pool.shutdown(wait=False, cancel_futures=True)
+        await self.games.close()
+
+
+    @tasks.loop(hours=1)
+    async def rating_period(self):
+        """Closes a Glicko-2 rating period once it is over: every rated player is recomputed from its games."""
+        try:
+            players, games, last_game_id, processed_at = await self.db.connectfour_fetch_glicko_period()
+            now = time.time()
+
+            if processed_at is None:
+                # first run, the first period starts now
+                await self.db.connectfour_save_glicko([], last_game_id)
+                return
+            if now - processed_at < glicko.RATING_PERIOD or not players:
+                return
+
+            index = {player["id"]: i for i, player in enumerate(players)}
+            rated_games = [game for game in games if game["player1_id"] in index and game["player2_id"] in index]
+
+            loop = asyncio.get_running_loop()
+            ratings, rds, volatilities = await loop.run_in_executor(
+                None, glicko.rate_period,
+                [player["glicko_rating"] for player in players],
+                [player["glicko_rd"] for player in players],
+                [player["glicko_volatility"] for player in players],
+                [index[game["player1_id"]] for game in rated_games],
+                [index[game["player2_id"]] for game in rated_games],
+                [game["result"] for game in rated_games]
+            )
+
+            await self.db.connectfour_save_glicko(
+                [(float(ratings[i]), float(rds[i]), float(volatilities[i]), player["id"]) for i, player in enumerate(players)],
+                games[-1]["id"] if games else last_game_id
+            )
+            self.logger.info(f"Processed Connect Four rating period: {len(rated_games)} games, {len(players)} players")
+        except Exception as e:
+            self.logger.error(f"Error while processing Connect Four rating period: {e}")
+
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -243,18 +255,128 @@ class ConnectFour(commands.Cog):
 
 
     @app_commands.command(name="connectfour", description="Start a Connect Four game")
-    async def connect_four(self, interaction: discord.Interaction, opponent: discord.User):
+    @app_commands.describe(difficulty="Difficulty when playing against the bot")
+    @app_commands.choices(difficulty=[
+        app_commands.Choice(name="Easy", value="easy"),
+        app_commands.Choice(name="Medium", value="medium"),
+        app_commands.Choice(name="Hard", value="hard"),
+        app_commands.Choice(name="Expert", value="expert")
+    ])
+    async def connect_four(self, interaction: discord.Interaction, opponent: discord.User, difficulty: app_commands.Choice[str] = None):
         """Starts a new Connect Four game."""
         if interaction.user == opponent:
             await interaction.response.send_message("You cannot play against yourself!", ephemeral=True)
             return
 
-        await interaction.response.send_message(f"{opponent.mention} **{interaction.user.name}** has invited you to a Connect Four match. Would you like to join?", view=ConnectFourRequestUI(self.db))
+        if opponent.id == self.bot.user.id:
+            await self.start_bot_game(interaction, difficulty.value if difficulty else "medium")
+            return
+
+        await interaction.response.send_message(f"{opponent.mention} **{interaction.user.name}** has invited you to a Connect Four match. Would you like to join?", view=ConnectFourRequestUI(self.games))
 
     
+    async def start_bot_game(self, interaction: discord.Interaction, difficulty: str):
+        player1 = interaction.user.id
+        player2 = self.bot.user.id
+
+        # only the human's old game is cleared, the bot plays many games at once
+        self.games.end_player_games(player1)
+
+        board = Bitboard()
+        turn = random.randint(1, 2)
+
+        view = ConnectFourUI(self.games)
+        await interaction.response.send_message(embed=render_board(board, player1, player2, turn, 1), view=view)
+        board_msg = await interaction.original_response()
+
+        game = await self.games.create(player1, player2, turn, board, board_msg, difficulty)
+
+        if turn == 2:
+            await self.play_bot_move(game, board_msg, view)
+
+
+    async def play_bot_move(self, game, message: discord.Message, view: discord.ui.View):
+        """Plays the bot's answer in a game against it and updates the board message."""
+        # the search runs outside the lock, button presses meanwhile still get their "not your turn" in time
+        async with game.lock:
+            boards, turn = tuple(game.board.boards), game.turn
+        column = await self.search_move(boards, turn, game.difficulty)
+
+        async with game.lock:
+            # the game may have been replaced or ended while the bot was thinking
+            if self.games.get(game.message_id) is not game or tuple(game.board.boards) != boards or game.turn != turn:
+                return
+
+            board = game.board
+            board.play(column, game.turn)
+            winner = board.winner()
+            draw = not winner and board.is_full()
+            game.turn = 1 if game.turn == 2 else 2
+
+            if winner or draw:
+                self.games.finish(game)
+                await view.disable_all()
+            else:
+                self.games.save(game)
+
+            await message.edit(embed=render_board(board, game.player1_id, game.player2_id, winner if winner else game.turn, game.selected_column, winner, draw), view=view)
+
+
+    async def search_move(self, boards, turn: int, difficulty: str) -> int:
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self.solver_pool, best_move, *boards, turn, difficulty)
+            return await asyncio.wait_for(future, SOLVER_TIMEOUT)
+        except Exception as e:
+            # a broken or stuck pool must not leave the game waiting on the bot forever
+            self.logger.error(f"Connect Four solver failed, playing a random move instead: {e!r}")
+            if isinstance(e, BrokenProcessPool):
+                # a dead worker breaks the pool for good, later moves get a fresh one
+                self.solver_pool = self._solver_pool()
+            board = Bitboard(*boards)
+            return random.choice([col for col in range(WIDTH) if board.can_play(col)])
+
+
+    async def record_result(self, game, winner: int):
+        if winner == 1:
+            result_a = 1
+        elif winner == 2:
+            result_a = 0
+        else:
+            result_a = 0.5
+
+        def rate(player_a, player_b):
+            k_a = k_factor(player_a["games_played"])
+            k_b = k_factor(player_b["games_played"])
+
+            new_rating_a, new_rating_b = update_ratings(
+                player_a["rating"], player_b["rating"], result_a, k_a, k_b
+            )
+
+            wins_a, losses_a = player_a["wins"], player_a["losses"]
+            wins_b, losses_b = player_b["wins"], player_b["losses"]
+
+            if winner == 1:
+                wins_a += 1
+                losses_b += 1
+            elif winner == 2:
+                wins_b += 1
+                losses_a += 1
+
+            return (
+                (round(new_rating_a), player_a["games_played"] + 1, wins_a, losses_a),
+                (round(new_rating_b), player_b["games_played"] + 1, wins_b, losses_b)
+            )
+
+        new_a, new_b = await self.db.connectfour_record_result(game.player1_id, game.player2_id, result_a, rate)
+
+        self.ratings.update(game.player1_id, new_a[0])
+        self.ratings.update(game.player2_id, new_b[0])
+
+
     @app_commands.command(name="connectfour_stats", description="Check your Connect Four stats")
     async def connect_four_stats_command(self, interaction: discord.Interaction):
-        user = self.db.connectfour_fetch_user(interaction.user.id)
+        user = await self.db.connectfour_fetch_user(interaction.user.id)
         
         embed = discord.Embed(
             title=f"{interaction.user.display_name}'s Connect Four stats",
@@ -263,6 +385,7 @@ class ConnectFour(commands.Cog):
                 Games played: `{user["games_played"]}`
                 Wins: `{user["wins"]}`
                 Losses: `{user["losses"]}`
+                Glicko-2: `{user["glicko_rating"]:.0f} ± {user["glicko_rd"]:.0f}`
             """
         )
 
@@ -271,9 +394,7 @@ class ConnectFour(commands.Cog):
     
     @app_commands.command(name="connectfour_leaderboard", description="Shows the top Connect 4 players")
     async def connect_four_leaderboard_command(self, interaction: discord.Interaction, page: int = 1):
-        user_data = self.db.connectfour_fetch_all_users(1)
-
-        self.logger.debug(user_data)
+        user_data = self.ratings.page(max(1, page))
 
         if not user_data:
             await interaction.response.send_message("No players found!", ephemeral=True)
@@ -282,32 +403,35 @@ class ConnectFour(commands.Cog):
         emoji_list = [":first_place:", ":second_place:", ":third_place:"]
 
         description = ""
-        i = 1
-        for user in user_data:
-            placement_index = emoji_list[i-1] if i <= 3 else f"#{i}" 
+        for position, user_id, rating in user_data:
+            placement_index = emoji_list[position-1] if position <= 3 else f"#{position}" 
 
-            description += f"{placement_index} <@{id}> `{user["rating"]}`\n"
-
-            if i >= 10:
-                break
-
-            i += 1
+            description += f"{placement_index} <@{user_id}> `{rating}`\n"
 
         embed = discord.Embed(
             title="Connect 4 Leaderboard",
             description=description
         )
+
+        rank = self.ratings.rank(interaction.user.id)
+        if rank is not None:
+            embed.set_footer(text=f"Your rank: #{rank} of {len(self.ratings)}")
         
         await interaction.response.send_message(embed=embed)
 
 
-def render_board(grid, player1, player2, turn, selected_column, winner=0):
+def render_board(board, player1, player2, turn, selected_column, winner=0, draw=False):
         """Generates the game board as an embed."""
         embed = discord.Embed(
             title="Connect Four",
-            color=discord.Color.green() if winner else discord.Color.red() if turn == 1 else discord.Color.blue())
-        status_label = f"🎉 <@{player1 if winner == 1 else player2}> wins!" if winner else f"<@{player1 if turn == 1 else player2}>'s Turn {':red_circle:' if turn == 1 else ':blue_circle:'}"
-        embed.description = f"{status_label}\n{displayGrid(grid)}\nSelected Column: `{selected_column}`"
+            color=discord.Color.green() if winner or draw else discord.Color.red() if turn == 1 else discord.Color.blue())
+        if draw:
+            status_label = "It's a draw!"
+        elif winner:
+            status_label = f"🎉 <@{player1 if winner == 1 else player2}> wins!"
+        else:
+            status_label = f"<@{player1 if turn == 1 else player2}>'s Turn {':red_circle:' if turn == 1 else ':blue_circle:'}"
+        embed.description = f"{status_label}\n{displayGrid(board)}\nSelected Column: `{selected_column}`"
 
         return embed
 
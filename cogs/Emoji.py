@@ -13,6 +13,8 @@ class Emoji(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.logger = bot.logger
+        self.http_client = bot.http_client
+        self.images = bot.image_cache
 
 
     @commands.Cog.listener()
@@ -37,14 +39,15 @@ class Emoji(commands.Cog):
 
         name = name or emoji_name
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(emoji_url) as response:
-                if response.status == 200:
-                    img_data = await response.read()
-                    new_emoji = await interaction.guild.create_custom_emoji(name=name, image=img_data)
-                    await interaction.response.send_message(f"Emoji cloned successfully: {new_emoji}")
-                else:
-                    await interaction.response.send_message("Failed to download the emoji.", ephemeral=True)
+        try:
+            # discord rejects emojis larger than 256 KiB anyway
+            image = await self.images.get(emoji_url, max_size=256 * 1024)
+        except aiohttp.ClientError:
+            await interaction.response.send_message("Failed to download the emoji.", ephemeral=True)
+            return
+
+        new_emoji = await interaction.guild.create_custom_emoji(name=name, image=image.data)
+        await interaction.response.send_message(f"Emoji cloned successfully: {new_emoji}")
 
 
     @group.command(name="combine", description="Combines two emojis")
@@ -58,14 +61,11 @@ class Emoji(commands.Cog):
         self.logger.debug(url)
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        data = await response.read()
-                        image_file = discord.File(io.BytesIO(data), filename=f"{emoji_1}_{emoji_2}.png".strip(":"))
-                        await interaction.response.send_message(file=image_file)
-                    else:
-                        await interaction.response.send_message(f"Failed to fetch image.\nHTTP Status: {response.status}")
+            data = await self.http_client.get_bytes(url)
+            image_file = discord.File(io.BytesIO(data), filename=f"{emoji_1}_{emoji_2}.png".strip(":"))
+            await interaction.response.send_message(file=image_file)
+        except aiohttp.ClientResponseError as e:
+            await interaction.response.send_message(f"Failed to fetch image.\nHTTP Status: {e.status}")
         except Exception as e:
             self.logger.error(f"An error occured: {e}")
 
@@ -1,13 +1,17 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
 import random
 import json
-import sqlite3
+from collections import Counter
 import datetime
 from dataclasses import dataclass
 from datetime import datetime
 
+from utils.fishing.registry import ItemRegistry
+from utils.fishing.catch_engine import CatchEngine
+from utils.fishing.player_cache import PlayerCache
+
 emojis = None
 
 biome_level_requirements = {
@@ -33,11 +37,11 @@ rarity_colors = [
 
 
 async def item_autocomplete(interaction: discord.Interaction, current: str):
-    current = current.lower()
-    with open("data/fishing/items.json", "r") as f:
-        item_registry = json.load(f)
-    matched_items = [item for item in item_registry if current in item['name'].lower()]
-    return [app_commands.Choice(name=item['name'], value=item['name']) for item in matched_items[:25]]
+    # only suggest items the user owns, ranked by the in-memory registry index
+    cog = interaction.client.get_cog("Fishing")
+    owned_items = await cog.players.owned_items(interaction.user.id)
+    matched_items = cog.ITEM_REGISTRY.search(current, 25, owned_items)
+    return [app_commands.Choice(name=item['name'], value=item['name']) for item in matched_items]
 
 
 class Fishing(commands.Cog):
@@ -47,38 +51,27 @@ class Fishing(commands.Cog):
 
         self.ITEM_REGISTRY = self.load_item_registry()
         self.LOOT_TABLES = self.load_loot_tables()
+        self.catch_engine = CatchEngine(self.ITEM_REGISTRY, crate_chance=0.1)
+        self.db = bot.database
+        self.players = PlayerCache(self.db, logger=self.logger)
 
-        self.conn = sqlite3.connect('data.db')
-        self.conn.row_factory = sqlite3.Row
-        self.cursor = self.conn.cursor()
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS fish_user(
-                id INTEGER PRIMARY KEY,
-                level INTEGER DEFAULT 1,
-                xp INTEGER DEFAULT 0,
-                max_xp INTEGER DEFAULT 100,
-                money INTEGER DEFAULT 0,
-                current_biome TEXT DEFAULT 'river'
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS fish_inventory(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                item_id INTEGER,
-                user_id INTEGER,
-                quantity INTEGER,
-                UNIQUE(item_id, user_id)
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS fish_equipment(
-                user_id INTEGER NOT NULL,
-                slot TEXT NOT NULL,
-                item_id INTEGER,
-                PRIMARY KEY (user_id, slot)
-            )
-        """)
-        self.conn.commit()
+
+    async def cog_load(self):
+        await self.players.start()
+        self.flush_players.start()
+
+
+    async def cog_unload(self):
+        self.flush_players.cancel()
+        await self.players.close()
+
+
+    @tasks.loop(seconds=30)
+    async def flush_players(self):
+        try:
+            await self.players.flush()
+        except Exception as e:
+            self.logger.error(f"Error while flushing fishing players: {e}")
 
 
     @commands.Cog.listener()
@@ -94,42 +87,20 @@ class Fishing(commands.Cog):
     async def fish(self, interaction: discord.Interaction):
         user_id = interaction.user.id
 
-        self.cursor.execute("SELECT level, xp, max_xp, current_biome FROM fish_user WHERE id = ?", (user_id,))
-        user_data = self.cursor.fetchone()
-        
-        if user_data is not None:
-            level, xp, max_xp, current_biome = user_data
-        else:
-            level = 1
-            xp = 0
-            max_xp = 100
-            current_biome = 'river'
-            
-        weights = [1, 4, 20, 65, 195, 360]
-        rarity_levels = [6, 5, 4, 3, 2, 1]
-        highest_rarity = 0
-        crate_chance = 0.1
-        
-        max_lure = 5
-        lure = random.randint(1, max_lure) + random.randint(1, max_lure) // 2 # triangular distribution of lures
-        catches = []
+        player = await self.players.get(user_id)
+        level, xp, max_xp, current_biome = player["level"], player["xp"], player["max_xp"], player["current_biome"]
 
-        for _ in range(lure):
-            rarity = random.choices(rarity_levels, weights)[0]
+        max_lure = 5
+        lure = self.catch_engine.roll_lure(max_lure)
 
-            if random.random() < crate_chance:
-                rarity = max(3, rarity)
-                fish_items = [item for item in self.ITEM_REGISTRY if item['rarity'] == rarity and item['type'] == "crate"]
-            else:
-                fish_items = [item for item in self.ITEM_REGISTRY if item['rarity'] == rarity and item['biome'] == current_biome and item['type'] == "fish"]
+        # rarities, crate rolls and item picks come from the precomputed loot table of the biome
+        item_ids, rarities = self.catch_engine.cast(current_biome, lure)
 
-            if not fish_items:
-                self.logger.warning(f"No fish found for rarity {rarity} in biome {current_biome}")
-                continue
+        if len(item_ids) < lure:
+            self.logger.warning(f"No fish found for {lure - len(item_ids)} rolls in biome {current_biome}")
 
-            catch = random.choice(fish_items)
-            catches.append(dict(catch))
-            highest_rarity = max(highest_rarity, rarity)
+        catches = [dict(self.ITEM_REGISTRY.get(item_id)) for item_id in item_ids]
+        highest_rarity = max(rarities, default=0)
         
         xp_gain = int(sum(catch['value'] for catch in catches))
         xp += xp_gain
@@ -143,20 +114,11 @@ class Fishing(commands.Cog):
             level += 1
             level_label = f"**LEVEL UP! {old_level} >> {level}**"
 
-        self.cursor.execute("""
-            INSERT INTO fish_user (id, level, xp, max_xp, current_biome) VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(id) DO UPDATE SET level = ?, xp = ?, max_xp = ?, current_biome = ?
-        """, (user_id, level, xp, max_xp, current_biome, level, xp, max_xp, current_biome))
+        # written behind, the database sees it on the next flush
+        self.players.update(user_id, Counter(catch["id"] for catch in catches), level=level, xp=xp, max_xp=max_xp)
 
         stacks = {}
         for catch in catches:
-            self.cursor.execute("""
-                INSERT INTO fish_inventory (item_id, user_id, quantity)
-                VALUES (?, ?, ?)
-                ON CONFLICT(item_id, user_id)
-                DO UPDATE SET quantity = quantity + excluded.quantity
-                """, (catch["id"], user_id, 1))
-
             catch_name = f"{catch['name']} {':star:' * catch['rarity']}"
             stacks[catch_name] = stacks.get(catch_name, 0) + 1
 
@@ -173,8 +135,6 @@ class Fishing(commands.Cog):
             color=rarity_colors[highest_rarity]
         )
         embed.set_footer(text=f"Biome: {current_biome.capitalize()}")
-        
-        self.conn.commit()
 
         await interaction.response.send_message(embed=embed)
 
@@ -193,16 +153,7 @@ class Fishing(commands.Cog):
             await interaction.response.send_message("No such item exists. Try again!", ephemeral=True)
             return
 
-        self.cursor.execute("""
-            SELECT quantity FROM fish_inventory WHERE user_id = ? AND item_id = ?
-        """, (interaction.user.id, matched_item['id'],))
-        item_stack = self.cursor.fetchone()
-        if item_stack is None:
-            await interaction.response.send_message("You don't have that item in your inventory!", ephemeral=True)
-            return
-        
-        quantity = item_stack[0]
-
+        quantity = await self.players.item_quantity(interaction.user.id, matched_item['id'])
         if quantity <= 0:
             await interaction.response.send_message("You don't have that item in your inventory!", ephemeral=True)
             return
@@ -222,31 +173,27 @@ class Fishing(commands.Cog):
                 return
             
             weights = [entry['weight'] for entry in entries]
+            loot_counts = Counter()
             item_names = {}
-            for _ in range(rolls):
-                loot_entry = random.choices(entries, weights=weights)[0]
-
+            # roll and validate everything before writing, so a bad entry never leaves a half-opened crate
+            for loot_entry in random.choices(entries, weights=weights, k=rolls):
                 loot_item = self.get_item(loot_entry['name'])
                 if loot_item is None:
                     self.logger.error(f"Invalid loot entry in loot table: {loot_entry}")
                     await interaction.response.send_message("An error occurred while opening the crate. Invalid loot entry in loot table.", ephemeral=True)
                     return
-                
-                self.cursor.execute("""
-                    INSERT INTO fish_inventory (item_id, user_id, quantity)
-                    VALUES (?, ?, ?)
-                    ON CONFLICT(item_id, user_id)
-                    DO UPDATE SET quantity = quantity + excluded.quantity
-                    """, (loot_item["id"], interaction.user.id, 1))
-                
+
+                loot_counts[loot_item["id"]] += 1
+
                 loot_item_name = f"{loot_item['name']} {':star:' * loot_item['rarity']}"
                 item_names[loot_item_name] = item_names.get(loot_item_name, 0) + 1
 
-            self.cursor.execute("""
-                UPDATE fish_inventory SET quantity = quantity - 1 WHERE user_id = ? AND item_id = ?
-            """, (interaction.user.id, matched_item['id'],))
-                
-            self.conn.commit()
+            # fish_open_crate checks the stored quantity, a crate caught since the last flush has to be written first
+            await self.players.flush_item(interaction.user.id, matched_item['id'])
+            if not await self.db.fish_open_crate(interaction.user.id, matched_item['id'], loot_counts):
+                await interaction.response.send_message("You don't have that item in your inventory!", ephemeral=True)
+                return
+            self.players.invalidate_owned(interaction.user.id)
 
             loot_summary = "\n".join([f"`x{quantity}` **{name}**" for name, quantity in item_names.items()])
             
@@ -265,29 +212,23 @@ class Fishing(commands.Cog):
                 return
             item_id = matched_item['id']
 
-            self.cursor.execute("""
-                SELECT item_id, quantity FROM fish_inventory WHERE user_id = ? AND item_id = ?
-            """, (interaction.user.id, item_id,))
-            item_stack = self.cursor.fetchone()
+            quantity = await self.players.item_quantity(interaction.user.id, item_id)
 
-            if not item_stack:
+            if not quantity:
                 await interaction.response.send_message("No such items found in your inventory!", ephemeral=True)
                 return
             
             embed = discord.Embed(
                 title="Inventory",
                 description=f"""
-                `x{item_stack[1]:,}` **{matched_item['name']}** {':star:' * matched_item['rarity']}
+                `x{quantity:,}` **{matched_item['name']}** {':star:' * matched_item['rarity']}
                 *"{matched_item['lore']}"*
                 """
             )
             await interaction.response.send_message(embed=embed)
             return
 
-        self.cursor.execute("""
-            SELECT item_id, quantity FROM fish_inventory WHERE user_id = ?
-        """, (interaction.user.id,))
-        inventory_data = self.cursor.fetchall()
+        inventory_data = await self.players.inventory(interaction.user.id)
 
         if not inventory_data:
             await interaction.response.send_message("Your inventory is empty!", ephemeral=True)
@@ -295,7 +236,7 @@ class Fishing(commands.Cog):
 
         description = ""
         for item_id, quantity in inventory_data[:10]:
-            item_info = next((item for item in self.ITEM_REGISTRY if item['id'] == item_id), None)
+            item_info = self.ITEM_REGISTRY.get(item_id)
             if item_info:
                 description += f"`x{quantity}` **{item_info['name']}**\n"
 
@@ -332,18 +273,15 @@ class Fishing(commands.Cog):
             await interaction.response.send_message(embed=embed)
             return
 
-        user_data = self.cursor.execute("SELECT level FROM fish_user WHERE id = ?", (interaction.user.id,))
-        level = user_data.fetchone()[0]
+        player = await self.players.get(interaction.user.id)
+        level = player["level"]
 
         if level < biome_level_requirements[biome.value]:
             await interaction.response.send_message(f"You need to be level {biome_level_requirements[biome.value]} to access the {biome.name} biome!", ephemeral=True)
             return
 
 
-        self.cursor.execute(
-            "UPDATE infi_user SET current_biome = ? WHERE id = ?",
-            (biome.value, interaction.user.id))
-        self.conn.commit()
+        self.players.update(interaction.user.id, current_biome=biome.value)
 
         await interaction.response.send_message(f"Biome successfully changed to **{biome.name}**!")
 
@@ -356,38 +294,21 @@ class Fishing(commands.Cog):
             await interaction.response.send_message("No such item exists. Try again!", ephemeral=True)
             return
         
-        self.cursor.execute(
-            "SELECT quantity FROM fish_inventory WHERE user_id = ? AND item_id = ?",
-            (interaction.user.id, matched_item['id'],))
-        item_stack = self.cursor.fetchone()
-        if item_stack is None:
-            await interaction.response.send_message("You don't have that item in your inventory!", ephemeral=True)
-            return
-        
-        quantity = item_stack[0]
-
+        # inventory deltas are additive, the equip can run against the database while catches are still unflushed
+        quantity = await self.players.item_quantity(interaction.user.id, matched_item['id'])
         if quantity <= 0:
             await interaction.response.send_message("You don't have that item in your inventory!", ephemeral=True)
             return
         
         if matched_item['type'] == "accessory":
-            self.cursor.execute(
-                "SELECT * FROM fish_equipment WHERE user_id = ? AND item_id = ?",
-                (interaction.user.id, matched_item['id'],)
-            )
-            equipped_item = self.cursor.fetchone()
+            equipped_item = await self.db.fish_fetch_equipped(interaction.user.id, matched_item['id'])
 
             if equipped_item:
                 slot_name = equipped_item['slot'].replace(".", " ").capitalize()
                 await interaction.response.send_message(f"You already have that item equipped in the *{slot_name}* slot!", ephemeral=True)
                 return
 
-            self.cursor.execute(
-                "SELECT * FROM fish_equipment WHERE user_id = ? AND slot LIKE ?",
-                (interaction.user.id, "accessory.%")
-            )
-            
-            equipped_accessories = self.cursor.fetchall()
+            equipped_accessories = await self.db.fish_fetch_equipped_accessories(interaction.user.id)
             accessory_index = len(equipped_accessories) + 1
             accessory_limit = 6
 
@@ -395,16 +316,8 @@ class Fishing(commands.Cog):
                 await interaction.response.send_message(f"You can only equip {accessory_limit} accessories at a time!", ephemeral=True)
                 return
 
-            self.cursor.execute(
-                "INSERT INTO fish_equipment (user_id, slot, item_id) VALUES (?, ?, ?)",
-                (interaction.user.id, f"accessory.{accessory_index}", matched_item['id'],)
-            )
-            self.cursor.execute(
-                "UPDATE fish_inventory SET quantity = quantity - 1 WHERE user_id = ? AND item_id = ?",
-                (interaction.user.id, matched_item['id'],)
-            )
-            
-            self.conn.commit()
+            await self.db.fish_equip_item(interaction.user.id, f"accessory.{accessory_index}", matched_item['id'])
+            self.players.invalidate_owned(interaction.user.id)
 
             slot_name = f"Accessory {accessory_index}"
             await interaction.response.send_message(f"Equipped item *{matched_item['name']}* in the {slot_name} slot!")
@@ -425,17 +338,13 @@ class Fishing(commands.Cog):
             await interaction.response.send_message("No such item exists. Try again!", ephemeral=True)
             return
         
-        self.cursor.execute("""
-            SELECT item_id FROM fish_equipment WHERE user_id = ? AND item_id = ?
-        """, (interaction.user.id, matched_item['id'],))
+        await self.db.fish_fetch_equipped(interaction.user.id, matched_item['id'])
         
         await interaction.response.send_message(f"Unequipped item *{matched_item['name']}* from the *slot_name* slot and returned it to your inventory!")
 
 
     def get_item(self, item_name: str) -> dict:
-        item_name_internalized = item_name.lower().replace(" ", "_")
-        matched_item = next((item for item in self.ITEM_REGISTRY if item['internal_name'] == item_name_internalized), None)
-        return matched_item
+        return self.ITEM_REGISTRY.get_by_name(item_name)
 
 
     """
@@ -464,16 +373,10 @@ class Fishing(commands.Cog):
     
     @app_commands.command(name="profile", description="Check your fishing profile")
     async def profile(self, interaction: discord.Interaction):
-        self.cursor.execute("SELECT level, xp, max_xp, balance, current_biome FROM fish_user WHERE id = ?", (interaction.user.id,))
-        user_data = self.cursor.fetchone()
-
-        if user_data is None:
-            user_data = (1, 0, 100, 0, 'river')
-
-        level, xp, max_xp, balance, current_biome = user_data
+        player = await self.players.get(interaction.user.id)
+        level, xp, max_xp, balance, current_biome = player["level"], player["xp"], player["max_xp"], player["money"], player["current_biome"]
         
-        self.cursor.execute("SELECT * FROM infi_fish WHERE user_id = ?", (interaction.user.id,))
-        user_fish = self.cursor.fetchall()
+        fish_caught = await self.db.fish_count_caught_fish(interaction.user.id)
         
         embed = discord.Embed(
             title=f"{interaction.user.display_name}'s Fishing Profile",
@@ -481,7 +384,7 @@ class Fishing(commands.Cog):
                 **Level {level}**
                 {self.xp_bar(xp, max_xp)} {xp:,}/{max_xp:,}
                 Balance: `${balance:,}`
-                Fish caught: `{len(user_fish)}`
+                Fish caught: `{fish_caught}`
                 Biome: `{current_biome}`
             """
         )
@@ -497,8 +400,7 @@ class Fishing(commands.Cog):
     async def search_fish(self, interaction: discord.Interaction, query: str = "", sort: app_commands.Choice[str] = None, filter_rarity: int = None, page: int = None):
         try: # try parsing the query into an id
             query = int(query)
-            self.cursor.execute("SELECT id, user_id, name, lore, rarity, size, value, biome, sold FROM infi_fish WHERE id = ?", (int(query),))
-            fish_data = self.cursor.fetchone()
+            fish_data = await self.db.fish_fetch_caught_fish(query)
 
             if fish_data is None:
                 await interaction.response.send_message("No fish was found with the provided query.", ephemeral=True)
@@ -525,11 +427,7 @@ class Fishing(commands.Cog):
         except ValueError: # if query can't be parsed into an id
             start_time = datetime.now()
 
-            if filter_rarity:
-                self.cursor.execute("SELECT id, user_id, name, rarity FROM infi_fish WHERE name LIKE ? AND rarity = ?", (f"%{query}%", filter_rarity))
-            else:
-                self.cursor.execute("SELECT id, user_id, name, rarity FROM infi_fish WHERE name LIKE ?", (f"%{query}%",))
-            fish_data = self.cursor.fetchall()
+            fish_data = await self.db.fish_search_caught_fish(query, filter_rarity)
 
             end_time = datetime.now()
             query_time = int((end_time - start_time).microseconds / 1000)
@@ -558,8 +456,7 @@ class Fishing(commands.Cog):
 
     @app_commands.command(name="list_users", description="List all fishing users")
     async def list_users(self, interaction: discord.Interaction):
-        self.cursor.execute("SELECT * FROM infi_user")
-        user_data = self.cursor.fetchall()
+        user_data = await self.db.fish_fetch_all_users()
 
         description = ""
         for user in user_data:
@@ -617,10 +514,9 @@ class Fishing(commands.Cog):
     
 
     def load_item_registry(self):
-        with open("data/fishing/items.json", "r") as f:
-            item_registry = json.load(f)
-            self.logger.debug(f"Loaded item registry with {len(item_registry)} fishing items")
-            return item_registry
+        item_registry = ItemRegistry.load("data/fishing/items.json")
+        self.logger.debug(f"Loaded item registry with {len(item_registry)} fishing items")
+        return item_registry
         
     
     def load_loot_tables(self):
@@ -2,12 +2,14 @@ import discord
 from discord.ext import commands, tasks
 from discord import app_commands
 import random
+import asyncio
 import sqlite3
-import re
-from collections import defaultdict, Counter
 import logging
 from logging.handlers import TimedRotatingFileHandler
-import math
+
+from utils.generative.model import ModelCache, MIN_ORDER, MAX_ORDER
+from utils.generative.ingest import HistoryIngestor
+from utils.generative.config import GuildConfigCache
 
 
 class Generative(commands.Cog):
@@ -15,6 +17,60 @@ class Generative(commands.Cog):
         self.bot = bot
         self.logger = bot.logger
         self.db = bot.database
+        self.models = ModelCache(self.db)
+        self.ingestor = HistoryIngestor(self.db, self.models, self.logger)
+        self.guild_configs = GuildConfigCache(self.db)
+
+        # auto-cached messages waiting for the next batch write
+        self.message_buffer = []
+        self.buffer_limit = 500
+        # while writes keep failing, messages past this are dropped oldest first
+        self.buffer_max = 5000
+
+
+    async def cog_load(self):
+        self.resume_task = asyncio.create_task(self.resume_ingestion())
+        self.flush_messages.start()
+
+
+    async def cog_unload(self):
+        self.resume_task.cancel()
+        self.ingestor.stop()
+        self.flush_messages.cancel()
+        await self.flush_message_buffer()
+
+
+    @tasks.loop(seconds=15)
+    async def flush_messages(self):
+        await self.flush_message_buffer()
+
+
+    async def flush_message_buffer(self):
+        if not self.message_buffer:
+            return
+
+        # swap the buffer first, messages arriving during the write go into the next batch
+        messages, self.message_buffer = self.message_buffer, []
+        try:
+            inserted = await self.db.gen_cache_messages(messages)
+        except Exception as e:
+            # put the batch back in front of the newer messages, the next flush retries it
+            self.message_buffer[:0] = messages
+            dropped = len(self.message_buffer) - self.buffer_max
+            if dropped > 0:
+                del self.message_buffer[:dropped]
+            self.logger.error(f"Error while caching {len(messages)} messages, {max(dropped, 0)} dropped: {e}")
+            return
+
+        for channel_id, channel_messages in inserted.items():
+            for _, content in channel_messages:
+                self.models.add_message(channel_id, content)
+
+
+    async def resume_ingestion(self):
+        await self.bot.wait_until_ready()
+        await self.ingestor.resume(self.bot)
+
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -22,67 +78,41 @@ class Generative(commands.Cog):
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
-        if message.author == self.bot.user:
+        if message.author == self.bot.user or message.guild is None:
             return
-        
-        gen_config = self.db.gen_fetch_guild_config(message.guild.id)
-        enabled = gen_config["enabled"]
+
+        gen_config = self.guild_configs.cached(message.guild.id) or await self.guild_configs.get(message.guild.id)
+        if not gen_config["enabled"]:
+            return
+
         temperature = gen_config["temperature"]
         max_words = gen_config["max_words"]
         auto_cache = gen_config["auto_cache"]
         message_probability = gen_config["message_probability"]
+        ngram_order = gen_config["ngram_order"]
 
-        if not enabled:
-            return
-        
         if auto_cache:
-            self.db.gen_cache_message(message.id, message.channel.id, message.content)
+            self.message_buffer.append((message.id, message.channel.id, message.content))
+            if len(self.message_buffer) >= self.buffer_limit:
+                await self.flush_message_buffer()
 
         if self.bot.user in message.mentions or random.random() < message_probability:
-            generated_message = self.generate_message(message.channel.id, max_words, temperature)
+            generated_message = await self.generate_message(message.channel.id, max_words, temperature, ngram_order)
             if generated_message:
                 await message.channel.send(generated_message, allowed_mentions=discord.AllowedMentions.none())
                 self.logger.debug("Generated message sent")
 
 
-    def generate_message(self, channel_id, max_words, temperature):
-        messages = self.db.gen_fetch_cached_message_content(channel_id)
+    async def generate_message(self, channel_id, max_words, temperature, ngram_order):
+        model = await self.models.get(channel_id, ngram_order)
 
-        if messages is None or len(messages) < 3:
+        if len(model) < 3:
             self.logger.debug("Not enough messages to generate from")
             return None
 
-        trigram_counts = self.build_trigram_counts(messages)
-        trigram_probs = self.convert_to_probabilities(trigram_counts)
-
-        # Generate message using trigram probabilities
-        seed_pair = random.choice(list(trigram_probs.keys()))
-        
-        w1, w2 = seed_pair
-        output = [w1, w2]
-
-        for _ in range(max_words - 2):
-            pair = (w1, w2)
-            if pair not in trigram_probs and random.random() < 0.5:
-                w1, w2 = random.choice(list(trigram_probs.keys()))
-                output.extend([w1, w2])
-                continue
-            
-            if pair not in trigram_probs:
-                break
-
-            next_words = trigram_probs[pair]
-            
-            tempered = self.apply_temperature(next_words, temperature)
-
-            words = list(tempered.keys())
-            probs = list(tempered.values())
-
-            # Weighted random choice using trigram probabilities
-            w3 = random.choices(words, weights=probs, k=1)[0]
-
-            output.append(w3)
-            w1, w2 = w2, w3
+        output = model.generate(max_words, temperature)
+        if not output:
+            return None
 
         generated_message = " ".join(output)
 
@@ -93,34 +123,24 @@ class Generative(commands.Cog):
 
     @app_commands.command(name="cache_messages", description="Cache messages in this channel for message generation")
     async def cache_messages_command(self, interaction: discord.Interaction, forced: bool = False):
-        await interaction.response.send_message("Caching messages in this channel...", ephemeral=True)
-        await self.cache_channel(interaction.channel, forced)
-        await interaction.followup.send("Finished caching messages in this channel!", ephemeral=True)
-
-
-    async def cache_channel(self, channel: discord.TextChannel = None, forced: bool = False):
-        self.logger.debug(f"Starting message caching for channel: {channel.id}")
-
-        if forced:
-            self.logger.debug("Forced caching enabled, clearing existing cache for channel")
-            self.db.gen_clear_channel_cache(channel.id)
-
-        last_cached_message = self.db.gen_fetch_last_cached_message(channel.id)
+        if self.ingestor.is_running(interaction.channel.id):
+            await interaction.response.send_message("Messages in this channel are already being cached!", ephemeral=True)
+            return
 
-        self.logger.debug(f"Last cached message ID: {last_cached_message}")
+        await interaction.response.send_message("Caching messages in this channel...", ephemeral=True)
 
-        after = None
-        if last_cached_message:
-            after = discord.Object(id=last_cached_message)
+        async def report(count):
+            await interaction.edit_original_response(content=f"Caching messages in this channel... `{count:,}` messages cached so far")
 
-        self.logger.debug(f"Fetching messages after: {after}")
-        
-        async for message in channel.history(limit=None, oldest_first=True, after=after):
-            if message.author.bot:
-                continue
-            self.db.gen_cache_message(message.id, channel.id, message.content)
-        
-        self.logger.debug("Finished caching messages for channel")
+        try:
+            count = await self.ingestor.ingest(interaction.channel, forced, report)
+        except discord.Forbidden:
+            await interaction.followup.send("I can't read the message history of this channel!", ephemeral=True)
+            return
+        except Exception:
+            await interaction.followup.send("Caching messages failed, run the command again to continue where it stopped.", ephemeral=True)
+            return
+        await interaction.followup.send(f"Finished caching messages in this channel! `{count:,}` new messages cached", ephemeral=True)
 
 
     @app_commands.checks.has_permissions(manage_messages=True)
@@ -129,7 +149,8 @@ class Generative(commands.Cog):
         if channel is None:
             channel = interaction.channel
 
-        self.db.gen_clear_channel_cache(channel.id)
+        await self.db.gen_clear_channel_cache(channel.id)
+        self.models.invalidate(channel.id)
         await interaction.response.send_message(f"Deleted message cache for {channel.mention}", ephemeral=True)
 
 
@@ -139,7 +160,8 @@ class Generative(commands.Cog):
         app_commands.Choice(name="enabled", value="enabled"),
         app_commands.Choice(name="temperature", value="temperature"),
         app_commands.Choice(name="max_words", value="max_words"),
-        app_commands.Choice(name="auto_cache", value="auto_cache")
+        app_commands.Choice(name="auto_cache", value="auto_cache"),
+        app_commands.Choice(name="ngram_order", value="ngram_order")
     ])
     async def gen_config_command(self, interaction: discord.Interaction, option: str = None, value: str = None):
         if interaction.user.guild_permissions.manage_guild == False:
@@ -147,16 +169,17 @@ class Generative(commands.Cog):
             return
 
         if option == None or value == None:
-            config = self.db.gen_fetch_guild_config(interaction.guild.id)
+            config = await self.guild_configs.get(interaction.guild.id)
             enabled = config["enabled"]
             temperature = config["temperature"]
             max_words = config["max_words"]
             auto_cache = config["auto_cache"]
             message_probability = config["message_probability"]
+            ngram_order = config["ngram_order"]
 
             embed = discord.Embed(
                 title="Message Gen Config",
-                description=f"`enabled` - {self.bool_emoji(enabled)}\n`temperature` - `{temperature}`\n`max_words` - `{max_words}`\n`auto_cache` - {self.bool_emoji(auto_cache)}\n`message_probability` - `{message_probability}`",
+                description=f"`enabled` - {self.bool_emoji(enabled)}\n`temperature` - `{temperature}`\n`max_words` - `{max_words}`\n`auto_cache` - {self.bool_emoji(auto_cache)}\n`message_probability` - `{message_probability}`\n`ngram_order` - `{ngram_order}`",
             )
 
             await interaction.response.send_message(embed=embed, ephemeral=True)
@@ -176,63 +199,20 @@ class Generative(commands.Cog):
             except ValueError:
                 await interaction.response.send_message("Value must be an integer.", ephemeral=True)
                 return
+        elif option == "ngram_order":
+            if value not in [str(order) for order in range(MIN_ORDER, MAX_ORDER + 1)]:
+                await interaction.response.send_message(f"Value must be between {MIN_ORDER} and {MAX_ORDER}.", ephemeral=True)
+                return
+            value = int(value)
         else:
             await interaction.response.send_message("Invalid option.", ephemeral=True)
             return
         
-        self.db.gen_update_guild_config(interaction.guild.id, option, value)
+        await self.guild_configs.update(interaction.guild.id, option, value)
         
         await interaction.response.send_message(f"Set `{option}` to `{value}`", ephemeral=True)
 
 
-    def build_trigram_counts(self, messages):
-        trigram_counts = defaultdict(Counter)  # {(w1, w2): Counter({w3: n})}
-
-        for msg in messages:
-            words = msg.lower().split() # self.tokenize(msg)
-            for w1, w2, w3 in zip(words, words[1:], words[2:]):
-                trigram_counts[(w1, w2)][w3] += 1
-
-        return trigram_counts
-    
-    def convert_to_probabilities(self, trigram_counts):
-        trigram_probs = {}
-
-        for pair, next_words in trigram_counts.items():
-            total = sum(next_words.values())
-            trigram_probs[pair] = {w3: count / total for w3, count in next_words.items()}
-
-        return trigram_probs
-    
-
-    def tokenize(self, text):
-        URL_REGEX = r'https?://\S+|www\.\S+'
-        EMOJI_REGEX = r'<a?:\w+:\d+>'
-        WORD_REGEX = r"[a-zA-Z0-9]+(?:'[a-zA-Z0-9]+)*"
-
-        text = re.sub(URL_REGEX, '', text)
-        
-        text = re.sub(EMOJI_REGEX, '', text)
-        
-        return re.findall(WORD_REGEX, text.lower())
-    
-    
-    def apply_temperature(self, probs, temperature):
-        if temperature <= 0:
-            # deterministic (argmax)
-            max_word = max(probs, key=probs.get)
-            return {max_word: 1.0}
-
-        # Adjust probabilities
-        adjusted = {
-            w: math.pow(p, 1.0 / temperature)
-            for w, p in probs.items()
-        }
-
-        # Normalize
-        total = sum(adjusted.values())
-        return {w: p / total for w, p in adjusted.items()}
-    
     def bool_emoji(self, value: bool) -> str:
         return "✅" if value else "❌"
 
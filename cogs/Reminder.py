@@ -1,5 +1,5 @@
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord import app_commands
 import re
 import time
@@ -7,13 +7,26 @@ from datetime import datetime, timezone
 import sqlite3
 import logging
 
+from utils.scheduler.scheduler import ReminderScheduler
+from utils.scheduler.delivery import DeliveryPipeline
+from utils.scheduler.recurrence import next_occurrence, recurrence_from_timestamp
+
 class Reminder(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.db = bot.database
         self.logger = bot.logger
         self.languages = bot.languages
-        self.check_reminders.start()
+        self.scheduler = ReminderScheduler(self.fire_reminders, self.logger)
+        self.delivery = DeliveryPipeline(self.deliver_reminder, self.dead_letter_reminder, logger=self.logger)
+
+    async def cog_load(self):
+        reminders = await self.db.fetch_pending_reminders()
+        for reminder in reminders:
+            self.schedule_reminder(dict(reminder))
+        self.scheduler.start()
+        self.delivery.start()
+        self.logger.debug(f"Scheduled {len(reminders)} pending reminders")
 
     def _parse_time(input_time: str) -> str:
         try:
@@ -44,8 +57,11 @@ class Reminder(commands.Cog):
         self.logger.info(f"{__name__} is online!")
 
     def cog_unload(self):
-        self.check_reminders.cancel()
-        self.conn.close()
+        self.scheduler.stop()
+        self.delivery.stop()
+
+    def schedule_reminder(self, reminder: dict):
+        self.scheduler.schedule(reminder["next_fire_at"], reminder["id"], reminder)
 
 
     @app_commands.command(name="reminder", description="Set a reminder")
@@ -55,7 +71,8 @@ class Reminder(commands.Cog):
         label: str, 
         time_input: str,
         user: discord.User = None, 
-        send_dm: bool = False
+        send_dm: bool = False,
+        repeat: str = None
     ):
         lang = interaction.locale
         remind_at = Reminder._parse_time(time_input)
@@ -66,10 +83,33 @@ class Reminder(commands.Cog):
             )
             return
 
+        recurrence = None
+        if repeat:
+            try:
+                recurrence = recurrence_from_timestamp(repeat.lower(), remind_at)
+                if repeat.lower() not in ("daily", "weekly"):
+                    # custom cron rules start firing from the requested time, never before it
+                    remind_at = next_occurrence(recurrence, remind_at - 1)
+            except ValueError:
+                await interaction.response.send_message(
+                    self.languages.getText("reminder_command.error.invalid_recurrence"),
+                    ephemeral=True
+                )
+                return
+
         user = user or interaction.user
         channel_id = interaction.channel.id if not send_dm else None
 
-        self.db.insert_reminder(user.id, channel_id, label, remind_at, None, send_dm)
+        reminder_id = await self.db.insert_reminder(user.id, channel_id, label, remind_at, recurrence, send_dm)
+        self.schedule_reminder({
+            "id": reminder_id,
+            "user_id": user.id,
+            "channel_id": channel_id,
+            "label": label,
+            "next_fire_at": remind_at,
+            "recurrence": recurrence,
+            "send_dm": send_dm
+        })
 
         human_time = datetime.fromtimestamp(remind_at, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
 
@@ -95,7 +135,7 @@ class Reminder(commands.Cog):
     @app_commands.command(name="reminders", description="View all your active reminders")
     async def reminders_command(self, interaction: discord.Interaction):
 
-        reminders = self.db.fetch_all_user_reminders(interaction.user.id)
+        reminders = await self.db.fetch_all_user_reminders(interaction.user.id)
 
         if not reminders:
             await interaction.response.send_message(self.languages.getText("reminders_command.error.no_reminders"), ephemeral=True)
@@ -106,11 +146,11 @@ class Reminder(commands.Cog):
             color=discord.Color.blue()
         )
 
-        for index, (label, daily_time, send_dm) in enumerate(reminders, start=1):
+        for index, (label, next_fire_at, recurrence, send_dm) in enumerate(reminders, start=1):
             delivery_method = self.languages.getText("reminder.delivery_method.dm") if send_dm else self.languages.getText("reminder.delivery_method.channel")
             embed.add_field(
                 name=self.languages.getText("reminders_command.reminder_index", index),
-                value=self.languages.getText("reminders_command.reminder_details", label, daily_time, delivery_method),
+                value=self.languages.getText("reminders_command.reminder_details", label, next_fire_at, recurrence or self.languages.getText("reminder.recurrence.none"), delivery_method),
                 inline=False
             )
 
@@ -122,27 +162,52 @@ class Reminder(commands.Cog):
         self.logger.error(error)
 
 
-    @tasks.loop(seconds=1)
-    async def check_reminders(self):
-        """Checks for due reminders and sends messages."""
+    async def fire_reminders(self, reminders: list):
+        """Called by the scheduler with every reminder that just came due."""
 
-        reminders = self.db.select_reminder_due(
-            int(time.time()),
-            datetime.now(timezone.utc).strftime("%H:%M")
-        )
+        # reminders that came due while offline fire on startup, wait until the user/channel cache is filled
+        await self.bot.wait_until_ready()
+
+        now = time.time()
+        advanced = []
+        deleted = []
+        rescheduled = []
+
+        for reminder in reminders:
+            if reminder["recurrence"]:
+                # recurring reminders are advanced in place instead of being deleted and re-inserted
+                next_fire_at = next_occurrence(reminder["recurrence"], max(now, reminder["next_fire_at"]))
+                advanced.append((next_fire_at, reminder["id"]))
+                rescheduled.append({**reminder, "next_fire_at": next_fire_at})
+            else:
+                deleted.append(reminder["id"])
+
+        await self.db.update_fired_reminders(advanced, deleted)
+
+        for reminder in rescheduled:
+            self.schedule_reminder(reminder)
 
         for reminder in reminders:
-            user = self.bot.get_user(reminder["user_id"])
-
-            if reminder["send_dm"] and user:
-                try:
-                    await user.send(self.languages.getText("check_reminders.dm_reminder", reminder["label"]))
-                except discord.Forbidden:
-                    self.logger.error(f"Could not DM {reminder["user_id"]}, they might have DMs disabled.")
-            elif reminder["channel_id"]:
-                channel = self.bot.get_channel(reminder["channel_id"])
-                if channel:
-                    await channel.send(self.languages.getText("check_reminders.channel_reminder", reminder["user_id"], reminder["label"]))
+            route = ("dm", reminder["user_id"]) if reminder["send_dm"] else ("channel", reminder["channel_id"])
+            self.delivery.submit(route, reminder, reminder["next_fire_at"])
+
+
+    async def deliver_reminder(self, reminder: dict):
+        if reminder["send_dm"]:
+            user = self.bot.get_user(reminder["user_id"]) or await self.bot.fetch_user(reminder["user_id"])
+            await user.send(self.languages.getText("check_reminders.dm_reminder", reminder["label"]))
+            return
+
+        channel = self.bot.get_channel(reminder["channel_id"])
+        if channel is None:
+            raise LookupError(f"Channel {reminder['channel_id']} not found")
+
+        await channel.send(self.languages.getText("check_reminders.channel_reminder", reminder["user_id"], reminder["label"]))
+
+
+    async def dead_letter_reminder(self, reminder: dict, scheduled_at: float, attempts: int, error: str):
+        self.logger.error(f"Could not deliver reminder {reminder['id']} after {attempts} attempts: {error}")
+        await self.db.insert_reminder_dead_letter(reminder, scheduled_at, attempts, error)
 
 
 async def setup(bot):
@@ -4,37 +4,19 @@ from discord import app_commands
 from discord.app_commands import Choice
 import random
 import os
-import re
 import aiohttp
-import numpy as np
 from PIL import Image
 from io import BytesIO
-from petpetgif import petpet
-import sqlite3
 import deepl
 import zipfile
 import json
+from functools import partial
 
-kaomoji = [">.<", ":3", "^-^", "^.^", ">w<", "^.~", "~.^", ">.<", "^o^", "^_^", ">.>", "^3^"]
-meows = ["meow", "nya", "mrow", "mrrp", "mreow", "mew", "miau"]
+from utils.images.workers import ImageWorkers, ImageJobError
+from utils.translation.engine import TRANSLATORS
+from utils.translation.relay import WebhookRelay
 
-uwu_pattern = [
-    (r'[rl]', 'w'),
-    (r'[RL]', 'W'),
-    (r'n([aeiou])', 'ny\\g<1>'),
-    (r'N([aeiou])', 'Ny\\g<1>'),
-    (r'N([AEIOU])', 'NY\\g<1>'),
-    (r'ove', 'uv'),
-]
-lolcat_pattern = {
-    'er': 'r',
-    'you': 'u',
-    'have': 'haz',
-    'can i': 'i can',
-    's': 'z',
-    'th': 'd',
-    'y': 'eh'
-}
+meows = ["meow", "nya", "mrow", "mrrp", "mreow", "mew", "miau"]
 
 eight_ball_responses = [
     "It is certain.", "It is decidedly so.", "Without a doubt.",
@@ -48,62 +30,16 @@ eight_ball_responses = [
     "Outlook not so good.", "Very doubtful."
 ]
 
-stutter_chance = 0.5
-kaomoji_chance = 0.5
-
-
-def translate_uwu(string: str):
-    words = string.split(' ')
-
-    for idx, word in enumerate(words):
-        if not word:
-            continue
-        
-        # link
-        if re.search(r'((http:|https:)//[^ \<]*[^ \<\.])', word):
-            words[idx] = word
-            continue
-        
-        # discord mention, emoji
-        if word[0] == '@' or word[0] == '#' or word[0] == ':' or word[0] == '<':
-            words[idx] = word
-            continue
-
-        if word in kaomoji:
-            words[idx] = word
-            continue
-
-        for pattern, substitution in uwu_pattern:
-            word = re.sub(pattern, substitution, word)
-        
-        next_char_case = word[1].isupper() if len(word) > 1 else False
-        _word = ''
-        
-        if random.random() <= stutter_chance:
-            stutter_len = random.randrange(1, 3)
-            
-            for j in range(stutter_len + 1):
-                _word += (word[0] if j == 0 else (word[0].upper() if next_char_case else word[0].lower())) + "-"
-                
-            _word += (word[0].upper() if next_char_case else word[0].lower()) + word[1:]
-        
-        if random.random() <= kaomoji_chance:
-            _word = (_word or word) + ' ' + kaomoji[random.randrange(0, len(kaomoji))]
-
-        words[idx] = (_word or word)
-
-    return ' '.join(words)
-
-
-def translate_lolcat(string: str):
-    pass
-    
 
 class Utils(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.logger = bot.logger
-        self.uwuified = []
+        self.db = bot.database
+        self.images = bot.image_cache
+        self.image_workers = ImageWorkers()
+        self.autotranslate = {}  # user id -> translation mode
+        self.relay = WebhookRelay(self.logger)
         self.DEEPL_API_KEY = os.getenv("DEEPL_API_KEY")
         self.deepl_client = deepl.DeepLClient(self.DEEPL_API_KEY)
 
@@ -115,8 +51,14 @@ class Utils(commands.Cog):
         }
         self.bot.tree.add_command(self.ctx_menus["translate"])
 
-        self.conn = sqlite3.connect('data.db')
-        self.cursor = self.conn.cursor()
+
+    async def cog_load(self):
+        self.autotranslate = await self.db.autotranslate_fetch_all()
+
+
+    async def cog_unload(self):
+        self.image_workers.close()
+
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -126,40 +68,14 @@ class Utils(commands.Cog):
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         try:
-            channel = message.channel
-
             if message.author.bot:
                 return
 
-            if message.author.id in self.uwuified:
-                webhooks = await channel.webhooks()
-                webhook = next((wh for wh in webhooks if wh.name == "mechabot"), None)
-
-                if webhook is None:
-                    webhook = await channel.create_webhook(name="mechabot")
-
-                uwuified_message = translate_uwu(message.content)
-                self.logger.debug(f"Message uwuified: {uwuified_message}")
-
-                await message.delete()
-
-                reference_message = None
-                if message.reference and message.mentions:
-                    try:
-                        reference_message = await channel.fetch_message(message.reference.message_id)
-                    except:
-                        pass
-                
-                reply_substring = f"-# [↪]({reference_message.jump_url}) {message.mentions[0].mention} {reference_message.content}\n" if message.reference and message.mentions else ""
-
-                webhook_allowed_mentions = discord.AllowedMentions(users=False, roles=False, everyone=False)
-
-                await webhook.send(
-                    content=reply_substring + uwuified_message,
-                    username=message.author.display_name,
-                    avatar_url=message.author.display_avatar.url,
-                    allowed_mentions=webhook_allowed_mentions
-                )
+            mode = self.autotranslate.get(message.author.id)
+            if mode is not None and message.content:
+                translated_message = TRANSLATORS[mode](message.content)
+                self.logger.debug(f"Message translated to {mode}: {translated_message}")
+                await self.relay.relay(message, translated_message)
 
             stripped_content = message.content.lower().strip("")
 
@@ -183,6 +99,11 @@ class Utils(commands.Cog):
             self.logger.error(e)
 
 
+    @commands.Cog.listener()
+    async def on_webhooks_update(self, channel: discord.abc.GuildChannel):
+        self.relay.invalidate(channel.id)
+
+
     @app_commands.command(name="ping", description="Gets the API latency")
     async def ping(self, interaction: discord.Interaction):
         await interaction.response.send_message(f"Pong! :ping_pong: {round(interaction.client.latency * 1000)}ms")
@@ -224,9 +145,24 @@ class Utils(commands.Cog):
     ])
     @app_commands.command(name="autotranslate", description="Enable realtime autotranslation of your messages")
     async def autotranslate_command(self, interaction: discord.Interaction, translation: Choice[str]):
-        match translation.value:
-            case "uwuspeak":
-                pass
+        if translation.value == "disable":
+            self.autotranslate.pop(interaction.user.id, None)
+            await self.db.autotranslate_delete(interaction.user.id)
+            await interaction.response.send_message("Turned autotranslation off", ephemeral=True)
+            return
+
+        if interaction.guild is None:
+            # webhooks only exist in server channels
+            await interaction.response.send_message("This command can only be used in a server.", ephemeral=True)
+            return
+
+        if not interaction.channel.permissions_for(interaction.guild.me).manage_messages or not interaction.channel.permissions_for(interaction.guild.me).manage_webhooks:
+            await interaction.response.send_message("I need the **Manage Messages** and **Manage Webhooks** permissions to use this feature.", ephemeral=True)
+            return
+
+        self.autotranslate[interaction.user.id] = translation.value
+        await self.db.autotranslate_set_mode(interaction.user.id, translation.value)
+        await interaction.response.send_message(f"Turned on autotranslation to **{translation.name}**", ephemeral=True)
 
 
     async def translate_context_menu(self, interaction: discord.Interaction, message: discord.Message):
@@ -237,16 +173,22 @@ class Utils(commands.Cog):
     # @app_commands.checks.bot_has_permissions(manage_messages=True, manage_webhooks=True)
     # @app_commands.command(name="uwu", description="Toggle message uwuifier")
     async def uwu(self, interaction: discord.Interaction):
+        if interaction.guild is None:
+            await interaction.response.send_message("This command can only be used in a server.", ephemeral=True)
+            return
+
         # checks if bot has permission to manage messages and manage webhooks in the channel
         if not interaction.channel.permissions_for(interaction.guild.me).manage_messages or not interaction.channel.permissions_for(interaction.guild.me).manage_webhooks:
             await interaction.response.send_message("I need the **Manage Messages** and **Manage Webhooks** permissions to use this feature.", ephemeral=True)
             return
         
-        if interaction.user.id not in self.uwuified:
-            self.uwuified.append(interaction.user.id)
+        if self.autotranslate.get(interaction.user.id) != "uwuspeak":
+            self.autotranslate[interaction.user.id] = "uwuspeak"
+            await self.db.autotranslate_set_mode(interaction.user.id, "uwuspeak")
             await interaction.response.send_message("Turned uwuify on")
         else:
-            self.uwuified.remove(interaction.user.id)
+            del self.autotranslate[interaction.user.id]
+            await self.db.autotranslate_delete(interaction.user.id)
             await interaction.response.send_message("Turned uwuifier off")
     
     # @uwu.error
@@ -297,20 +239,17 @@ class Utils(commands.Cog):
 
 
     async def get_average_color(self, url: str):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status != 200:
-                    return
-
-                img_data = await response.read()
-                image = Image.open(BytesIO(img_data))
-                image = image.convert("RGB")
-
-                img_array = np.array(image)
-                avg_color = tuple(map(int, np.mean(img_array, axis=(0, 1))))
-                avg_color_hex = "#{:02x}{:02x}{:02x}".format(*avg_color)
+        try:
+            image = await self.images.get(url)
+        except aiohttp.ClientError as e:
+            self.logger.debug(f"Could not download image {url}: {e}")
+            return
 
-                return avg_color, avg_color_hex
+        try:
+            return await self.images.derive(image, "average_color", partial(self.image_workers.run, "average_color"))
+        except ImageJobError as e:
+            self.logger.debug(f"Could not process image {url}: {e}")
+            return
             
 
     @app_commands.command(name="say", description="Send a message via the bot")
@@ -352,18 +291,19 @@ class Utils(commands.Cog):
     @app_commands.command(name="pet", description="Pet someone")
     async def pet_command(self, interaction: discord.Interaction, user: discord.User):
         # retrieve user avater bytes
-        async with aiohttp.ClientSession() as session:
-            async with session.get(user.display_avatar.url) as response:
-                if response.status != 200:
-                    await interaction.response.send_message("Failed to retrieve user avatar.", ephemeral=True)
-                    return
-                avatar_bytes = await response.read()
-
-        source = BytesIO(avatar_bytes)
-        dest = BytesIO()
-        petpet.make(source, dest)
-        dest.seek(0)
-        await interaction.response.send_message(file=discord.File(dest, filename=f"pet_{interaction.id}.gif"))
+        try:
+            avatar = await self.images.get(user.display_avatar.url)
+        except aiohttp.ClientError:
+            await interaction.response.send_message("Failed to retrieve user avatar.", ephemeral=True)
+            return
+
+        try:
+            gif = await self.images.derive(avatar, "petpet", partial(self.image_workers.run, "petpet"))
+        except ImageJobError:
+            await interaction.response.send_message("Failed to process user avatar.", ephemeral=True)
+            return
+
+        await interaction.response.send_message(file=discord.File(BytesIO(gif), filename=f"pet_{interaction.id}.gif"))
 
     
     @app_commands.command(name="8ball", description="Ask the magic 8 ball a question")
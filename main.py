@@ -9,6 +9,8 @@ from logging.handlers import TimedRotatingFileHandler
 
 from utils.database.database import DBManager
 from utils.languages.languages import Languages
+from utils.http.client import HTTPClient
+from utils.http.cache import ImageCache
 
 load_dotenv()
 
@@ -18,29 +20,34 @@ bot = commands.Bot(command_prefix="m.",
                    activity=discord.Game(name=os.getenv("BOT_STATUS"))
                    )
 
-os.makedirs("logs", exist_ok=True)
-
 logger = logging.getLogger("mechabot")
-logger.setLevel(logging.DEBUG)
-
-if not logger.handlers:
-    handler = TimedRotatingFileHandler(
-        filename='logs/bot.log',
-        encoding='utf-8',
-        when='midnight',
-        interval=1,
-        backupCount=7
-    )
-    handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)s/%(name)s]: %(message)s'))
-    logger.addHandler(handler)
-
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)s/%(name)s]: %(message)s'))
-    logger.addHandler(console_handler)
-
-bot.database = DBManager()
-bot.logger = logger
-bot.languages = Languages()
+
+
+def setup():
+    # not at import time: spawned worker processes import this module again and must not open the database
+    os.makedirs("logs", exist_ok=True)
+    logger.setLevel(logging.DEBUG)
+
+    if not logger.handlers:
+        handler = TimedRotatingFileHandler(
+            filename='logs/bot.log',
+            encoding='utf-8',
+            when='midnight',
+            interval=1,
+            backupCount=7
+        )
+        handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)s/%(name)s]: %(message)s'))
+        logger.addHandler(handler)
+
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)s/%(name)s]: %(message)s'))
+        logger.addHandler(console_handler)
+
+    bot.database = DBManager()
+    bot.logger = logger
+    bot.languages = Languages()
+    bot.http_client = HTTPClient(logger)
+    bot.image_cache = ImageCache(bot.database, bot.http_client, logger)
 
 @bot.event
 async def on_ready():
@@ -80,7 +87,14 @@ async def load():
 async def main():
     async with bot:
         await load()
-        await bot.start(os.getenv('TOKEN'))
+        try:
+            await bot.start(os.getenv('TOKEN'))
+        finally:
+            # unloads the cogs first, their cog_unload flushes still need the database
+            await bot.close()
+            await bot.http_client.close()
+            bot.database.close()
 
 if __name__ == "__main__":
+    setup()
     asyncio.run(main())
\ No newline at end of file
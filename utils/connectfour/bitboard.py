@@ -0,0 +1,188 @@
+import argparse
+import json
+import random
+import time
+
+WIDTH = 7
+HEIGHT = 6
+# every column has one spare bit on top so shifts never carry a line into the next column
+COLUMN_BITS = HEIGHT + 1
+
+COLUMN_MASK = (1 << HEIGHT) - 1
+BOTTOM_MASK = sum(1 << (col * COLUMN_BITS) for col in range(WIDTH))
+BOARD_MASK = BOTTOM_MASK * COLUMN_MASK
+
+# vertical, horizontal, and the two diagonals
+DIRECTIONS = (1, COLUMN_BITS, COLUMN_BITS - 1, COLUMN_BITS + 1)
+
+
+def is_win(board: int) -> bool:
+    """True if the stones in `board` contain four in a row."""
+    for shift in DIRECTIONS:
+        pairs = board & (board >> shift)
+        if pairs & (pairs >> (2 * shift)):
+            return True
+    return False
+
+
+class Bitboard:
+    """
+    Connect Four position as one integer bitboard per player plus column heights.
+
+    Bit `col * 7 + row` is the cell in column `col`, `row` counted from the
+    bottom. A whole position fits in two small integers, which is what gets
+    stored in the database; heights are rebuilt from them.
+    """
+
+    __slots__ = ("boards", "heights")
+
+    def __init__(self, player1: int = 0, player2: int = 0):
+        self.boards = [player1, player2]
+        mask = player1 | player2
+        # bit index of the next free cell of every column
+        self.heights = [
+            col * COLUMN_BITS + ((mask >> (col * COLUMN_BITS)) & COLUMN_MASK).bit_count()
+            for col in range(WIDTH)
+        ]
+
+
+    @classmethod
+    def from_grid(cls, grid):
+        """Builds a bitboard from the old 6x7 list grid (top row first, 0 empty, 1/2 players)."""
+        boards = [0, 0]
+        for row_index, cells in enumerate(grid):
+            row = HEIGHT - 1 - row_index
+            for col, cell in enumerate(cells):
+                if cell:
+                    boards[cell - 1] |= 1 << (col * COLUMN_BITS + row)
+        return cls(*boards)
+
+
+    @property
+    def mask(self) -> int:
+        return self.boards[0] | self.boards[1]
+
+
+    @property
+    def moves(self) -> int:
+        return self.mask.bit_count()
+
+
+    def can_play(self, col: int) -> bool:
+        return 0 <= col < WIDTH and self.heights[col] < col * COLUMN_BITS + HEIGHT
+
+
+    def play(self, col: int, player: int) -> bool:
+        """Drops a stone for player 1 or 2 into a column. Returns False if the column is full."""
+        if not self.can_play(col):
+            return False
+        self.boards[player - 1] |= 1 << self.heights[col]
+        self.heights[col] += 1
+        return True
+
+
+    def winner(self) -> int:
+        for player, board in enumerate(self.boards, start=1):
+            if is_win(board):
+                return player
+        return 0
+
+
+    def is_full(self) -> bool:
+        return self.mask == BOARD_MASK
+
+
+    def cell(self, row: int, col: int) -> int:
+        """Owner of a cell, with row 0 at the top like the rendered board."""
+        bit = 1 << (col * COLUMN_BITS + HEIGHT - 1 - row)
+        if self.boards[0] & bit:
+            return 1
+        if self.boards[1] & bit:
+            return 2
+        return 0
+
+
+    def rows(self):
+        """Yields the board top row first, as lists of 0/1/2."""
+        for row in range(HEIGHT):
+            yield [self.cell(row, col) for col in range(WIDTH)]
+
+
+def _grid_win_check(grid) -> int:
+    # the full-grid scan the cog ran after every move before bitboards
+    for row in grid:
+        for col in range(4):
+            if row[col] == row[col + 1] == row[col + 2] == row[col + 3] != 0:
+                return row[col]
+    for col in range(WIDTH):
+        for row in range(3):
+            if grid[row][col] == grid[row + 1][col] == grid[row + 2][col] == grid[row + 3][col] != 0:
+                return grid[row][col]
+    for row in range(3):
+        for col in range(4):
+            if grid[row][col] == grid[row + 1][col + 1] == grid[row + 2][col + 2] == grid[row + 3][col + 3] != 0:
+                return grid[row][col]
+            if grid[row + 3][col] == grid[row + 2][col + 1] == grid[row + 1][col + 2] == grid[row][col + 3] != 0:
+                return grid[row + 3][col]
+    return 0
+
+
+def _sqlite_integer_size(value: int) -> int:
+    # record payload of an INTEGER column, 0 and 1 are stored in the header alone
+    if value in (0, 1):
+        return 0
+    for size in (1, 2, 3, 4, 6):
+        if -(1 << (8 * size - 1)) <= value < (1 << (8 * size - 1)):
+            return size
+    return 8
+
+
+def _random_games(count, seed=0):
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        board = Bitboard()
+        moves = []
+        player = 1
+        while not board.winner() and not board.is_full():
+            col = rng.choice([col for col in range(WIDTH) if board.can_play(col)])
+            board.play(col, player)
+            moves.append(col)
+            player = 3 - player
+        games.append(moves)
+    return games
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Moves per second and stored bytes of the json grid against bitboards")
+    parser.add_argument("--games", type=int, default=20_000)
+    args = parser.parse_args()
+
+    games = _random_games(args.games)
+    moves = sum(len(game) for game in games)
+    grid_bytes = board_bytes = 0
+
+    started = time.perf_counter()
+    for game in games:
+        grid = [[0] * WIDTH for _ in range(HEIGHT)]
+        for i, col in enumerate(game):
+            for row in reversed(grid):
+                if row[col] == 0:
+                    row[col] = i % 2 + 1
+                    break
+            _grid_win_check(grid)
+            grid_bytes += len(json.dumps(grid))
+    grid_rate = moves / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for game in games:
+        board = Bitboard()
+        for i, col in enumerate(game):
+            board.play(col, i % 2 + 1)
+            board.winner()
+            board_bytes += _sqlite_integer_size(board.boards[0]) + _sqlite_integer_size(board.boards[1])
+    board_rate = moves / (time.perf_counter() - started)
+
+    print(f"{args.games:,} random games, {moves:,} moves (move, win check, stored form)")
+    print(f"json grid  {grid_rate:>12,.0f} moves/s   {grid_bytes / moves:6.1f} bytes stored per position")
+    print(f"bitboard   {board_rate:>12,.0f} moves/s   {board_bytes / moves:6.1f} bytes stored per position")
@@ -0,0 +1,123 @@
+import asyncio
+from dataclasses import dataclass, field
+
+from utils.connectfour.bitboard import Bitboard
+
+
+@dataclass
+class Game:
+    game_id: int
+    player1_id: int
+    player2_id: int
+    turn: int
+    selected_column: int
+    board: Bitboard
+    message_id: int
+    channel_id: int
+    difficulty: str = None
+    # held for the whole read-modify-write of a button press, so double clicks can't race
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False, compare=False)
+
+
+    @property
+    def current_player_id(self) -> int:
+        return self.player1_id if self.turn == 1 else self.player2_id
+
+
+class GameRegistry:
+    """
+    Active Connect Four games in memory, keyed by board message id.
+
+    Button presses only touch this registry. The database is written behind
+    it for restart recovery: saves are handed to the database writer in
+    order without being awaited, and load() rebuilds the registry at startup.
+    """
+
+    def __init__(self, db, logger=None):
+        self.db = db
+        self.logger = logger
+
+        self._games = {}  # message_id -> Game
+        self._by_player = {}  # player_id -> set of message ids
+        self._pending = set()
+
+
+    def __len__(self):
+        return len(self._games)
+
+
+    def __iter__(self):
+        return iter(list(self._games.values()))
+
+
+    async def load(self) -> list:
+        for row in await self.db.connectfour_fetch_all_games():
+            self._add(Game(
+                row["game_id"], row["player1_id"], row["player2_id"], row["turn"], row["selected_column"],
+                Bitboard(row["player1_bits"], row["player2_bits"]), row["message_id"], row["channel_id"], row["difficulty"]
+            ))
+        return list(self._games.values())
+
+
+    def get(self, message_id: int) -> Game:
+        return self._games.get(message_id)
+
+
+    async def create(self, player1_id, player2_id, turn, board, message, difficulty=None) -> Game:
+        game_id = await self.db.connectfour_create_game(player1_id, player2_id, turn, board, message, difficulty)
+        game = Game(game_id, player1_id, player2_id, turn, 1, board, message.id, message.channel.id, difficulty)
+        self._add(game)
+        return game
+
+
+    def save(self, game: Game):
+        self._persist(self.db.connectfour_save_game(game.game_id, game.turn, game.selected_column, *game.board.boards))
+
+
+    def finish(self, game: Game):
+        self._remove(game)
+        self._persist(self.db.connectfour_delete_games([game.game_id]))
+
+
+    def end_player_games(self, *player_ids) -> int:
+        """Drops every active game of the given players. Returns how many were dropped."""
+        games = {message_id: self._games[message_id] for player_id in player_ids for message_id in self._by_player.get(player_id, ())}
+        for game in games.values():
+            self._remove(game)
+        if games:
+            self._persist(self.db.connectfour_delete_games([game.game_id for game in games.values()]))
+        return len(games)
+
+
+    def _add(self, game: Game):
+        self._games[game.message_id] = game
+        for player_id in (game.player1_id, game.player2_id):
+            self._by_player.setdefault(player_id, set()).add(game.message_id)
+
+
+    def _remove(self, game: Game):
+        self._games.pop(game.message_id, None)
+        for player_id in (game.player1_id, game.player2_id):
+            message_ids = self._by_player.get(player_id)
+            if message_ids is not None:
+                message_ids.discard(game.message_id)
+                if not message_ids:
+                    del self._by_player[player_id]
+
+
+    def _persist(self, coro):
+        # tasks start in creation order, so the single writer thread applies saves in order too
+        task = asyncio.create_task(coro)
+        self._pending.add(task)
+        task.add_done_callback(self._persisted)
+
+
+    def _persisted(self, task):
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception() and self.logger:
+            self.logger.error(f"Could not save Connect Four game: {task.exception()}")
+
+
+    async def close(self):
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
@@ -0,0 +1,183 @@
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+# Glicko-2 works on its own scale, ratings are converted with this factor
+SCALE = 173.7178
+
+DEFAULT_RATING = 1500.0
+DEFAULT_RD = 350.0
+DEFAULT_VOLATILITY = 0.06
+
+TAU = 0.5
+EPSILON = 1e-6
+RATING_PERIOD = 24 * 60 * 60
+
+
+def _g(phi):
+    return 1 / np.sqrt(1 + 3 * phi ** 2 / np.pi ** 2)
+
+
+def decay(rds, volatilities, periods=1):
+    """RD after `periods` rating periods without games, capped at the starting RD."""
+    phi = np.asarray(rds, dtype=np.float64) / SCALE
+    return np.minimum(np.sqrt(phi ** 2 + periods * np.asarray(volatilities) ** 2) * SCALE, DEFAULT_RD)
+
+
+def _volatility(sigma, phi, v, delta, tau):
+    """New volatility of every player at once (Illinois algorithm from the Glicko-2 paper)."""
+    a = np.log(sigma ** 2)
+
+    def f(x):
+        ex = np.exp(x)
+        return ex * (delta ** 2 - phi ** 2 - v - ex) / (2 * (phi ** 2 + v + ex) ** 2) - (x - a) / tau ** 2
+
+    big_delta = delta ** 2 > phi ** 2 + v
+    upper = np.where(big_delta, np.log(np.where(big_delta, delta ** 2 - phi ** 2 - v, 1.0)), a - tau)
+    # walk the lower guesses down until f changes sign
+    k = np.ones_like(a)
+    pending = ~big_delta & (f(a - k * tau) < 0)
+    while pending.any():
+        k[pending] += 1
+        pending &= f(a - k * tau) < 0
+    upper = np.where(big_delta, upper, a - k * tau)
+
+    lower = a
+    f_lower, f_upper = f(lower), f(upper)
+    active = np.abs(upper - lower) > EPSILON
+    for _ in range(100):
+        if not active.any():
+            break
+        c = lower + (lower - upper) * f_lower / (f_upper - f_lower)
+        f_c = f(c)
+
+        swap = active & (f_c * f_upper <= 0)
+        halve = active & ~swap
+        lower = np.where(swap, upper, lower)
+        f_lower = np.where(swap, f_upper, np.where(halve, f_lower / 2, f_lower))
+        upper = np.where(active, c, upper)
+        f_upper = np.where(active, f_c, f_upper)
+        active &= np.abs(upper - lower) > EPSILON
+
+    return np.exp(lower / 2)
+
+
+def rate_period(ratings, rds, volatilities, player_a, player_b, scores_a, tau=TAU):
+    """
+    Runs one Glicko-2 rating period for every player in one vectorized pass.
+
+    ratings, rds and volatilities are arrays over all players. player_a and
+    player_b index into them, one entry per game, and scores_a is player_a's
+    score in that game (1, 0.5 or 0). Players without games only have their
+    RD decayed. Returns the new (ratings, rds, volatilities).
+    """
+    ratings = np.asarray(ratings, dtype=np.float64)
+    rds = np.asarray(rds, dtype=np.float64)
+    volatilities = np.asarray(volatilities, dtype=np.float64)
+    player_a = np.asarray(player_a, dtype=np.int64)
+    player_b = np.asarray(player_b, dtype=np.int64)
+    scores_a = np.asarray(scores_a, dtype=np.float64)
+    n = len(ratings)
+
+    mu = (ratings - DEFAULT_RATING) / SCALE
+    phi = rds / SCALE
+
+    # every game is seen once from each side
+    players = np.concatenate((player_a, player_b))
+    opponents = np.concatenate((player_b, player_a))
+    scores = np.concatenate((scores_a, 1 - scores_a))
+
+    g = _g(phi[opponents])
+    expected = 1 / (1 + np.exp(-g * (mu[players] - mu[opponents])))
+
+    information = np.bincount(players, weights=g ** 2 * expected * (1 - expected), minlength=n)
+    improvement = np.bincount(players, weights=g * (scores - expected), minlength=n)
+
+    new_ratings = ratings.copy()
+    new_rds = decay(rds, volatilities)
+    new_volatilities = volatilities.copy()
+
+    played = information > 0
+    if played.any():
+        v = 1 / information[played]
+        delta = v * improvement[played]
+
+        sigma = _volatility(volatilities[played], phi[played], v, delta, tau)
+        phi_star = np.sqrt(phi[played] ** 2 + sigma ** 2)
+        new_phi = 1 / np.sqrt(1 / phi_star ** 2 + 1 / v)
+        new_mu = mu[played] + new_phi ** 2 * improvement[played]
+
+        new_ratings[played] = new_mu * SCALE + DEFAULT_RATING
+        new_rds[played] = np.minimum(new_phi * SCALE, DEFAULT_RD)
+        new_volatilities[played] = sigma
+
+    return new_ratings, new_rds, new_volatilities
+
+
+def replay(games, period=RATING_PERIOD, tau=TAU) -> dict:
+    """
+    Rebuilds every rating from scratch out of (player1_id, player2_id, result, played_at)
+    rows sorted by played_at. Returns {user_id: (rating, rd, volatility)}.
+    """
+    games = list(games)
+    if not games:
+        return {}
+
+    index = {}
+    for player1_id, player2_id, _, _ in games:
+        index.setdefault(player1_id, len(index))
+        index.setdefault(player2_id, len(index))
+
+    ratings = np.full(len(index), DEFAULT_RATING)
+    rds = np.full(len(index), DEFAULT_RD)
+    volatilities = np.full(len(index), DEFAULT_VOLATILITY)
+
+    player_a = np.fromiter((index[game[0]] for game in games), dtype=np.int64, count=len(games))
+    player_b = np.fromiter((index[game[1]] for game in games), dtype=np.int64, count=len(games))
+    scores_a = np.fromiter((game[2] for game in games), dtype=np.float64, count=len(games))
+    periods = np.fromiter((game[3] for game in games), dtype=np.int64, count=len(games)) // period
+
+    # games are sorted, so every period is one contiguous slice
+    starts = np.flatnonzero(np.diff(periods, prepend=periods[0] - 1))
+    ends = np.append(starts[1:], len(games))
+
+    previous = periods[0]
+    for start, end in zip(starts, ends):
+        # periods nobody played in only decay the RD
+        if periods[start] - previous > 1:
+            rds = decay(rds, volatilities, periods[start] - previous - 1)
+        previous = periods[start]
+
+        ratings, rds, volatilities = rate_period(
+            ratings, rds, volatilities, player_a[start:end], player_b[start:end], scores_a[start:end], tau
+        )
+
+    return {user_id: (ratings[i], rds[i], volatilities[i]) for user_id, i in index.items()}
+
+
+async def _rebuild(path, period):
+    from utils.database.database import DBManager
+
+    db = DBManager(path, legacy_paths=())
+    try:
+        games = await db.connectfour_fetch_history()
+        started = time.perf_counter()
+        ratings = replay([(game["player1_id"], game["player2_id"], game["result"], game["played_at"]) for game in games], period)
+        elapsed = time.perf_counter() - started
+
+        last_game_id = max((game["id"] for game in games), default=0)
+        await db.connectfour_save_glicko([(rating, rd, volatility, user_id) for user_id, (rating, rd, volatility) in ratings.items()], last_game_id)
+        print(f"Replayed {len(games)} games for {len(ratings)} players in {elapsed:.2f}s")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild Connect Four Glicko-2 ratings from the game history")
+    parser.add_argument("--db", default="data.db")
+    parser.add_argument("--period", type=int, default=RATING_PERIOD, help="rating period length in seconds")
+    args = parser.parse_args()
+
+    asyncio.run(_rebuild(args.db, args.period))
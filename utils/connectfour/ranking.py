@@ -0,0 +1,140 @@
+import bisect
+
+
+class RatingIndex:
+    """
+    Leaderboard order statistics over integer ratings.
+
+    A Fenwick tree counts players per rating, so the rank of a player and
+    the player at any leaderboard position are found in O(log R) where R is
+    the highest rating. Players sharing a rating are kept sorted by id, which
+    is the tie-break on the leaderboard.
+    """
+
+    def __init__(self, size=4096):
+        self._size = size
+        self._tree = [0] * (size + 1)
+        self._buckets = {}  # rating -> sorted list of user ids
+        self._ratings = {}  # user_id -> rating
+
+
+    def __len__(self):
+        return len(self._ratings)
+
+
+    def __contains__(self, user_id):
+        return user_id in self._ratings
+
+
+    def load(self, rows):
+        """Replaces the index with (user_id, rating) rows in one O(n) pass."""
+        self._ratings = {user_id: self._key(rating) for user_id, rating in rows}
+        self._size = max(self._size, max(self._ratings.values(), default=0) + 1)
+
+        self._buckets = {}
+        for user_id, rating in self._ratings.items():
+            self._buckets.setdefault(rating, []).append(user_id)
+        for bucket in self._buckets.values():
+            bucket.sort()
+
+        # linear time Fenwick construction
+        self._tree = [0] * (self._size + 1)
+        for rating, bucket in self._buckets.items():
+            self._tree[rating + 1] += len(bucket)
+        for i in range(1, self._size + 1):
+            parent = i + (i & -i)
+            if parent <= self._size:
+                self._tree[parent] += self._tree[i]
+
+
+    def update(self, user_id, rating):
+        rating = self._key(rating)
+        if self._ratings.get(user_id) == rating:
+            return
+
+        old_rating = self._ratings.pop(user_id, None)
+        if old_rating is not None:
+            bucket = self._buckets[old_rating]
+            del bucket[bisect.bisect_left(bucket, user_id)]
+            if not bucket:
+                del self._buckets[old_rating]
+            self._add(old_rating, -1)
+
+        if rating >= self._size:
+            self._grow(rating + 1)
+
+        self._ratings[user_id] = rating
+        bisect.insort(self._buckets.setdefault(rating, []), user_id)
+        self._add(rating, 1)
+
+
+    def rating(self, user_id):
+        return self._ratings.get(user_id)
+
+
+    def rank(self, user_id):
+        """1-based leaderboard position of a player, or None if they are not rated."""
+        rating = self._ratings.get(user_id)
+        if rating is None:
+            return None
+        above = len(self._ratings) - self._prefix(rating + 1)
+        return above + bisect.bisect_left(self._buckets[rating], user_id) + 1
+
+
+    def at(self, position):
+        """(user_id, rating) at a 1-based leaderboard position."""
+        if not 1 <= position <= len(self._ratings):
+            raise IndexError(position)
+
+        # the position-th highest is the (n - position + 1)-th lowest
+        rating = self._find(len(self._ratings) - position + 1)
+        above = len(self._ratings) - self._prefix(rating + 1)
+        return self._buckets[rating][position - above - 1], rating
+
+
+    def page(self, page, per_page=10):
+        """[(position, user_id, rating)] for a 1-based leaderboard page."""
+        start = (page - 1) * per_page + 1
+        stop = min(start + per_page, len(self._ratings) + 1)
+        return [(position, *self.at(position)) for position in range(start, stop)]
+
+
+    @staticmethod
+    def _key(rating):
+        return max(0, int(round(rating)))
+
+
+    def _add(self, rating, delta):
+        i = rating + 1
+        while i <= self._size:
+            self._tree[i] += delta
+            i += i & -i
+
+
+    def _prefix(self, count):
+        """Number of players rated below `count`."""
+        total = 0
+        i = count
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+
+    def _find(self, k):
+        """Lowest rating r such that at least k players are rated r or less."""
+        i = 0
+        step = 1 << self._size.bit_length()
+        while step:
+            nxt = i + step
+            if nxt <= self._size and self._tree[nxt] < k:
+                i = nxt
+                k -= self._tree[nxt]
+            step >>= 1
+        return i
+
+
+    def _grow(self, size):
+        rows = list(self._ratings.items())
+        self._size = max(size, self._size * 2)
+        self.load(rows)
@@ -0,0 +1,290 @@
+import argparse
+import random
+import time
+
+from utils.connectfour.bitboard import WIDTH, HEIGHT, COLUMN_BITS, COLUMN_MASK, BOTTOM_MASK, BOARD_MASK, is_win
+
+# center columns take part in the most lines, so they are searched first
+MOVE_ORDER = (3, 2, 4, 1, 5, 0, 6)
+
+WIN_SCORE = 1_000_000
+# any score past this is a forced result rather than a heuristic guess
+SOLVED_SCORE = WIN_SCORE - WIDTH * HEIGHT - 1
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# difficulty -> (max depth, time budget in seconds, chance to play a random move)
+DIFFICULTIES = {
+    "easy": (2, 0.1, 0.3),
+    "medium": (4, 0.5, 0.05),
+    "hard": (10, 1.5, 0.0),
+    "expert": (WIDTH * HEIGHT, 4.0, 0.0)
+}
+
+
+def column_mask(col: int) -> int:
+    return COLUMN_MASK << (col * COLUMN_BITS)
+
+
+def winning_cells(position: int, mask: int) -> int:
+    """Empty cells that would complete four in a row for the stones in `position`."""
+    # vertical
+    cells = (position << 1) & (position << 2) & (position << 3)
+
+    for shift in (COLUMN_BITS, COLUMN_BITS - 1, COLUMN_BITS + 1):
+        pair = (position << shift) & (position << (2 * shift))
+        cells |= pair & (position << (3 * shift))
+        cells |= pair & (position >> shift)
+        pair = (position >> shift) & (position >> (2 * shift))
+        cells |= pair & (position << shift)
+        cells |= pair & (position >> (3 * shift))
+
+    return cells & (BOARD_MASK ^ mask)
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class Solver:
+    """
+    Negamax with alpha-beta pruning over bitboards.
+
+    Positions are (position, mask) from the side to move: `position` holds its
+    stones, `mask` every stone on the board. Searches deepen iteratively until
+    the time budget runs out and reuse a transposition table keyed by
+    position + mask, which stays valid across searches.
+    """
+
+    def __init__(self, table_size=2_000_000):
+        self.table = {}
+        self.table_size = table_size
+        self.nodes = 0
+        self._deadline = float("inf")
+
+
+    def search(self, position: int, mask: int, max_depth: int = WIDTH * HEIGHT, time_budget: float = 1.0):
+        """Returns (column, score, depth reached) of the best move found within the budget."""
+        self._deadline = time.perf_counter() + time_budget
+        moves = mask.bit_count()
+        possible = (mask + BOTTOM_MASK) & BOARD_MASK
+        legal = [col for col in MOVE_ORDER if possible & column_mask(col)]
+        if not legal:
+            raise ValueError("The board is full")
+
+        winning = winning_cells(position, mask) & possible
+        for col in legal:
+            if winning & column_mask(col):
+                return col, WIN_SCORE - moves - 1, 1
+
+        best_col, best_score, depth_reached = legal[0], 0, 0
+        for depth in range(1, min(max_depth, WIDTH * HEIGHT - moves) + 1):
+            try:
+                col, score = self._search_root(position, mask, moves, depth, [best_col] + [c for c in legal if c != best_col])
+            except SearchTimeout:
+                break
+
+            best_col, best_score, depth_reached = col, score, depth
+            if abs(score) >= SOLVED_SCORE:
+                break
+
+        return best_col, best_score, depth_reached
+
+
+    def _search_root(self, position, mask, moves, depth, ordered):
+        alpha, beta = -WIN_SCORE, WIN_SCORE
+        best_col, best_score = ordered[0], -WIN_SCORE
+        for col in ordered:
+            move = (mask + BOTTOM_MASK) & column_mask(col)
+            score = -self.negamax(position ^ mask, mask | move, moves + 1, depth - 1, -beta, -alpha)
+            if score > best_score:
+                best_col, best_score = col, score
+            alpha = max(alpha, score)
+        return best_col, best_score
+
+
+    def negamax(self, position, mask, moves, depth, alpha, beta):
+        self.nodes += 1
+        if self.nodes & 1023 == 0 and time.perf_counter() > self._deadline:
+            raise SearchTimeout()
+
+        possible = (mask + BOTTOM_MASK) & BOARD_MASK
+        if winning_cells(position, mask) & possible:
+            return WIN_SCORE - moves - 1
+        if mask == BOARD_MASK:
+            return 0
+
+        opponent = position ^ mask
+        opponent_wins = winning_cells(opponent, mask)
+        forced = possible & opponent_wins
+        if forced:
+            if forced & (forced - 1):
+                # two threats at once, only one can be blocked
+                return -(WIN_SCORE - moves - 2)
+            possible = forced
+
+        # never play right below a cell that wins for the opponent
+        possible &= ~(opponent_wins >> 1)
+        if not possible:
+            return -(WIN_SCORE - moves - 2)
+
+        if depth <= 0:
+            return self.evaluate(position, opponent, mask)
+
+        key = position + mask
+        entry = self.table.get(key)
+        table_move = None
+        if entry is not None:
+            entry_depth, flag, value, table_move = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return value
+                if flag == LOWER:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+
+        original_alpha = alpha
+        best_score, best_col = -WIN_SCORE, None
+        for col, move in self._ordered_moves(position, mask, possible, table_move):
+            score = -self.negamax(opponent, mask | move, moves + 1, depth - 1, -beta, -alpha)
+            if score > best_score:
+                best_score, best_col = score, col
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+
+        if best_score <= original_alpha:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+
+        if len(self.table) >= self.table_size:
+            self.table.clear()
+        self.table[key] = (depth, flag, best_score, best_col)
+        return best_score
+
+
+    def _ordered_moves(self, position, mask, possible, table_move):
+        # table move first, then the moves that open the most new threats, center first on ties
+        moves = []
+        for col in MOVE_ORDER:
+            move = possible & column_mask(col)
+            if move:
+                threats = winning_cells(position | move, mask).bit_count()
+                moves.append((col != table_move, -threats, col, move))
+        moves.sort(key=lambda m: m[:2])
+        return [(col, move) for _, _, col, move in moves]
+
+
+    @staticmethod
+    def evaluate(position, opponent, mask) -> int:
+        """Heuristic score for the side to move: open threats, then stones in the center column."""
+        threats = winning_cells(position, mask).bit_count() - winning_cells(opponent, mask).bit_count()
+        center = (position & column_mask(3)).bit_count() - (opponent & column_mask(3)).bit_count()
+        return threats * 10 + center
+
+
+_solver = None
+
+
+def best_move(player1_bits: int, player2_bits: int, turn: int, difficulty: str = "medium") -> int:
+    """
+    Column (0-6) the bot plays for player `turn`. Module level so it can run in
+    a process pool; every worker process keeps its own solver and table.
+    """
+    global _solver
+    if _solver is None:
+        _solver = Solver()
+
+    max_depth, time_budget, mistake_rate = DIFFICULTIES[difficulty]
+    mask = player1_bits | player2_bits
+    position = player1_bits if turn == 1 else player2_bits
+
+    if random.random() < mistake_rate:
+        possible = (mask + BOTTOM_MASK) & BOARD_MASK
+        return random.choice([col for col in range(WIDTH) if possible & column_mask(col)])
+
+    col, _, _ = _solver.search(position, mask, max_depth, time_budget)
+    return col
+
+
+# solved positions: moves as columns 1-7 from the empty board, then the exact result for the side to move
+# as the stone that ends the game, positive if it wins, negative if it loses, 0 for a draw
+KNOWN_POSITIONS = (
+    ("25523546515174352274664472", 27),
+    ("62352673232646611533624214", -28),
+    ("51642713771171647635371266", 37),
+    ("66677317365551645316377572", 39),
+    ("1365254712142162465645726765", -30),
+    ("4572561517361361275766614244", -40),
+    ("1654131641256261466353252233", 41),
+    ("7627114265154321467311626324", -32),
+    ("712213212475655653152213153363", 33),
+    ("367456176235776537467312316153", -40),
+    ("311546165133727721735435312657", -32),
+    ("1552215312224665247333166677653544", 0),
+    ("3143637562153663376174442256547477", -36),
+    ("1267317735365372667565121614244241", 37),
+    ("3757522616466442542565625337427437", -42),
+    ("4376242231217456155435576761254141", 39),
+    ("6276113136126433113734455652657522", 0),
+)
+
+
+def _position(moves):
+    mask = 0
+    boards = [0, 0]
+    for i, col in enumerate(moves):
+        move = (mask + BOTTOM_MASK) & column_mask(int(col) - 1)
+        boards[i % 2] |= move
+        mask |= move
+    return boards[len(moves) % 2], mask
+
+
+def _check_known():
+    failed = 0
+    for moves, result in KNOWN_POSITIONS:
+        position, mask = _position(moves)
+        _, score, _ = Solver().search(position, mask, time_budget=60.0)
+        expected = 0 if result == 0 else (WIN_SCORE - abs(result)) * (1 if result > 0 else -1)
+        if score != expected:
+            failed += 1
+            print(f"FAIL {moves}: expected {expected}, got {score}")
+    print(f"{len(KNOWN_POSITIONS) - failed}/{len(KNOWN_POSITIONS)} solved positions scored exactly")
+    return failed
+
+
+def _benchmark(count, opening, seed=0):
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        moves = "".join(str(rng.randint(1, WIDTH)) for _ in range(opening))
+        position, mask = _position(moves)
+        # skip openings that overfilled a column or already hold a win for either side
+        if mask.bit_count() == opening and not is_win(position) and not is_win(position ^ mask):
+            positions.append((position, mask))
+
+    for difficulty, (max_depth, time_budget, _) in DIFFICULTIES.items():
+        solver = Solver()
+        started = time.perf_counter()
+        for position, mask in positions:
+            solver.search(position, mask, max_depth, time_budget)
+        elapsed = time.perf_counter() - started
+        print(f"{difficulty:8} {solver.nodes / elapsed:>10,.0f} positions/s   {elapsed / count * 1000:7.1f} ms per move")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks the solver against solved positions, then measures searched positions per second")
+    parser.add_argument("--positions", type=int, default=20, help="random openings searched per difficulty")
+    parser.add_argument("--opening", type=int, default=8, help="random moves played before each search")
+    args = parser.parse_args()
+
+    if _check_known():
+        raise SystemExit(1)
+    _benchmark(args.positions, args.opening)
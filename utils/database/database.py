@@ -1,172 +1,1027 @@
+import argparse
 import sqlite3
 import os
+import statistics
 import json
+import asyncio
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.scheduler.recurrence import next_occurrence
+from utils.connectfour.bitboard import Bitboard
+from utils.generative.model import ngrams, MAX_ORDER
+from utils.generative.config import DEFAULT_GUILD_CONFIG
+
+# columns added after a table was first released, applied to existing databases before the schema scripts run
+COLUMN_MIGRATIONS = {
+    "reminders": {
+        "next_fire_at": "INTEGER",
+        "recurrence": "TEXT"
+    },
+    "connect_four": {
+        "difficulty": "TEXT"
+    },
+    "connect_four_user": {
+        "glicko_rating": "REAL NOT NULL DEFAULT 1500",
+        "glicko_rd": "REAL NOT NULL DEFAULT 350",
+        "glicko_volatility": "REAL NOT NULL DEFAULT 0.06"
+    },
+    "guild_generative_config": {
+        "ngram_order": "INTEGER NOT NULL DEFAULT 3"
+    },
+    "role_settings": {
+        "whitelisted_role_ids": "TEXT DEFAULT NULL"
+    }
+}
+
+NGRAM_COLUMNS = tuple(f"w{i}" for i in range(1, MAX_ORDER + 1))
 
 class DBManager:
-    def __init__(self):
-        self.conn = sqlite3.connect('test_data.db')
-        self.conn.row_factory = sqlite3.Row
-        self.cursor = self.conn.cursor()
+    """
+    Async wrapper around the bot's SQLite database.
+
+    Every query runs off the event loop. Writes are serialized on a single
+    writer thread that owns its own connection, reads are spread over a small
+    pool of reader threads that each keep a connection and open a fresh cursor
+    per call, so a slow disk never stalls the gateway heartbeat.
+    """
+
+    def __init__(self, path='data.db', read_workers=4, legacy_paths=('test_data.db',)):
+        self.path = path
 
-        self.init_tables()
+        self._local = threading.local()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix="db-reader")
+
+        self.init_tables(legacy_paths)
 
         return None
 
 
-    def init_tables(self):
+    def init_tables(self, legacy_paths=()):
+        # runs once at startup, before the event loop is busy, so it is fine to block here
+        conn = self._connect()
+        self.migrate_columns(conn)
         for file in os.listdir('./utils/database/sql'):
             if file.endswith('.sql'):
                 with open(f'./utils/database/sql/{file}', 'r') as f:
                     sql = f.read()
-                    self.cursor.executescript(sql)
-        self.conn.commit()
+                    conn.executescript(sql)
+
+        # counts the shared database's own messages, imported ones are counted as they are inserted
+        self.backfill_generator_ngrams(conn)
+        conn.commit()
+
+        # legacy rows are imported first so they go through the same migrations and backfills
+        migrated = [legacy_path for legacy_path in legacy_paths if self.migrate_legacy_database(conn, legacy_path)]
+
+        self.migrate_connect_four_grid(conn)
+        self.backfill_reminders(conn)
+        conn.commit()
+        conn.close()
 
+        for legacy_path in migrated:
+            os.replace(legacy_path, f"{legacy_path}.migrated")
 
-    def insert_reminder(self, user_id, channel_id, label, remind_at, daily_remind_at, send_dm):
-        self.cursor.execute(
-                "INSERT INTO reminders (user_id, channel_id, label, remind_at, daily_time, send_dm) VALUES (?, ?, ?, ?, ?, ?)",
-                (user_id, channel_id, label, remind_at, daily_remind_at, send_dm)
+
+    def migrate_columns(self, conn):
+        for table, columns in COLUMN_MIGRATIONS.items():
+            existing = [row["name"] for row in conn.execute(f"PRAGMA table_info({table})")]
+            if not existing:
+                continue  # table is created with the full schema
+
+            for column, column_type in columns.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+
+    def backfill_reminders(self, conn):
+        # reminders created before next_fire_at existed
+        conn.execute("UPDATE reminders SET next_fire_at = remind_at WHERE next_fire_at IS NULL AND remind_at IS NOT NULL")
+
+        rows = conn.execute("SELECT id, daily_time FROM reminders WHERE next_fire_at IS NULL AND daily_time IS NOT NULL").fetchall()
+        for row in rows:
+            recurrence = f"daily {row['daily_time']}"
+            conn.execute(
+                "UPDATE reminders SET recurrence = ?, next_fire_at = ? WHERE id = ?",
+                (recurrence, next_occurrence(recurrence, time.time()), row["id"])
             )
-        self.conn.commit()
 
 
-    def delete_reminder(self, user_id, label):
-        self.cursor.execute("DELETE FROM reminders WHERE user_id = ? AND label = ?", (user_id, label))
-        self.conn.commit()
+    def backfill_generator_ngrams(self, conn):
+        # messages cached before n-gram counts were stored, the older trigram counts used different tokens
+        conn.execute("DROP TABLE IF EXISTS generator_trigrams")
+        if conn.execute("SELECT 1 FROM generator_ngrams LIMIT 1").fetchone():
+            return
+
+        counts = {}
+        for row in conn.execute("SELECT channel_id, content FROM generator_message_cache"):
+            for ngram in ngrams(row["content"]):
+                key = (row["channel_id"], *ngram)
+                counts[key] = counts.get(key, 0) + 1
+
+        conn.executemany(
+            f"INSERT INTO generator_ngrams (channel_id, {', '.join(NGRAM_COLUMNS)}, count) VALUES (?, {'?, ' * MAX_ORDER}?)",
+            [(*key, count) for key, count in counts.items()]
+        )
+
+
+    def migrate_connect_four_grid(self, conn):
+        # games stored as a json grid before the bitboard columns existed, the table is rebuilt without it
+        columns = [row["name"] for row in conn.execute("PRAGMA table_info(connect_four)")]
+        if "grid" not in columns:
+            return
+
+        games = conn.execute("SELECT * FROM connect_four").fetchall()
+        conn.execute("DROP TABLE connect_four")
+        with open('./utils/database/sql/connect_four.sql', 'r') as f:
+            conn.executescript(f.read())
+
+        self._insert_grid_games(conn, games)
+
+
+    @staticmethod
+    def _insert_grid_games(conn, games):
+        conn.executemany(
+            "INSERT OR IGNORE INTO main.connect_four (game_id, player1_id, player2_id, turn, selected_column, player1_bits, player2_bits, message_id, channel_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (game["game_id"], game["player1_id"], game["player2_id"], game["turn"], game["selected_column"], *Bitboard.from_grid(json.loads(game["grid"])).boards, game["message_id"], game["channel_id"])
+                for game in games
+            ]
+        )
+
+
+    def migrate_legacy_database(self, conn, legacy_path) -> bool:
+        """Copies every table of an old database file into the shared one. Returns whether there was one to copy."""
+        if not os.path.exists(legacy_path) or os.path.abspath(legacy_path) == os.path.abspath(self.path):
+            return False
+
+        conn.execute("ATTACH DATABASE ? AS legacy", (legacy_path,))
+        try:
+            tables = conn.execute(
+                "SELECT name FROM legacy.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+            ).fetchall()
+
+            with conn:
+                for (table,) in tables:
+                    legacy_columns = [row["name"] for row in conn.execute(f"PRAGMA legacy.table_info({table})")]
+                    columns = [row["name"] for row in conn.execute(f"PRAGMA main.table_info({table})")]
+
+                    if not columns:
+                        conn.execute(conn.execute(
+                            "SELECT sql FROM legacy.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+                        ).fetchone()[0])
+                        columns = legacy_columns
+
+                    if table == "connect_four" and "grid" in legacy_columns and "grid" not in columns:
+                        # the shared columns would drop the board, it is converted to bitboards on the way in
+                        self._insert_grid_games(conn, conn.execute("SELECT * FROM legacy.connect_four").fetchall())
+                        continue
+
+                    if table == "generator_message_cache":
+                        # only messages the shared database did not have yet are added to the n-gram counts
+                        cursor = conn.cursor()
+                        for channel_id, messages in self._group_legacy_messages(conn).items():
+                            self._gen_insert_messages(cursor, channel_id, messages)
+                        continue
+
+                    shared = ", ".join(c for c in legacy_columns if c in columns)
+                    conn.execute(f"INSERT OR IGNORE INTO main.{table} ({shared}) SELECT {shared} FROM legacy.{table}")
+        finally:
+            conn.execute("DETACH DATABASE legacy")
+
+        return True
 
 
-    def fetch_all_user_reminders(self, user_id):
-        self.cursor.execute("SELECT label, daily_time, send_dm FROM reminders WHERE user_id = ?", (user_id,))
-        return self.cursor.fetchall()
+    @staticmethod
+    def _group_legacy_messages(conn) -> dict:
+        grouped = {}
+        for row in conn.execute("SELECT id, channel_id, content FROM legacy.generator_message_cache"):
+            grouped.setdefault(row["channel_id"], []).append((row["id"], row["content"]))
+        return grouped
 
 
-    def select_reminder_due(self, current_time, daily_time):
-        self.cursor.execute("SELECT id, user_id, channel_id, label, send_dm, daily_time FROM reminders WHERE remind_at <= ? OR daily_time = ?", (current_time,daily_time))
-        results = self.cursor.fetchall()
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # WAL lets the reader pool keep reading while the writer commits
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA mmap_size = 268435456")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
 
-        for reminder in results:
-            self.cursor.execute("DELETE FROM reminders WHERE id = ?", (reminder[0],))
 
-        self.conn.commit()
+    def _connection(self) -> sqlite3.Connection:
+        # one connection per executor thread, created lazily
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
 
-        return results
-    
 
-    def get_connect_four_game(self, message_id) -> dict:
-        self.cursor.execute("SELECT * FROM connect_four WHERE message_id = ?", (message_id,))
-        return self.cursor.fetchone()
-    
+    def _run_read(self, fn, args):
+        cursor = self._connection().cursor()
+        try:
+            return fn(cursor, *args)
+        finally:
+            cursor.close()
 
-    def connectfour_update_selection(self, game_id, column_idx):
-        self.cursor.execute("UPDATE connect_four SET selected_column = ? WHERE game_id = ?", (column_idx, game_id,))
-        self.conn.commit()
 
-    
-    def connectfour_fetch_user(self, player_id) -> dict:
-        self.cursor.execute(
-            "SELECT id, rating, games_played, wins, losses FROM connect_four_user WHERE id = ?",
-            (player_id,)
+    def _run_write(self, fn, args):
+        conn = self._connection()
+        cursor = conn.cursor()
+        try:
+            result = fn(cursor, *args)
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+
+    async def _read(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, self._run_read, fn, args)
+
+
+    async def _write(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, self._run_write, fn, args)
+
+
+    def close(self):
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+
+
+    async def insert_reminder(self, user_id, channel_id, label, next_fire_at, recurrence, send_dm):
+        def query(cursor):
+            cursor.execute(
+                "INSERT INTO reminders (user_id, channel_id, label, remind_at, next_fire_at, recurrence, send_dm) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, channel_id, label, next_fire_at, next_fire_at, recurrence, send_dm)
+            )
+            return cursor.lastrowid
+
+        return await self._write(query)
+
+
+    async def delete_reminder(self, user_id, label):
+        def query(cursor):
+            cursor.execute("DELETE FROM reminders WHERE user_id = ? AND label = ?", (user_id, label))
+
+        await self._write(query)
+
+
+    async def fetch_all_user_reminders(self, user_id):
+        def query(cursor):
+            cursor.execute("SELECT label, next_fire_at, recurrence, send_dm FROM reminders WHERE user_id = ? ORDER BY next_fire_at", (user_id,))
+            return cursor.fetchall()
+
+        return await self._read(query)
+
+
+    async def fetch_pending_reminders(self):
+        def query(cursor):
+            cursor.execute("SELECT id, user_id, channel_id, label, next_fire_at, recurrence, send_dm FROM reminders WHERE next_fire_at IS NOT NULL")
+            return cursor.fetchall()
+
+        return await self._read(query)
+
+
+    async def update_fired_reminders(self, advanced, deleted):
+        """Moves fired recurring reminders to their next time and removes fired one-shot reminders, in one transaction."""
+        def query(cursor):
+            cursor.executemany("UPDATE reminders SET next_fire_at = ? WHERE id = ?", advanced)
+            cursor.executemany("DELETE FROM reminders WHERE id = ?", [(reminder_id,) for reminder_id in deleted])
+
+        await self._write(query)
+
+
+    async def insert_reminder_dead_letter(self, reminder, scheduled_at, attempts, error):
+        def query(cursor):
+            cursor.execute(
+                "INSERT INTO reminder_dead_letters (reminder_id, user_id, channel_id, label, send_dm, scheduled_at, failed_at, attempts, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (reminder["id"], reminder["user_id"], reminder["channel_id"], reminder["label"], reminder["send_dm"], int(scheduled_at), int(time.time()), attempts, error)
+            )
+
+        await self._write(query)
+
+
+    async def connectfour_fetch_all_games(self) -> list:
+        def query(cursor):
+            cursor.execute("SELECT * FROM connect_four")
+            return cursor.fetchall()
+
+        return await self._read(query)
+
+
+    async def connectfour_save_game(self, game_id, turn, selected_column, player1_bits, player2_bits):
+        def query(cursor):
+            cursor.execute(
+                "UPDATE connect_four SET turn = ?, selected_column = ?, player1_bits = ?, player2_bits = ? WHERE game_id = ?",
+                (turn, selected_column, player1_bits, player2_bits, game_id)
+            )
+
+        await self._write(query)
+
+
+    async def connectfour_delete_games(self, game_ids):
+        def query(cursor):
+            cursor.executemany("DELETE FROM connect_four WHERE game_id = ?", [(game_id,) for game_id in game_ids])
+
+        await self._write(query)
+
+
+    async def connectfour_fetch_user(self, player_id) -> dict:
+        def query(cursor):
+            cursor.execute(
+                "SELECT id, rating, games_played, wins, losses, glicko_rating, glicko_rd FROM connect_four_user WHERE id = ?",
+                (player_id,)
+            )
+            row = cursor.fetchone()
+
+            # insert new user
+            if row is None:
+                cursor.execute("INSERT INTO connect_four_user (id) VALUES (?)", (player_id,))
+                cursor.execute(
+                    "SELECT id, rating, games_played, wins, losses, glicko_rating, glicko_rd FROM connect_four_user WHERE id = ?",
+                    (player_id,)
+                )
+                row = cursor.fetchone()
+
+            return row
+
+        # may insert, so it goes through the writer
+        return await self._write(query)
+
+
+    async def connectfour_record_result(self, player_a_id, player_b_id, result_a, rate) -> tuple:
+        """
+        Reads both players, lets rate(player_a, player_b) return their new
+        (rating, games_played, wins, losses) and writes them in the same
+        transaction as the game's history entry.
+        """
+        def query(cursor):
+            cursor.execute(
+                "INSERT INTO connect_four_history (player1_id, player2_id, result, played_at) VALUES (?, ?, ?, ?)",
+                (player_a_id, player_b_id, result_a, int(time.time()))
+            )
+            cursor.executemany("INSERT OR IGNORE INTO connect_four_user (id) VALUES (?)", [(player_a_id,), (player_b_id,)])
+            players = {
+                row["id"]: row for row in cursor.execute(
+                    "SELECT id, rating, games_played, wins, losses FROM connect_four_user WHERE id IN (?, ?)",
+                    (player_a_id, player_b_id)
+                )
+            }
+
+            new_a, new_b = rate(players[player_a_id], players[player_b_id])
+            cursor.executemany(
+                "UPDATE connect_four_user SET rating = ?, games_played = ?, wins = ?, losses = ? WHERE id = ?",
+                [(*new_a, player_a_id), (*new_b, player_b_id)]
+            )
+            return new_a, new_b
+
+        return await self._write(query)
+
+
+    async def connectfour_create_game(self, player1, player2, turn, board, board_msg, difficulty=None):
+        def query(cursor):
+            cursor.execute("INSERT INTO connect_four (player1_id, player2_id, turn, selected_column, player1_bits, player2_bits, message_id, channel_id, difficulty) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           (player1, player2, turn, 1, *board.boards, board_msg.id, board_msg.channel.id, difficulty))
+            return cursor.lastrowid
+
+        return await self._write(query)
+
+
+    async def connectfour_fetch_ratings(self) -> list:
+        def query(cursor):
+            cursor.execute("SELECT id, rating FROM connect_four_user WHERE games_played > 0")
+            return cursor.fetchall()
+
+        return await self._read(query)
+
+
+    async def connectfour_fetch_history(self, after_id=0) -> list:
+        def query(cursor):
+            cursor.execute(
+                "SELECT id, player1_id, player2_id, result, played_at FROM connect_four_history WHERE id > ? ORDER BY played_at, id",
+                (after_id,)
+            )
+            return cursor.fetchall()
+
+        return await self._read(query)
+
+
+    async def connectfour_fetch_glicko_period(self) -> tuple:
+        """
+        Returns (glicko rows of every rated player, games since the last processed
+        rating period, the last processed game id, when that period was processed).
+        """
+        def query(cursor):
+            row = cursor.execute("SELECT last_game_id, processed_at FROM connect_four_rating_period WHERE id = 1").fetchone()
+            last_game_id, processed_at = (row["last_game_id"], row["processed_at"]) if row else (0, None)
+
+            players = cursor.execute(
+                "SELECT id, glicko_rating, glicko_rd, glicko_volatility FROM connect_four_user WHERE games_played > 0"
+            ).fetchall()
+            games = cursor.execute(
+                "SELECT id, player1_id, player2_id, result FROM connect_four_history WHERE id > ? ORDER BY id",
+                (last_game_id,)
+            ).fetchall()
+            return players, games, last_game_id, processed_at
+
+        return await self._read(query)
+
+
+    async def connectfour_save_glicko(self, players, last_game_id):
+        """Writes (rating, rd, volatility, user_id) rows and marks games up to last_game_id as processed."""
+        def query(cursor):
+            cursor.executemany(
+                "UPDATE connect_four_user SET glicko_rating = ?, glicko_rd = ?, glicko_volatility = ? WHERE id = ?",
+                players
+            )
+            cursor.execute(
+                """
+                INSERT INTO connect_four_rating_period (id, last_game_id, processed_at) VALUES (1, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET last_game_id = excluded.last_game_id, processed_at = excluded.processed_at
+                """,
+                (last_game_id, int(time.time()))
+            )
+
+        await self._write(query)
+
+
+    async def gen_fetch_guild_config(self, guild_id):
+        """The guild's stored config row, or None if it never changed a setting."""
+        def query(cursor):
+            return cursor.execute("SELECT * FROM guild_generative_config WHERE id = ?", (guild_id,)).fetchone()
+
+        return await self._read(query)
+
+
+    async def gen_update_guild_config(self, guild_id, option, value):
+        def query(cursor):
+            cursor.execute(
+                f"INSERT OR IGNORE INTO guild_generative_config (id, {', '.join(DEFAULT_GUILD_CONFIG)}) VALUES (?{', ?' * len(DEFAULT_GUILD_CONFIG)})",
+                (guild_id, *DEFAULT_GUILD_CONFIG.values())
+            )
+            cursor.execute(f"UPDATE guild_generative_config SET {option} = ? WHERE id = ?", (value, guild_id))
+
+        await self._write(query)
+
+
+    @staticmethod
+    def _gen_insert_messages(cursor, channel_id, messages) -> list:
+        """Caches (message_id, content) pairs and adds the new ones to the n-gram counts. Returns the new ones."""
+        counts = {}
+        inserted = []
+        for message_id, content in messages:
+            cursor.execute(
+                "INSERT OR IGNORE INTO generator_message_cache (id, channel_id, content) VALUES (?, ?, ?)", (message_id, channel_id, content,)
+            )
+            if cursor.rowcount == 0:
+                continue
+
+            inserted.append((message_id, content))
+            for ngram in ngrams(content):
+                counts[ngram] = counts.get(ngram, 0) + 1
+
+        columns = ", ".join(NGRAM_COLUMNS)
+        cursor.executemany(
+            f"""
+            INSERT INTO generator_ngrams (channel_id, {columns}, count) VALUES (?, {'?, ' * MAX_ORDER}?)
+            ON CONFLICT(channel_id, {columns}) DO UPDATE SET count = count + excluded.count
+            """,
+            [(channel_id, *ngram, count) for ngram, count in counts.items()]
         )
-        row = self.cursor.fetchone()
-
-        # insert new user
-        if row is None:
-            self.cursor.execute("INSERT INTO connect_four_user (id) VALUES (?)", (player_id,))
-            self.conn.commit()
-            return player_id, 100, 0, 0, 0
-
-        return row
-    
-    
-    def connectfour_user_insert(self, player_id, rating, games_played, wins, losses):
-        self.cursor.execute("""
-                INSERT INTO connect_four_user (id, rating, games_played, wins, losses)
-                VALUES (?, ?, ?, ?, ?)
+        return inserted
+
+
+    async def gen_cache_message(self, message_id, channel_id, content) -> bool:
+        """Caches a message and adds its n-grams to the channel's counts. Returns False if it was already cached."""
+        def query(cursor):
+            return len(self._gen_insert_messages(cursor, channel_id, [(message_id, content)])) > 0
+
+        return await self._write(query)
+
+
+    async def gen_cache_messages(self, messages) -> dict:
+        """Caches (message_id, channel_id, content) rows in one transaction. Returns {channel_id: [new (message_id, content)]}."""
+        def query(cursor):
+            by_channel = {}
+            for message_id, channel_id, content in messages:
+                by_channel.setdefault(channel_id, []).append((message_id, content))
+
+            return {
+                channel_id: self._gen_insert_messages(cursor, channel_id, channel_messages)
+                for channel_id, channel_messages in by_channel.items()
+            }
+
+        return await self._write(query)
+
+
+    async def gen_start_ingest_job(self, channel_id, restart=False):
+        """Marks a history ingestion as running and returns the message id to continue after."""
+        def query(cursor):
+            if restart:
+                cursor.execute("DELETE FROM generator_ingest_jobs WHERE channel_id = ?", (channel_id,))
+
+            job = cursor.execute("SELECT * FROM generator_ingest_jobs WHERE channel_id = ?", (channel_id,)).fetchone()
+            if job and job["status"] == "running":
+                after, ingested = job["last_message_id"], job["ingested"]
+            else:
+                after = cursor.execute("SELECT MAX(id) FROM generator_message_cache WHERE channel_id = ?", (channel_id,)).fetchone()[0]
+                ingested = 0
+
+            cursor.execute(
+                """
+                INSERT INTO generator_ingest_jobs (channel_id, last_message_id, ingested, status, updated_at) VALUES (?, ?, ?, 'running', ?)
+                ON CONFLICT(channel_id) DO UPDATE SET
+                    last_message_id = excluded.last_message_id,
+                    ingested = excluded.ingested,
+                    status = excluded.status,
+                    updated_at = excluded.updated_at
+                """,
+                (channel_id, after, ingested, int(time.time()))
+            )
+            return after
+
+        return await self._write(query)
+
+
+    async def gen_ingest_batch(self, channel_id, messages, last_message_id, done=False) -> int:
+        """Stores a batch of history and the job's progress in one transaction. Returns how many messages were new."""
+        def query(cursor):
+            inserted = len(self._gen_insert_messages(cursor, channel_id, messages))
+            cursor.execute(
+                "UPDATE generator_ingest_jobs SET last_message_id = ?, ingested = ingested + ?, status = ?, updated_at = ? WHERE channel_id = ?",
+                (last_message_id, inserted, "done" if done else "running", int(time.time()), channel_id)
+            )
+            return inserted
+
+        return await self._write(query)
+
+
+    async def gen_fail_ingest_job(self, channel_id):
+        """Takes a job off the resume list, a later run continues after the newest cached message."""
+        def query(cursor):
+            cursor.execute(
+                "UPDATE generator_ingest_jobs SET status = 'failed', updated_at = ? WHERE channel_id = ?",
+                (int(time.time()), channel_id)
+            )
+
+        await self._write(query)
+
+
+    async def gen_fetch_running_ingest_jobs(self):
+        def query(cursor):
+            cursor.execute("SELECT channel_id, last_message_id, ingested FROM generator_ingest_jobs WHERE status = 'running'")
+            return cursor.fetchall()
+
+        return await self._read(query)
+
+
+    async def gen_fetch_ngrams(self, channel_id, order):
+        """(w1, ..., w<order>, count) rows of the channel, the stored windows summed over their last `order` words."""
+        columns = ", ".join(NGRAM_COLUMNS[MAX_ORDER - order:])
+
+        def query(cursor):
+            cursor.execute(f"SELECT {columns}, SUM(count) FROM generator_ngrams WHERE channel_id = ? GROUP BY {columns}", (channel_id,))
+            return cursor.fetchall()
+
+        return await self._read(query)
+
+
+    async def gen_clear_channel_cache(self, channel_id):
+        def query(cursor):
+            cursor.execute(
+                "DELETE FROM generator_message_cache WHERE channel_id = ?",
+                (channel_id,)
+            )
+            cursor.execute("DELETE FROM generator_ngrams WHERE channel_id = ?", (channel_id,))
+            cursor.execute("DELETE FROM generator_ingest_jobs WHERE channel_id = ?", (channel_id,))
+
+        await self._write(query)
+
+
+    async def fish_fetch_user(self, user_id):
+        def query(cursor):
+            cursor.execute("SELECT id, level, xp, max_xp, money, current_biome FROM fish_user WHERE id = ?", (user_id,))
+            return cursor.fetchone()
+
+        return await self._read(query)
+
+
+    async def fish_fetch_all_users(self):
+        def query(cursor):
+            cursor.execute("SELECT id, level, xp, max_xp, money, current_biome FROM fish_user")
+            return cursor.fetchall()
+
+        return await self._read(query)
+
+
+    async def fish_fetch_journal_seq(self) -> int:
+        def query(cursor):
+            cursor.execute("SELECT seq FROM fish_journal_state WHERE id = 1")
+            row = cursor.fetchone()
+            return row[0] if row else 0
+
+        return await self._read(query)
+
+
+    async def fish_flush(self, players: list, items: list, journal_seq: int):
+        """
+        Writes the fishing write-behind cache in one transaction: player rows as
+        (id, level, xp, max_xp, current_biome), inventory deltas as
+        (item_id, user_id, quantity) and the last journal sequence they cover.
+        """
+        def query(cursor):
+            cursor.executemany("""
+                INSERT INTO fish_user (id, level, xp, max_xp, current_biome) VALUES (?, ?, ?, ?, ?)
                 ON CONFLICT(id) DO UPDATE SET
-                    rating = excluded.rating,
-                    games_played = excluded.games_played,
-                    wins = excluded.wins,
-                    losses = excluded.losses;
-            """, (player_id, rating, games_played, wins, losses))
+                    level = excluded.level,
+                    xp = excluded.xp,
+                    max_xp = excluded.max_xp,
+                    current_biome = excluded.current_biome
+            """, players)
+            cursor.executemany("""
+                INSERT INTO fish_inventory (item_id, user_id, quantity)
+                VALUES (?, ?, ?)
+                ON CONFLICT(item_id, user_id)
+                DO UPDATE SET quantity = quantity + excluded.quantity
+            """, items)
+            cursor.execute("""
+                INSERT INTO fish_journal_state (id, seq) VALUES (1, ?)
+                ON CONFLICT(id) DO UPDATE SET seq = excluded.seq
+            """, (journal_seq,))
+
+        await self._write(query)
+
+
+    async def fish_fetch_item_quantity(self, user_id, item_id):
+        def query(cursor):
+            cursor.execute("SELECT quantity FROM fish_inventory WHERE user_id = ? AND item_id = ?", (user_id, item_id))
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+        return await self._read(query)
+
 
-        self.conn.commit()
+    async def fish_fetch_inventory(self, user_id):
+        def query(cursor):
+            cursor.execute("SELECT item_id, quantity FROM fish_inventory WHERE user_id = ?", (user_id,))
+            return cursor.fetchall()
 
-    
-    def connectfour_game_exists(self, player1_id, player2_id) -> bool:
-        self.cursor.execute("SELECT game_id FROM connect_four WHERE player1_id IN (?, ?) OR player2_id IN (?, ?)", (player1_id, player2_id, player1_id, player2_id))
+        return await self._read(query)
 
-        if self.cursor.fetchone():
-            self.cursor.execute("DELETE FROM connect_four WHERE player1_id IN (?, ?) OR player2_id IN (?, ?)", (player1_id, player2_id, player1_id, player2_id))
-            self.conn.commit()
+
+    async def fish_open_crate(self, user_id, crate_id, item_counts: dict) -> bool:
+        """Consumes one crate and adds its loot atomically. Returns False if the user has no crate left."""
+        def query(cursor):
+            cursor.execute(
+                "UPDATE fish_inventory SET quantity = quantity - 1 WHERE user_id = ? AND item_id = ? AND quantity > 0",
+                (user_id, crate_id)
+            )
+            if cursor.rowcount == 0:
+                return False
+
+            cursor.executemany("""
+                INSERT INTO fish_inventory (item_id, user_id, quantity)
+                VALUES (?, ?, ?)
+                ON CONFLICT(item_id, user_id)
+                DO UPDATE SET quantity = quantity + excluded.quantity
+            """, [(item_id, user_id, quantity) for item_id, quantity in item_counts.items()])
             return True
-        
-        return False
 
+        return await self._write(query)
 
-    def connectfour_create_game(self, player1, player2, turn, grid, board_msg):
-        self.cursor.execute("INSERT INTO connect_four (player1_id, player2_id, turn, selected_column, grid, message_id, channel_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                            (player1, player2, turn, 1, json.dumps(grid), board_msg.id, board_msg.channel.id))
-        self.conn.commit()
 
-    
-    def connectfour_fetch_all_users(self, page) -> list:
-        offset = (page - 1) * 10
-        self.cursor.execute("SELECT id, rating, games_played, wins, losses FROM connect_four_user ORDER BY rating DESC LIMIT 10 OFFSET ?", (offset,))
-        return self.cursor.fetchall()
-    
+    async def fish_fetch_equipped(self, user_id, item_id):
+        def query(cursor):
+            cursor.execute("SELECT * FROM fish_equipment WHERE user_id = ? AND item_id = ?", (user_id, item_id))
+            return cursor.fetchone()
 
-    def connectfour_check_game_state(self, winner, next_turn, grid, game):
-        if winner == 0:
-            self.cursor.execute("UPDATE connect_four SET turn = ?, grid = ? WHERE game_id = ?", (next_turn, json.dumps(grid), game["game_id"]))
-        else:
-            self.cursor.execute("DELETE FROM connect_four WHERE game_id = ?", (game["game_id"],))
-        self.conn.commit()
-
-
-    def gen_fetch_guild_config(self, guild_id):
-        config = self.cursor.execute("SELECT * FROM guild_generative_config WHERE id = ?", (guild_id,)).fetchone()
-        if config is None:
-            self.cursor.execute("INSERT INTO guild_generative_config (id, enabled, temperature, max_words, auto_cache, message_probability) VALUES (?, ?, ?, ?, ?, ?)", (guild_id, False, 1.0, 50, False, 0.01))
-            self.conn.commit()
-            return self.cursor.execute("SELECT * FROM guild_generative_config WHERE id = ?", (guild_id,)).fetchone()
-        return config
-    
-
-    def gen_update_guild_config(self, guild_id, option, value):
-        self.cursor.execute(f"UPDATE guild_generative_config SET {option} = ? WHERE id = ?", (value, guild_id))
-        self.conn.commit()
-    
-    
-    def gen_cache_message(self, message_id, channel_id, content):
-        self.cursor.execute(
-                "INSERT OR IGNORE INTO generator_message_cache (id, channel_id, content) VALUES (?, ?, ?)", (message_id, channel_id, content,)
+        return await self._read(query)
+
+
+    async def fish_fetch_equipped_accessories(self, user_id):
+        def query(cursor):
+            cursor.execute("SELECT * FROM fish_equipment WHERE user_id = ? AND slot LIKE ?", (user_id, "accessory.%"))
+            return cursor.fetchall()
+
+        return await self._read(query)
+
+
+    async def fish_equip_item(self, user_id, slot, item_id):
+        def query(cursor):
+            cursor.execute("INSERT INTO fish_equipment (user_id, slot, item_id) VALUES (?, ?, ?)", (user_id, slot, item_id))
+            cursor.execute(
+                "UPDATE fish_inventory SET quantity = quantity - 1 WHERE user_id = ? AND item_id = ?",
+                (user_id, item_id)
             )
-        self.conn.commit()
 
+        await self._write(query)
 
-    def gen_fetch_cached_message_content(self, channel_id):
-        self.cursor.execute(
-            "SELECT content FROM generator_message_cache WHERE channel_id = ?",
-            (channel_id,)
-        )
-        rows = self.cursor.fetchall()
-        if not rows:
-            return []
-        return [row["content"] for row in rows]
-    
-
-    def gen_fetch_last_cached_message(self, channel_id):
-        self.cursor.execute(
-            "SELECT MAX(id) FROM generator_message_cache WHERE channel_id = ?",
-            (channel_id,)
-        )
-        result = self.cursor.fetchone()
-        return result[0] if result and result[0] is not None else None
-    
-
-    def gen_clear_channel_cache(self, channel_id):
-        self.cursor.execute(
-            "DELETE FROM generator_message_cache WHERE channel_id = ?",
-            (channel_id,)
-        )
-        self.conn.commit()
\ No newline at end of file
+
+    async def fish_fetch_caught_fish(self, fish_id):
+        def query(cursor):
+            cursor.execute("SELECT id, user_id, name, lore, rarity, size, value, biome, sold FROM infi_fish WHERE id = ?", (fish_id,))
+            return cursor.fetchone()
+
+        return await self._read(query)
+
+
+    async def fish_search_caught_fish(self, name, rarity=None):
+        def query(cursor):
+            if rarity:
+                cursor.execute("SELECT id, user_id, name, rarity FROM infi_fish WHERE name LIKE ? AND rarity = ?", (f"%{name}%", rarity))
+            else:
+                cursor.execute("SELECT id, user_id, name, rarity FROM infi_fish WHERE name LIKE ?", (f"%{name}%",))
+            return cursor.fetchall()
+
+        return await self._read(query)
+
+
+    async def fish_count_caught_fish(self, user_id):
+        def query(cursor):
+            cursor.execute("SELECT COUNT(*) FROM infi_fish WHERE user_id = ?", (user_id,))
+            return cursor.fetchone()[0]
+
+        return await self._read(query)
+
+
+    async def roles_fetch_settings(self, guild_id):
+        def query(cursor):
+            cursor.execute("SELECT * FROM role_settings WHERE guild_id = ?", (guild_id,))
+            return cursor.fetchone()
+
+        return await self._read(query)
+
+
+    async def roles_set_enabled(self, guild_id, enabled):
+        def query(cursor):
+            cursor.execute("""
+                INSERT INTO role_settings (guild_id, enabled) VALUES (?, ?)
+                ON CONFLICT(guild_id) DO UPDATE SET enabled = excluded.enabled
+            """, (guild_id, 1 if enabled else 0))
+
+        await self._write(query)
+
+
+    async def roles_fetch_whitelist(self, guild_id):
+        def query(cursor):
+            cursor.execute("SELECT whitelisted_role_ids FROM role_settings WHERE guild_id = ?", (guild_id,))
+            return cursor.fetchone()
+
+        return await self._read(query)
+
+
+    async def roles_update_whitelist(self, guild_id, whitelisted_roles):
+        def query(cursor):
+            cursor.execute("""
+                INSERT INTO role_settings (guild_id, whitelisted_role_ids) VALUES (?, ?)
+                ON CONFLICT(guild_id) DO UPDATE SET whitelisted_role_ids = excluded.whitelisted_role_ids
+            """, (guild_id, whitelisted_roles))
+
+        await self._write(query)
+
+
+    async def roles_fetch_custom_role(self, user_id, guild_id):
+        def query(cursor):
+            cursor.execute("SELECT id FROM custom_roles WHERE user_id = ? AND guild_id = ?", (user_id, guild_id))
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+        return await self._read(query)
+
+
+    async def roles_insert_custom_role(self, role_id, user_id, guild_id, name, color):
+        def query(cursor):
+            cursor.execute(
+                "INSERT INTO custom_roles (id, user_id, guild_id, name, color) VALUES (?, ?, ?, ?, ?)",
+                (role_id, user_id, guild_id, name, color)
+            )
+
+        await self._write(query)
+
+
+    async def roles_update_custom_role(self, role_id, name=None, color=None):
+        def query(cursor):
+            if name:
+                cursor.execute("UPDATE custom_roles SET name = ? WHERE id = ?", (name, role_id))
+            if color:
+                cursor.execute("UPDATE custom_roles SET color = ? WHERE id = ?", (color, role_id))
+
+        await self._write(query)
+
+
+    async def roles_delete_custom_role(self, role_id):
+        def query(cursor):
+            cursor.execute("DELETE FROM custom_roles WHERE id = ?", (role_id,))
+
+        await self._write(query)
+
+
+    async def autotranslate_fetch_all(self) -> dict:
+        """{user_id: mode} for every user with autotranslation turned on."""
+        def query(cursor):
+            cursor.execute("SELECT user_id, mode FROM autotranslate_users")
+            return {row["user_id"]: row["mode"] for row in cursor.fetchall()}
+
+        return await self._read(query)
+
+
+    async def autotranslate_set_mode(self, user_id, mode):
+        def query(cursor):
+            cursor.execute("""
+                INSERT INTO autotranslate_users (user_id, mode) VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET mode = excluded.mode
+            """, (user_id, mode))
+
+        await self._write(query)
+
+
+    async def autotranslate_delete(self, user_id):
+        def query(cursor):
+            cursor.execute("DELETE FROM autotranslate_users WHERE user_id = ?", (user_id,))
+
+        await self._write(query)
+
+
+    async def image_fetch_url(self, url):
+        def query(cursor):
+            cursor.execute("SELECT hash, etag, last_modified, expires_at FROM image_cache_urls WHERE url = ?", (url,))
+            return cursor.fetchone()
+
+        return await self._read(query)
+
+
+    async def image_touch(self, content_hash, url=None, expires_at=None):
+        """Marks a cached image as used, and pushes back the url's expiry after a 304 revalidation."""
+        def query(cursor):
+            cursor.execute("UPDATE image_cache_blobs SET accessed_at = ? WHERE hash = ?", (int(time.time()), content_hash))
+            if url is not None:
+                cursor.execute("UPDATE image_cache_urls SET expires_at = ? WHERE url = ?", (expires_at, url))
+
+        await self._write(query)
+
+
+    async def image_save(self, url, content_hash, size, etag, last_modified, expires_at, budget) -> list:
+        """
+        Records a downloaded image, then evicts the least recently used images
+        until the cache fits in `budget` bytes again. Returns the evicted hashes.
+        """
+        def query(cursor):
+            now = int(time.time())
+            cursor.execute(
+                """
+                INSERT INTO image_cache_blobs (hash, size, accessed_at) VALUES (?, ?, ?)
+                ON CONFLICT(hash) DO UPDATE SET accessed_at = excluded.accessed_at
+                """,
+                (content_hash, size, now)
+            )
+            cursor.execute(
+                "INSERT OR REPLACE INTO image_cache_urls (url, hash, etag, last_modified, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (url, content_hash, etag, last_modified, expires_at)
+            )
+
+            total = cursor.execute("SELECT COALESCE(SUM(size), 0) FROM image_cache_blobs").fetchone()[0]
+            if total <= budget:
+                return []
+
+            evicted = []
+            for row in cursor.execute("SELECT hash, size FROM image_cache_blobs WHERE hash != ? ORDER BY accessed_at", (content_hash,)).fetchall():
+                if total <= budget:
+                    break
+                evicted.append(row["hash"])
+                total -= row["size"]
+
+            cursor.executemany("DELETE FROM image_cache_urls WHERE hash = ?", [(h,) for h in evicted])
+            cursor.executemany("DELETE FROM image_cache_blobs WHERE hash = ?", [(h,) for h in evicted])
+            return evicted
+
+        return await self._write(query)
+
+
+REMINDER_INSERT = "INSERT INTO reminders (user_id, channel_id, label, remind_at, next_fire_at, recurrence, send_dm) VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+
+def _commits_before(path, commits):
+    # what the cogs did before: their own connection, default rollback journal, a commit after every statement
+    conn = sqlite3.connect(path)
+    with open('./utils/database/sql/reminder.sql', 'r') as f:
+        conn.executescript(f.read())
+
+    started = time.perf_counter()
+    for i in range(commits):
+        conn.execute(REMINDER_INSERT, (i, 1, "benchmark", 0, 0, None, 0))
+        conn.commit()
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return commits / elapsed
+
+
+async def _commits_after(path, commits, concurrency):
+    db = DBManager(path, legacy_paths=())
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            await db.insert_reminder(i, 1, "benchmark", 0, None, 0)
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(commits)))
+        return commits / (time.perf_counter() - started)
+    finally:
+        db.close()
+
+
+async def _load_test(handle, rate, seconds):
+    """Starts handle(i) rate times a minute, returns the p99 latency from arrival to completion and the worst heartbeat lag."""
+    loop = asyncio.get_running_loop()
+    latencies = []
+    lags = []
+
+    async def heartbeat():
+        # stands in for the gateway heartbeat, any time the loop is blocked shows up as lag
+        while True:
+            started = loop.time()
+            await asyncio.sleep(0.01)
+            lags.append(loop.time() - started - 0.01)
+
+    async def one(i, arrived):
+        await handle(i)
+        latencies.append(loop.time() - arrived)
+
+    beat = asyncio.create_task(heartbeat())
+    tasks = []
+    start = loop.time()
+    for i in range(int(rate / 60 * seconds)):
+        arrival = start + i * 60 / rate
+        await asyncio.sleep(max(0.0, arrival - loop.time()))
+        tasks.append(asyncio.create_task(one(i, arrival)))
+    await asyncio.gather(*tasks)
+    beat.cancel()
+
+    return statistics.quantiles(latencies, n=100)[98], max(lags)
+
+
+async def _latency_before(path, rate, seconds):
+    # the old DBManager: one shared connection, blocking calls on the event loop thread
+    conn = sqlite3.connect(path)
+    with open('./utils/database/sql/reminder.sql', 'r') as f:
+        conn.executescript(f.read())
+
+    async def handle(i):
+        conn.execute("SELECT * FROM reminders WHERE user_id = ?", (i % 100,)).fetchall()
+        conn.execute(REMINDER_INSERT, (i % 100, 1, "benchmark", 0, 0, None, 0))
+        conn.commit()
+
+    try:
+        return await _load_test(handle, rate, seconds)
+    finally:
+        conn.close()
+
+
+async def _latency_after(path, rate, seconds):
+    db = DBManager(path, legacy_paths=())
+
+    async def handle(i):
+        await db.fetch_all_user_reminders(i % 100)
+        await db.insert_reminder(i % 100, 1, "benchmark", 0, None, 0)
+
+    try:
+        return await _load_test(handle, rate, seconds)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the old synchronous connections against DBManager")
+    parser.add_argument("benchmark", nargs="?", choices=("commits", "latency"), default="commits")
+    parser.add_argument("--commits", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent writers for DBManager")
+    parser.add_argument("--rate", type=int, default=6000, help="interactions per minute for the latency load test")
+    parser.add_argument("--seconds", type=float, default=20.0, help="duration of the latency load test")
+    parser.add_argument("--dir", default=None, help="directory for the scratch databases, defaults to a temporary one")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        before_path, after_path = os.path.join(directory, "before.db"), os.path.join(directory, "after.db")
+        if args.benchmark == "commits":
+            before = _commits_before(before_path, args.commits)
+            after = asyncio.run(_commits_after(after_path, args.commits, args.concurrency))
+            print(f"per-cog connections, rollback journal: {before:>8,.0f} commits/s")
+            print(f"DBManager, WAL + synchronous=NORMAL:    {after:>8,.0f} commits/s")
+        else:
+            print(f"{args.rate:,} interactions/min for {args.seconds:.0f}s, each one read and one write")
+            for name, run, path in (("blocking sqlite3", _latency_before, before_path), ("DBManager", _latency_after, after_path)):
+                p99, lag = asyncio.run(run(path, args.rate, args.seconds))
+                print(f"{name:17} p99 {p99 * 1000:7.2f} ms   worst heartbeat lag {lag * 1000:7.2f} ms")
@@ -0,0 +1,4 @@
+CREATE TABLE IF NOT EXISTS autotranslate_users(
+    user_id INTEGER PRIMARY KEY,
+    mode TEXT NOT NULL
+);
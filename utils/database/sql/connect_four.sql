@@ -4,15 +4,38 @@ CREATE TABLE IF NOT EXISTS connect_four (
     player2_id INTEGER NOT NULL,
     turn INTEGER NOT NULL,
     selected_column INTEGER DEFAULT 1,
-    grid TEXT NOT NULL,
+    player1_bits INTEGER NOT NULL DEFAULT 0,
+    player2_bits INTEGER NOT NULL DEFAULT 0,
     message_id INTEGER NOT NULL,
-    channel_id INTEGER NOT NULL
+    channel_id INTEGER NOT NULL,
+    difficulty TEXT
 );
 
+CREATE INDEX IF NOT EXISTS idx_connect_four_message_id ON connect_four (message_id);
+
 CREATE TABLE IF NOT EXISTS connect_four_user (
     id INTEGER PRIMARY KEY,
     rating INTEGER NOT NULL DEFAULT 100,
     games_played INTEGER NOT NULL DEFAULT 0,
     wins INTEGER NOT NULL DEFAULT 0,
-    losses INTEGER NOT NULL DEFAULT 0
+    losses INTEGER NOT NULL DEFAULT 0,
+    glicko_rating REAL NOT NULL DEFAULT 1500,
+    glicko_rd REAL NOT NULL DEFAULT 350,
+    glicko_volatility REAL NOT NULL DEFAULT 0.06
+);
+
+CREATE INDEX IF NOT EXISTS idx_connect_four_user_rating ON connect_four_user (rating DESC, id);
+
+CREATE TABLE IF NOT EXISTS connect_four_history (
+    id INTEGER PRIMARY KEY,
+    player1_id INTEGER NOT NULL,
+    player2_id INTEGER NOT NULL,
+    result REAL NOT NULL,
+    played_at INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS connect_four_rating_period (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    last_game_id INTEGER NOT NULL DEFAULT 0,
+    processed_at INTEGER
 );
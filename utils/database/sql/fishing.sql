@@ -0,0 +1,28 @@
+CREATE TABLE IF NOT EXISTS fish_user(
+    id INTEGER PRIMARY KEY,
+    level INTEGER DEFAULT 1,
+    xp INTEGER DEFAULT 0,
+    max_xp INTEGER DEFAULT 100,
+    money INTEGER DEFAULT 0,
+    current_biome TEXT DEFAULT 'river'
+);
+
+CREATE TABLE IF NOT EXISTS fish_inventory(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    item_id INTEGER,
+    user_id INTEGER,
+    quantity INTEGER,
+    UNIQUE(item_id, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS fish_equipment(
+    user_id INTEGER NOT NULL,
+    slot TEXT NOT NULL,
+    item_id INTEGER,
+    PRIMARY KEY (user_id, slot)
+);
+
+CREATE TABLE IF NOT EXISTS fish_journal_state(
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    seq INTEGER NOT NULL
+);
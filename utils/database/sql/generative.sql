@@ -4,11 +4,33 @@ CREATE TABLE IF NOT EXISTS generator_message_cache(
     content TEXT NOT NULL
 );
 
+CREATE INDEX IF NOT EXISTS idx_generator_message_cache_channel ON generator_message_cache (channel_id);
+
+CREATE TABLE IF NOT EXISTS generator_ngrams(
+    channel_id INTEGER NOT NULL,
+    w1 TEXT NOT NULL,
+    w2 TEXT NOT NULL,
+    w3 TEXT NOT NULL,
+    w4 TEXT NOT NULL,
+    w5 TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (channel_id, w1, w2, w3, w4, w5)
+) WITHOUT ROWID;
+
 CREATE TABLE IF NOT EXISTS guild_generative_config(
     id INTEGER PRIMARY KEY,
     enabled BOOLEAN NOT NULL,
     temperature REAL NOT NULL,
     max_words INTEGER NOT NULL,
     auto_cache BOOLEAN NOT NULL,
-    message_probability REAL NOT NULL
-);
\ No newline at end of file
+    message_probability REAL NOT NULL,
+    ngram_order INTEGER NOT NULL DEFAULT 3
+);
+
+CREATE TABLE IF NOT EXISTS generator_ingest_jobs(
+    channel_id INTEGER PRIMARY KEY,
+    last_message_id INTEGER,
+    ingested INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    updated_at INTEGER NOT NULL
+);
@@ -0,0 +1,17 @@
+CREATE TABLE IF NOT EXISTS image_cache_blobs(
+    hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    accessed_at INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_image_cache_blobs_accessed_at ON image_cache_blobs (accessed_at);
+
+CREATE TABLE IF NOT EXISTS image_cache_urls(
+    url TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    expires_at INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_image_cache_urls_hash ON image_cache_urls (hash);
@@ -5,5 +5,22 @@ CREATE TABLE IF NOT EXISTS reminders (
     label TEXT,
     remind_at INTEGER,
     daily_time TEXT,
-    send_dm BOOLEAN
+    send_dm BOOLEAN,
+    next_fire_at INTEGER,
+    recurrence TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_reminders_next_fire_at ON reminders (next_fire_at);
+
+CREATE TABLE IF NOT EXISTS reminder_dead_letters (
+    id INTEGER PRIMARY KEY,
+    reminder_id INTEGER,
+    user_id INTEGER,
+    channel_id INTEGER,
+    label TEXT,
+    send_dm BOOLEAN,
+    scheduled_at INTEGER,
+    failed_at INTEGER,
+    attempts INTEGER,
+    error TEXT
 );
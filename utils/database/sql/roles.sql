@@ -0,0 +1,13 @@
+CREATE TABLE IF NOT EXISTS custom_roles(
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER,
+    guild_id INTEGER,
+    name TEXT,
+    color TEXT
+);
+
+CREATE TABLE IF NOT EXISTS role_settings(
+    guild_id INTEGER PRIMARY KEY,
+    enabled INTEGER DEFAULT 0,
+    whitelisted_role_ids TEXT DEFAULT NULL
+);
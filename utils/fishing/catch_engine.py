@@ -0,0 +1,167 @@
+import argparse
+import bisect
+import random
+import time
+
+import numpy as np
+
+RARITY_LEVELS = [6, 5, 4, 3, 2, 1]
+RARITY_WEIGHTS = [1, 4, 20, 65, 195, 360]
+
+
+class CatchEngine:
+    """
+    Draws catches from flattened loot tables.
+
+    Every loot pool of a biome is flattened into one array of item ids with an
+    offset/size table indexed by [is_crate, rarity]. Batches (cast_many) are
+    resolved with a handful of NumPy operations instead of a Python loop per
+    lure; a single /fish cast is only a few rolls, too few to pay for NumPy's
+    per-call overhead, so cast() walks the same tables in plain Python.
+    """
+
+    def __init__(self, registry, crate_chance=0.1, min_crate_rarity=3, rarity_levels=RARITY_LEVELS, rarity_weights=RARITY_WEIGHTS, seed=None):
+        self.registry = registry
+        self.crate_chance = crate_chance
+        self.min_crate_rarity = min_crate_rarity
+        self.rng = np.random.default_rng(seed)
+        self.random = random.Random(seed)
+
+        self.rarity_levels = np.asarray(rarity_levels)
+        self.cumulative_weights = np.cumsum(rarity_weights) / sum(rarity_weights)
+        self.cumulative_weights[-1] = 1.0
+        self._rarity_list = self.rarity_levels.tolist()
+        self._cumulative_list = self.cumulative_weights.tolist()
+        self.max_rarity = max(max(rarity_levels), max((item['rarity'] for item in registry), default=0))
+
+        self._tables = {}
+        self._list_tables = {}  # biome -> the table as lists, for cast()
+
+
+    def table(self, biome: str):
+        """Returns (item_ids, offsets, sizes) for a biome, building it on first use."""
+        table = self._tables.get(biome)
+        if table is None:
+            item_ids = []
+            offsets = np.zeros((2, self.max_rarity + 1), dtype=np.int64)
+            sizes = np.zeros((2, self.max_rarity + 1), dtype=np.int64)
+
+            for is_crate, (item_type, pool_biome) in enumerate((("fish", biome), ("crate", None))):
+                for rarity in range(self.max_rarity + 1):
+                    pool = self.registry.pool(item_type, rarity, pool_biome)
+                    offsets[is_crate, rarity] = len(item_ids)
+                    sizes[is_crate, rarity] = len(pool)
+                    item_ids.extend(item['id'] for item in pool)
+
+            table = (np.asarray(item_ids, dtype=np.int64), offsets, sizes)
+            self._tables[biome] = table
+        return table
+
+
+    def roll_lures(self, casts: int, max_lure: int = 5) -> np.ndarray:
+        # triangular distribution of lures
+        return self.rng.integers(1, max_lure + 1, casts) + self.rng.integers(1, max_lure + 1, casts) // 2
+
+
+    def roll_lure(self, max_lure: int = 5) -> int:
+        return self.random.randint(1, max_lure) + self.random.randint(1, max_lure) // 2
+
+
+    def draw(self, biome: str, rolls: int):
+        """
+        Draws `rolls` catches in one batch. Returns (item_ids, rarities) of the
+        rolls that hit a non-empty pool; rolls without a matching item are dropped.
+        """
+        item_ids, offsets, sizes = self.table(biome)
+
+        # one draw for the rarity, crate flag and pick of every roll
+        rarity_draws, crate_draws, pick_draws = self.rng.random((3, rolls))
+        rarities = self.rarity_levels[np.searchsorted(self.cumulative_weights, rarity_draws, side='right')]
+        crates = crate_draws < self.crate_chance
+        rarities = np.where(crates, np.maximum(self.min_crate_rarity, rarities), rarities)
+
+        is_crate = crates.astype(np.int64)
+        pool_sizes = sizes[is_crate, rarities]
+        hits = pool_sizes > 0
+
+        picks = offsets[is_crate, rarities][hits] + (pick_draws[hits] * pool_sizes[hits]).astype(np.int64)
+        return item_ids[picks], rarities[hits]
+
+
+    def cast(self, biome: str, lures: int):
+        """One cast, drawn like draw() but as (item_ids, rarities) lists of ints."""
+        tables = self._list_tables.get(biome)
+        if tables is None:
+            tables = self._list_tables[biome] = tuple(array.tolist() for array in self.table(biome))
+        item_ids, offsets, sizes = tables
+
+        rng = self.random
+        caught, rarities = [], []
+        for _ in range(lures):
+            rarity = self._rarity_list[bisect.bisect_right(self._cumulative_list, rng.random())]
+            is_crate = rng.random() < self.crate_chance
+            if is_crate:
+                rarity = max(self.min_crate_rarity, rarity)
+
+            size = sizes[is_crate][rarity]
+            if size:
+                caught.append(item_ids[offsets[is_crate][rarity] + int(rng.random() * size)])
+                rarities.append(rarity)
+        return caught, rarities
+
+
+    def cast_many(self, biome: str, casts: int, max_lure: int = 5) -> dict:
+        """
+        Simulates many casts at once (auto-fishing, events) and returns the
+        total number caught per item id.
+        """
+        item_ids, _ = self.draw(biome, int(self.roll_lures(casts, max_lure).sum()))
+        counts = np.bincount(item_ids)
+        return {int(item_id): int(counts[item_id]) for item_id in np.flatnonzero(counts)}
+
+
+def _scalar_cast(registry, biome, crate_chance=0.1, max_lure=5):
+    # the per-lure loop /fish used before, with indexed pools so only the drawing differs
+    lures = random.randint(1, max_lure) + random.randint(1, max_lure) // 2
+    catches = []
+    for _ in range(lures):
+        rarity = random.choices(RARITY_LEVELS, RARITY_WEIGHTS)[0]
+        if random.random() < crate_chance:
+            pool = registry.pool("crate", max(3, rarity))
+        else:
+            pool = registry.pool("fish", rarity, biome)
+        if pool:
+            catches.append(random.choice(pool)['id'])
+    return catches
+
+
+if __name__ == "__main__":
+    from utils.fishing.registry import ItemRegistry
+
+    parser = argparse.ArgumentParser(description="Casts per second of the scalar catch loop against CatchEngine")
+    parser.add_argument("--casts", type=int, default=100_000)
+    parser.add_argument("--biome", default="river")
+    args = parser.parse_args()
+
+    registry = ItemRegistry.load()
+    engine = CatchEngine(registry, seed=0)
+    engine.table(args.biome)
+
+    started = time.perf_counter()
+    for _ in range(args.casts):
+        _scalar_cast(registry, args.biome)
+    scalar = args.casts / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for _ in range(args.casts):
+        engine.cast(args.biome, engine.roll_lure())
+    vectorized = args.casts / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    engine.cast_many(args.biome, args.casts)
+    batched = args.casts / (time.perf_counter() - started)
+
+    print(f"{len(registry)} items, {args.casts:,} casts in {args.biome}")
+    print(f"scalar loop, one cast per call    {scalar:>14,.0f} casts/s")
+    print(f"CatchEngine.cast, one per call    {vectorized:>14,.0f} casts/s")
+    print(f"CatchEngine.cast_many, one batch  {batched:>14,.0f} casts/s")
@@ -0,0 +1,261 @@
+import asyncio
+import json
+import os
+from collections import OrderedDict, Counter
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_PLAYER = {"level": 1, "xp": 0, "max_xp": 100, "money": 0, "current_biome": "river"}
+
+JOURNAL_PATH = "data/fishing_journal.jsonl"
+LEGACY_JOURNAL_PATH = "fishing_journal.jsonl"
+
+
+class PlayerCache:
+    """
+    Write-behind cache of fish_user rows and inventory deltas.
+
+    /fish only updates memory and appends a line to the journal; dirty players
+    and pending item deltas are written to the database in one transaction by
+    flush(). Every journal entry carries a sequence number and the last flushed
+    sequence is committed with the flush, so replaying the journal after a
+    crash never applies an entry twice. Clean players are evicted LRU-first
+    once the cache is over capacity.
+    """
+
+    def __init__(self, db, journal_path=JOURNAL_PATH, capacity=5000, logger=None):
+        self.db = db
+        self.journal_path = journal_path
+        self.capacity = capacity
+        self.logger = logger
+
+        self._players = OrderedDict()
+        self._dirty = set()
+        self._deltas = {}  # user_id -> Counter of item_id -> quantity
+        self._owned = OrderedDict()  # user_id -> set of item ids with a positive quantity, for autocomplete
+
+        # what a running flush is writing, still pending for readers until the transaction commits
+        self._in_flight_players = set()
+        self._in_flight = {}  # user_id -> Counter of item_id -> quantity
+        self._flushing = None  # future of the running flush write
+        self._flushes = 0
+
+        self._seq = 0
+        self._flush_lock = asyncio.Lock()
+        self._journal_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fish-journal")
+        self._journal = None
+
+
+    async def start(self):
+        """Replays whatever the previous run left in the journal, then opens it for appending."""
+        last_flushed = await self.db.fish_fetch_journal_seq()
+        self._seq = last_flushed
+
+        directory = os.path.dirname(self.journal_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # journals used to be written to the working directory
+        if not os.path.exists(self.journal_path) and os.path.exists(LEGACY_JOURNAL_PATH):
+            os.replace(LEGACY_JOURNAL_PATH, self.journal_path)
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # torn last line from a crash
+
+                    self._seq = max(self._seq, entry["seq"])
+                    if entry["seq"] <= last_flushed:
+                        continue
+
+                    user_id = entry["user"]
+                    self._players[user_id] = entry["player"]
+                    self._dirty.add(user_id)
+                    self._deltas.setdefault(user_id, Counter()).update({int(k): v for k, v in entry["items"].items()})
+
+            if self._dirty and self.logger:
+                self.logger.info(f"Replaying fishing journal for {len(self._dirty)} players")
+
+        await self.flush()
+
+
+    async def close(self):
+        await self.flush()
+        self._journal_executor.shutdown(wait=True)
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+
+
+    async def get(self, user_id: int) -> dict:
+        player = self._players.get(user_id)
+        if player is None:
+            row = await self.db.fish_fetch_user(user_id)
+            player = dict(row) if row else dict(DEFAULT_PLAYER)
+            player.pop("id", None)
+
+            # another command may have loaded the player while we were waiting on the database
+            player = self._players.setdefault(user_id, player)
+
+        self._players.move_to_end(user_id)
+        self._evict(keep=user_id)
+        return player
+
+
+    def update(self, user_id: int, item_counts: dict = None, **changes):
+        """Applies changes to a cached player (see get) and records them in the journal."""
+        player = self._players[user_id]
+        player.update(changes)
+        self._dirty.add(user_id)
+
+        if item_counts:
+            self._deltas.setdefault(user_id, Counter()).update(item_counts)
+            owned = self._owned.get(user_id)
+            if owned is not None:
+                owned.update(item_id for item_id, quantity in item_counts.items() if quantity > 0)
+
+        self._seq += 1
+        entry = {"seq": self._seq, "user": user_id, "player": player, "items": dict(item_counts or {})}
+        asyncio.get_running_loop().run_in_executor(self._journal_executor, self._append, json.dumps(entry))
+
+
+    def pending_items(self, user_id: int) -> Counter:
+        """Item deltas of a player that are not committed yet, including those a running flush is writing."""
+        pending = Counter(self._deltas.get(user_id, ()))
+        pending.update(self._in_flight.get(user_id, ()))
+        return pending
+
+
+    async def _read_with_pending(self, user_id, read):
+        """(await read(), pending_items) where the database rows and the pending deltas never overlap or miss each other."""
+        while True:
+            flushing, flushes = self._flushing, self._flushes
+            rows = await read()
+            if flushing is None and flushes == self._flushes:
+                return rows, self.pending_items(user_id)
+
+            # a flush ran during the read, the rows may or may not include what it wrote, so read again after it
+            running = flushing or self._flushing
+            if running is not None:
+                await asyncio.shield(running)
+
+
+    async def item_quantity(self, user_id: int, item_id: int) -> int:
+        """Quantity of an item in the database plus the player's unflushed deltas."""
+        quantity, pending = await self._read_with_pending(user_id, lambda: self.db.fish_fetch_item_quantity(user_id, item_id))
+        return (quantity or 0) + pending[item_id]
+
+
+    async def inventory(self, user_id: int) -> list:
+        """(item_id, quantity) pairs like fish_fetch_inventory, with the player's unflushed deltas merged in."""
+        rows, pending = await self._read_with_pending(user_id, lambda: self.db.fish_fetch_inventory(user_id))
+        counts = Counter({item_id: quantity for item_id, quantity in rows})
+        counts.update(pending)
+        return [(item_id, quantity) for item_id, quantity in counts.items() if quantity > 0]
+
+
+    async def flush_item(self, user_id: int, item_id: int):
+        """Flushes only if the item has unflushed deltas, for queries that check the stored quantity themselves."""
+        if self.pending_items(user_id)[item_id]:
+            await self.flush()
+
+
+    async def owned_items(self, user_id: int) -> set:
+        """Ids of the items a player holds, including unflushed catches. Cached until invalidate_owned."""
+        owned = self._owned.get(user_id)
+        if owned is None:
+            rows, pending = await self._read_with_pending(user_id, lambda: self.db.fish_fetch_inventory(user_id))
+            owned = {item_id for item_id, quantity in rows if quantity > 0}
+            owned.update(item_id for item_id, quantity in pending.items() if quantity > 0)
+            owned = self._owned.setdefault(user_id, owned)
+
+        self._owned.move_to_end(user_id)
+        while len(self._owned) > self.capacity:
+            self._owned.popitem(last=False)
+        return owned
+
+
+    def invalidate_owned(self, user_id: int):
+        """Call after anything that removes items from a player's inventory."""
+        self._owned.pop(user_id, None)
+
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+
+            seq = self._seq
+            players = []
+            for user_id in self._dirty:
+                player = self._players[user_id]
+                players.append((user_id, player["level"], player["xp"], player["max_xp"], player["current_biome"]))
+            items = [
+                (item_id, user_id, quantity)
+                for user_id, counts in self._deltas.items()
+                for item_id, quantity in counts.items() if quantity
+            ]
+            self._in_flight_players, self._in_flight = self._dirty, self._deltas
+            self._dirty, self._deltas = set(), {}
+            self._flushing = asyncio.get_running_loop().create_future()
+            self._flushes += 1
+
+            try:
+                await self.db.fish_flush(players, items, seq)
+            except Exception:
+                # put everything back so the next flush retries it
+                self._dirty |= self._in_flight_players
+                for user_id, counts in self._in_flight.items():
+                    self._deltas.setdefault(user_id, Counter()).update(counts)
+                raise
+            finally:
+                self._in_flight_players, self._in_flight = set(), {}
+                self._flushing.set_result(None)
+                self._flushing = None
+
+            # entries up to seq are in the database now, start a fresh journal
+            await asyncio.get_running_loop().run_in_executor(self._journal_executor, self._truncate, seq)
+            self._evict()
+
+
+    def _evict(self, keep=None):
+        while len(self._players) > self.capacity:
+            for user_id in self._players:
+                if user_id != keep and user_id not in self._dirty and user_id not in self._deltas and user_id not in self._in_flight_players:
+                    del self._players[user_id]
+                    break
+            else:
+                return  # everything is dirty, wait for the next flush
+
+
+    def _append(self, line: str):
+        if self._journal is None:
+            self._journal = open(self.journal_path, "a")
+        self._journal.write(line + "\n")
+        # reaches the OS page cache, which survives the process crashing
+        self._journal.flush()
+
+
+    def _truncate(self, seq: int):
+        # keep entries written after the flush snapshot was taken
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+
+        if not os.path.exists(self.journal_path):
+            return
+
+        remaining = []
+        with open(self.journal_path, "r") as f:
+            for line in f:
+                try:
+                    if json.loads(line)["seq"] > seq:
+                        remaining.append(line)
+                except json.JSONDecodeError:
+                    continue
+
+        tmp_path = f"{self.journal_path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.writelines(remaining)
+        os.replace(tmp_path, self.journal_path)
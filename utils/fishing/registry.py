@@ -0,0 +1,197 @@
+import argparse
+import bisect
+import json
+import random
+import time
+from collections import defaultdict
+
+
+class ItemRegistry:
+    """
+    Fishing items from items.json, indexed once at load time.
+
+    Items can be looked up by id, by internal name, by name prefix, and as
+    pools keyed by (type, rarity, biome) for loot rolls. A pool keyed with
+    biome None holds every item of that type and rarity regardless of biome.
+    """
+
+    def __init__(self, items: list):
+        self.items = items
+
+        self.by_id = {}
+        self.by_internal_name = {}
+        self.pools = defaultdict(list)
+
+        for item in items:
+            self.by_id[item['id']] = item
+            self.by_internal_name[item['internal_name']] = item
+            self.pools[(item['type'], item['rarity'], None)].append(item)
+            # a biome-less item is already in the None pool, listing it twice would double its odds
+            if item['biome'] is not None:
+                self.pools[(item['type'], item['rarity'], item['biome'])].append(item)
+
+        # sorted lowercase names (and every word of them) for prefix lookups with bisect
+        self._names = sorted((item['name'].lower(), item['id']) for item in items)
+        self._name_keys = [name for name, _ in self._names]
+        self._words = sorted((word, item['id']) for item in items for word in item['name'].lower().split()[1:])
+        self._word_keys = [word for word, _ in self._words]
+
+
+    @classmethod
+    def load(cls, path="data/fishing/items.json"):
+        with open(path, "r") as f:
+            return cls(json.load(f))
+
+
+    def __len__(self):
+        return len(self.items)
+
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+    def get(self, item_id: int) -> dict:
+        return self.by_id.get(item_id)
+
+
+    def get_by_name(self, item_name: str) -> dict:
+        return self.by_internal_name.get(item_name.lower().replace(" ", "_"))
+
+
+    def pool(self, item_type: str, rarity: int, biome: str = None) -> list:
+        return self.pools.get((item_type, rarity, biome), [])
+
+
+    def with_prefix(self, prefix: str, limit: int = 25) -> list:
+        return [self.by_id[item_id] for item_id in self._prefix_ids(self._names, self._name_keys, prefix.lower(), limit)]
+
+
+    def search(self, query: str, limit: int = 25, allowed_ids=None) -> list:
+        """
+        Ranked item search for autocomplete: name prefix first, then prefix of a
+        later word, then substring, then fuzzy (the query's letters in order).
+        Only items in allowed_ids are returned when it is given.
+        """
+        query = query.lower().strip()
+
+        if allowed_ids is not None:
+            # a player's inventory is small, ranking it directly beats filtering the whole index
+            entries = sorted((self.by_id[item_id]['name'].lower(), item_id) for item_id in allowed_ids if item_id in self.by_id)
+            return [self.by_id[item_id] for item_id in self._rank(query, entries, limit)]
+
+        if not query:
+            return [self.by_id[item_id] for _, item_id in self._names[:limit]]
+
+        matched = {}  # dicts keep insertion order, which is the ranking
+        for entries, keys in ((self._names, self._name_keys), (self._words, self._word_keys)):
+            for item_id in self._prefix_ids(entries, keys, query, limit):
+                matched.setdefault(item_id, None)
+            if len(matched) >= limit:
+                return [self.by_id[item_id] for item_id in list(matched)[:limit]]
+
+        # the linear scans only run when the indexed lookups didn't fill the page
+        for item_id in self._rank(query, self._names, limit - len(matched), exclude=matched):
+            matched.setdefault(item_id, None)
+
+        return [self.by_id[item_id] for item_id in matched]
+
+
+    def _rank(self, query, entries, limit, exclude=()):
+        buckets = ([], [], [], [])
+        for name, item_id in entries:
+            if item_id in exclude:
+                continue
+            if name.startswith(query):
+                buckets[0].append(item_id)
+            elif any(word.startswith(query) for word in name.split()[1:]):
+                buckets[1].append(item_id)
+            elif query in name:
+                buckets[2].append(item_id)
+            elif self._is_subsequence(query, name):
+                buckets[3].append(item_id)
+
+            if len(buckets[0]) >= limit:
+                break
+
+        return [item_id for bucket in buckets for item_id in bucket][:limit]
+
+
+    def _prefix_ids(self, entries, keys, prefix, limit):
+        start = bisect.bisect_left(keys, prefix)
+        stop = min(bisect.bisect_left(keys, prefix + "\uffff"), start + limit)
+        return [item_id for _, item_id in entries[start:stop]]
+
+
+    @staticmethod
+    def _is_subsequence(query: str, name: str) -> bool:
+        chars = iter(name)
+        return all(char in chars for char in query if char != " ")
+
+
+def _synthetic_items(count, seed=0):
+    rng = random.Random(seed)
+    biomes = ["river", "lake", "ocean", "jungle", "cave", "volcano", "sky", "space"]
+    syllables = ["ca", "rp", "sal", "mon", "tu", "na", "pi", "ke", "bass", "ee", "l", "gar", "cod", "fin", "ray"]
+    items = []
+    for item_id in range(1, count + 1):
+        name = " ".join("".join(rng.choices(syllables, k=rng.randint(1, 3))).capitalize() for _ in range(rng.randint(1, 3)))
+        is_crate = rng.random() < 0.05
+        items.append({
+            "id": item_id, "internal_name": f"{name.lower().replace(' ', '_')}_{item_id}", "name": name,
+            "type": "crate" if is_crate else "fish", "rarity": rng.randint(1, 6), "value": rng.randint(1, 50),
+            "biome": None if is_crate else rng.choice(biomes),
+        })
+    return items
+
+
+def _timed(fn, calls):
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return calls / (time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Linear registry scans against the ItemRegistry index")
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--calls", type=int, default=2_000)
+    args = parser.parse_args()
+
+    items = _synthetic_items(args.items)
+    started = time.perf_counter()
+    registry = ItemRegistry(items)
+    print(f"{args.items:,} items, index built in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    rng = random.Random(1)
+    sample = [rng.choice(items) for _ in range(args.calls)]
+    rolls = iter(sample * 2)
+
+    def scan_pool():
+        item = next(rolls)
+        return [i for i in items if i['rarity'] == item['rarity'] and i['biome'] == item['biome'] and i['type'] == item['type']]
+
+    def scan_id():
+        item_id = next(rolls)['id']
+        return next((i for i in items if i['id'] == item_id), None)
+
+    def scan_name():
+        name = next(rolls)['internal_name']
+        return next((i for i in items if i['internal_name'] == name), None)
+
+    def scan_prefix():
+        prefix = next(rolls)['name'][:3].lower()
+        return [i for i in items if i['name'].lower().startswith(prefix)][:25]
+
+    benchmarks = [
+        ("loot pool", scan_pool, lambda: registry.pool((item := next(rolls))['type'], item['rarity'], item['biome'])),
+        ("by id", scan_id, lambda: registry.get(next(rolls)['id'])),
+        ("by internal name", scan_name, lambda: registry.get_by_name(next(rolls)['internal_name'])),
+        ("name prefix", scan_prefix, lambda: registry.with_prefix(next(rolls)['name'][:3])),
+    ]
+    for name, scan, indexed in benchmarks:
+        rolls = iter(sample * 2)
+        before = _timed(scan, args.calls)
+        rolls = iter(sample * 2)
+        after = _timed(indexed, args.calls)
+        print(f"{name:17} scan {before:>12,.0f}/s   index {after:>12,.0f}/s   {after / before:>8,.0f}x")
@@ -0,0 +1,43 @@
+from utils.generative.model import DEFAULT_ORDER
+
+
+DEFAULT_GUILD_CONFIG = {
+    "enabled": False,
+    "temperature": 1.0,
+    "max_words": 50,
+    "auto_cache": False,
+    "message_probability": 0.01,
+    "ngram_order": DEFAULT_ORDER
+}
+
+
+class GuildConfigCache:
+    """
+    Generative settings per guild, read from the database once.
+
+    Guilds without a stored row get the defaults without anything being
+    written; a row is only created when a setting is changed through update().
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._configs = {}
+
+
+    def cached(self, guild_id: int) -> dict:
+        return self._configs.get(guild_id)
+
+
+    async def get(self, guild_id: int) -> dict:
+        config = self._configs.get(guild_id)
+        if config is None:
+            row = await self.db.gen_fetch_guild_config(guild_id)
+            config = dict(row) if row else {"id": guild_id, **DEFAULT_GUILD_CONFIG}
+            # another message may have loaded it while we were waiting on the database
+            config = self._configs.setdefault(guild_id, config)
+        return config
+
+
+    async def update(self, guild_id: int, option: str, value):
+        await self.db.gen_update_guild_config(guild_id, option, value)
+        self._configs.pop(guild_id, None)
@@ -0,0 +1,151 @@
+import asyncio
+import time
+
+import discord
+
+# messages per channel.history request
+PAGE_SIZE = 100
+
+
+class RateBudget:
+    """Token bucket shared by every ingestion job, one token per history page."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class HistoryIngestor:
+    """
+    Streams channel history into the generator cache.
+
+    Messages are written in batches, each batch in one transaction together
+    with the job's progress, so an interrupted job resumes after the last
+    stored batch. A few channels are ingested at once and share one page
+    request budget.
+    """
+
+    def __init__(self, db, models, logger, batch_size=2000, concurrency=3, pages_per_second=4.0):
+        self.db = db
+        self.models = models
+        self.logger = logger
+        self.batch_size = batch_size
+
+        self.budget = RateBudget(pages_per_second, pages_per_second * 2)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._running = {}  # channel_id -> task
+
+
+    def is_running(self, channel_id: int) -> bool:
+        return channel_id in self._running
+
+
+    async def ingest(self, channel, forced=False, progress=None, progress_interval=5.0) -> int:
+        """
+        Caches the channel's history and returns how many messages were added.
+        progress(count) is awaited at most every progress_interval seconds.
+        Joins the running job if the channel is already being ingested.
+        """
+        task = self._running.get(channel.id)
+        if task is None:
+            task = asyncio.create_task(self._run(channel, forced, progress, progress_interval))
+            self._running[channel.id] = task
+            task.add_done_callback(lambda _: self._running.pop(channel.id, None))
+        return await asyncio.shield(task)
+
+
+    async def resume(self, bot):
+        """Restarts the jobs an earlier run left unfinished."""
+        for job in await self.db.gen_fetch_running_ingest_jobs():
+            channel = bot.get_channel(job["channel_id"])
+            if channel is None:
+                continue
+
+            self.logger.info(f"Resuming message caching for channel {channel.id} ({job['ingested']} messages cached)")
+            asyncio.create_task(self._resume(channel))
+
+
+    async def _resume(self, channel):
+        try:
+            await self.ingest(channel)
+        except Exception:
+            pass  # logged and marked failed by _run
+
+
+    def stop(self):
+        for task in list(self._running.values()):
+            task.cancel()
+
+
+    async def _run(self, channel, forced, progress, progress_interval) -> int:
+        async with self._semaphore:
+            self.logger.debug(f"Starting message caching for channel: {channel.id}")
+
+            if forced:
+                self.logger.debug("Forced caching enabled, clearing existing cache for channel")
+                await self.db.gen_clear_channel_cache(channel.id)
+                self.models.invalidate(channel.id)
+
+            after_id = await self.db.gen_start_ingest_job(channel.id, forced)
+            after = discord.Object(id=after_id) if after_id else None
+            self.logger.debug(f"Fetching messages after: {after_id}")
+
+            ingested = 0
+            seen = 0
+            batch = []
+            last_id = after_id
+            last_report = time.monotonic()
+
+            try:
+                async for message in channel.history(limit=None, oldest_first=True, after=after):
+                    seen += 1
+                    if seen % PAGE_SIZE == 0:
+                        # the iterator requests the next page once this one is used up
+                        await self.budget.acquire()
+
+                    last_id = message.id
+                    if not message.author.bot:
+                        batch.append((message.id, message.content))
+
+                    if len(batch) >= self.batch_size:
+                        ingested += await self.db.gen_ingest_batch(channel.id, batch, last_id)
+                        batch = []
+
+                        if progress and time.monotonic() - last_report >= progress_interval:
+                            last_report = time.monotonic()
+                            await self._report(progress, ingested)
+
+                ingested += await self.db.gen_ingest_batch(channel.id, batch, last_id, done=True)
+            except Exception as e:
+                # left 'running' the job would be resumed, and fail again, on every start
+                self.logger.error(f"Message caching for channel {channel.id} failed after {ingested} messages: {e!r}")
+                await self.db.gen_fail_ingest_job(channel.id)
+                raise
+            finally:
+                # the loaded model missed everything written in batches
+                self.models.invalidate(channel.id)
+
+            self.logger.debug(f"Finished caching {ingested} messages for channel {channel.id}")
+            return ingested
+
+
+    async def _report(self, progress, count):
+        try:
+            await progress(count)
+        except Exception as e:
+            # interaction tokens expire after 15 minutes, the job itself keeps going
+            self.logger.debug(f"Could not report caching progress: {e}")
@@ -0,0 +1,408 @@
+import argparse
+import asyncio
+import bisect
+import random
+import re
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+URL_REGEX = re.compile(r'https?://\S+|www\.\S+')
+EMOJI_REGEX = re.compile(r'<a?:\w+:\d+>')
+WORD_REGEX = re.compile(r"[a-zA-Z0-9]+(?:'[a-zA-Z0-9]+)*")
+
+# padding before the first word of a message and after its last one, tokenize never produces either
+START = ""
+END = "\n"
+START_ID = 0
+END_ID = 1
+
+MIN_ORDER = 2
+MAX_ORDER = 5
+DEFAULT_ORDER = 3
+
+# stupid backoff penalty for dropping a context word (Brants et al., 2007)
+BACKOFF = 0.4
+
+
+def tokenize(text: str) -> list:
+    """Lowercased words of a message without links and custom emoji."""
+    text = URL_REGEX.sub('', text)
+    text = EMOJI_REGEX.sub('', text)
+    return WORD_REGEX.findall(text.lower())
+
+
+def ngrams(text: str):
+    """
+    The MAX_ORDER word windows ending at every word of a message and at its
+    end, padded with START. Every shorter n-gram is a suffix of one of them.
+    """
+    words = tokenize(text)
+    if not words:
+        return []
+    padded = [START] * (MAX_ORDER - 1) + words + [END]
+    return zip(*(padded[i:] for i in range(MAX_ORDER)))
+
+
+class CumulativeSampler:
+    """
+    Draws from a fixed discrete distribution by bisecting its cumulative weights.
+
+    Built with one numpy cumsum, which matters now that most contexts of a
+    higher order model are only sampled a few times, and a draw is a single
+    C bisect, faster in CPython than the two random calls of an alias table.
+    """
+
+    __slots__ = ("values", "cumulative", "total")
+
+    def __init__(self, values, weights):
+        self.values = values
+        self.cumulative = np.cumsum(weights).tolist()
+        self.total = self.cumulative[-1]
+
+
+    def sample(self):
+        return self.values[bisect.bisect(self.cumulative, random.random() * self.total)]
+
+
+class _Level:
+    """
+    All n-grams of one length as trie nodes.
+
+    A node's key packs its parent node (the n-gram without its last word) and
+    its last word id into one uint64. Keys are kept sorted, so the children
+    of a node are one contiguous slice found by binary search. Nodes added
+    since the last lookup of children wait in a small dict and are merged
+    in one pass.
+    """
+
+    __slots__ = ("keys", "ids", "counts", "size", "pending")
+
+    def __init__(self, keys=None, counts=None):
+        self.keys = np.empty(0, np.uint64) if keys is None else keys
+        self.ids = np.arange(len(self.keys), dtype=np.uint32)
+        self.counts = np.empty(0, np.uint32) if counts is None else counts
+        self.size = len(self.keys)
+        self.pending = {}  # key -> node id
+
+
+    @property
+    def nbytes(self):
+        return self.keys.nbytes + self.ids.nbytes + self.counts.nbytes
+
+
+    def find(self, key):
+        node = self.pending.get(key)
+        if node is not None:
+            return node
+
+        # a plain int would turn the keys into float64 for the comparison
+        i = int(self.keys.searchsorted(np.uint64(key)))
+        if i < len(self.keys) and self.keys[i] == key:
+            return int(self.ids[i])
+        return None
+
+
+    def add(self, key, count):
+        node = self.find(key)
+        if node is None:
+            node = self.size
+            if node == len(self.counts):
+                self.counts = np.concatenate((self.counts, np.zeros(max(node, 64), np.uint32)))
+            self.size += 1
+            self.pending[key] = node
+
+        self.counts[node] += count
+        return node
+
+
+    def children(self, node):
+        """(word ids, counts) of the n-grams extending a node of the level below, zero counts left out."""
+        self._merge()
+        lo, hi = self.keys.searchsorted(np.array([node << 32, (node + 1) << 32], np.uint64))
+        words = self.keys[lo:hi] & np.uint64(0xFFFFFFFF)
+        counts = self.counts[self.ids[lo:hi]]
+        if not counts.all():
+            seen = counts > 0
+            words, counts = words[seen], counts[seen]
+        return words, counts
+
+
+    def lookup(self, keys):
+        """Counts of n-grams that are known to exist."""
+        self._merge()
+        return self.counts[self.ids[self.keys.searchsorted(keys)]]
+
+
+    def _merge(self):
+        if not self.pending:
+            return
+
+        keys = np.fromiter(self.pending.keys(), np.uint64, len(self.pending))
+        ids = np.fromiter(self.pending.values(), np.uint32, len(self.pending))
+        order = np.argsort(keys)
+        at = np.searchsorted(self.keys, keys[order])
+        self.keys = np.insert(self.keys, at, keys[order])
+        self.ids = np.insert(self.ids, at, ids[order])
+        self.pending = {}
+
+
+class NGramModel:
+    """
+    N-gram counts of one channel (order 2 to 5) with stupid backoff.
+
+    Words are interned to integer ids and every n-gram length is one trie
+    level of flat numpy arrays, about 16 bytes per n-gram instead of a dict
+    of tuples to Counters. Sampling starts at the longest context and backs
+    off to a shorter one with the probability mass stupid backoff gives to
+    words the longer context never saw. Samplers are built lazily per
+    context and temperature and dropped whenever new messages are added.
+    """
+
+    def __init__(self, order=DEFAULT_ORDER):
+        self.order = order
+        self.words = [START, END]
+        self.vocabulary = {START: START_ID, END: END_ID}
+        self.levels = [_Level() for _ in range(order)]  # levels[i] holds the (i + 1)-grams
+        # lookups while sampling, all dropped when a message is added
+        self._nodes = {}  # context -> node or None
+        self._totals = {}  # context -> number of words seen after it
+        self._entries = {}  # (context, temperature) -> (sampler, backoff, seen) or None
+
+
+    @classmethod
+    def from_rows(cls, rows, order=DEFAULT_ORDER):
+        """Builds a model from stored (w1, ..., w<order>, count) rows in one vectorized pass per level."""
+        model = cls(order)
+        rows = list(rows)
+        if not rows:
+            return model
+
+        intern = model._intern
+        grams = np.fromiter((intern(word) for row in rows for word in row[:order]), np.uint64, len(rows) * order)
+        counts = np.fromiter((row[order] for row in rows), np.float64, len(rows))
+        model._build(grams.reshape(len(rows), order), counts)
+        return model
+
+
+    def __len__(self):
+        return self.levels[-1].size
+
+
+    @property
+    def nbytes(self):
+        return sum(level.nbytes for level in self.levels)
+
+
+    def add_message(self, text: str):
+        words = tokenize(text)
+        if not words:
+            return
+
+        ids = [START_ID] * (self.order - 1) + [self._intern(word) for word in words] + [END_ID]
+        for end in range(self.order - 1, len(ids)):
+            # every suffix of the window ending here occurred once more
+            for length in range(1, self.order + 1):
+                start = end - length + 1
+                node = 0
+                for i in range(length):
+                    node = self.levels[i].add((node << 32) | ids[start + i], 1 if i == length - 1 else 0)
+
+        self._nodes.clear()
+        self._totals.clear()
+        self._entries.clear()
+
+
+    def generate(self, max_words: int, temperature: float) -> list:
+        context = (START_ID,) * (self.order - 1)
+        output = []
+        while len(output) < max_words:
+            word = self.sample(context, temperature)
+            if word is None or word == END_ID:
+                break
+
+            output.append(self.words[word])
+            context = context[1:] + (word,)
+        return output
+
+
+    def sample(self, context: tuple, temperature: float):
+        """Next word id after a context of word ids, None if the model is empty."""
+        excluded = None
+        for length in range(len(context), -1, -1):
+            entry = self._entry(context[len(context) - length:], temperature)
+            if entry is None:
+                continue
+
+            sampler, backoff, seen = entry
+            if backoff and random.random() < backoff:
+                # only words this context never saw are left for the shorter one
+                excluded = seen
+                continue
+
+            for _ in range(8):
+                word = sampler.sample()
+                if excluded is None or word not in excluded:
+                    break
+            return word
+        return None
+
+
+    def _intern(self, word):
+        word_id = self.vocabulary.get(word)
+        if word_id is None:
+            word_id = self.vocabulary[word] = len(self.words)
+            self.words.append(word)
+        return word_id
+
+
+    def _build(self, grams, counts):
+        rows = len(grams)
+        zeros = np.zeros(rows)
+
+        # parents[start] is the node of grams[:, start:start + length - 1] on the level below
+        parents = [np.zeros(rows, np.uint64) for _ in range(self.order)]
+        for length in range(1, self.order + 1):
+            starts = range(self.order - length + 1)
+            keys = np.concatenate([(parents[start] << 32) | grams[:, start + length - 1] for start in starts])
+            # only the suffixes are counted, the other n-grams are the paths leading to them
+            weights = np.concatenate([counts if start == self.order - length else zeros for start in starts])
+
+            unique, inverse = np.unique(keys, return_inverse=True)
+            level_counts = np.bincount(inverse, weights=weights, minlength=len(unique)).astype(np.uint32)
+            self.levels[length - 1] = _Level(unique, level_counts)
+
+            for i, start in enumerate(starts):
+                parents[start] = inverse[i * rows:(i + 1) * rows].astype(np.uint64)
+
+
+    def _node(self, context):
+        node = self._nodes.get(context, -1)
+        if node == -1:
+            node = 0
+            if context:
+                parent = self._node(context[:-1])
+                node = None if parent is None else self.levels[len(context) - 1].find((parent << 32) | context[-1])
+            self._nodes[context] = node
+        return node
+
+
+    def _total(self, context):
+        total = self._totals.get(context)
+        if total is None:
+            total = self._totals[context] = int(self.levels[len(context)].children(self._node(context))[1].sum())
+        return total
+
+
+    def _entry(self, context, temperature):
+        key = (context, temperature)
+        if key in self._entries:
+            return self._entries[key]
+
+        entry = None
+        node = self._node(context)
+        if node is not None:
+            words, counts = self.levels[len(context)].children(node)
+            if len(words):
+                backoff = 0.0
+                if context and temperature > 0:
+                    # every word seen after the context was also seen after its suffix
+                    lower = np.uint64(self._node(context[1:])) << np.uint64(32)
+                    seen = self.levels[len(context) - 1].lookup(lower | words).sum()
+                    unseen = BACKOFF * (1 - seen / self._total(context[1:]))
+                    backoff = unseen / (1 + unseen)
+                entry = (self._build_sampler(words, counts, temperature), backoff, set(words.tolist()))
+
+        self._entries[key] = entry
+        return entry
+
+
+    @staticmethod
+    def _build_sampler(words, counts, temperature):
+        if temperature <= 0:
+            # deterministic (argmax)
+            return CumulativeSampler([int(words[np.argmax(counts)])], [1.0])
+
+        weights = counts
+        if temperature != 1.0:
+            # relative to the most common word, so tiny temperatures can't underflow every weight to zero
+            weights = np.power(counts / counts.max(), 1.0 / temperature)
+        return CumulativeSampler(words.tolist(), weights)
+
+
+class ModelCache:
+    """
+    LRU of channel models loaded from the stored n-gram counts.
+
+    Models are loaded once and then kept in step with new messages through
+    add_message, so generating never has to go back to the cached messages.
+    """
+
+    def __init__(self, db, capacity=64):
+        self.db = db
+        self.capacity = capacity
+        self._models = OrderedDict()
+
+
+    async def get(self, channel_id: int, order: int = DEFAULT_ORDER) -> NGramModel:
+        model = self._models.get(channel_id)
+        if model is None or model.order != order:
+            loaded = NGramModel.from_rows(await self.db.gen_fetch_ngrams(channel_id, order), order)
+            # another generation may have loaded it while we were waiting on the database
+            model = self._models.get(channel_id)
+            if model is None or model.order != order:
+                model = self._models[channel_id] = loaded
+
+        self._models.move_to_end(channel_id)
+        while len(self._models) > self.capacity:
+            self._models.popitem(last=False)
+        return model
+
+
+    def add_message(self, channel_id: int, text: str):
+        """Folds a newly cached message into the channel's model if it is loaded."""
+        model = self._models.get(channel_id)
+        if model is not None:
+            model.add_message(text)
+
+
+    def invalidate(self, channel_id: int):
+        self._models.pop(channel_id, None)
+
+
+async def _benchmark(path, channel_id, orders, max_words, seconds):
+    from utils.database.database import DBManager
+
+    db = DBManager(path, legacy_paths=())
+    try:
+        for order in orders:
+            rows = await db.gen_fetch_ngrams(channel_id, order)
+            started = time.perf_counter()
+            model = NGramModel.from_rows(rows, order)
+            built = time.perf_counter() - started
+
+            tokens = 0
+            started = time.perf_counter()
+            while time.perf_counter() - started < seconds:
+                tokens += len(model.generate(max_words, 1.0)) + 1
+            elapsed = time.perf_counter() - started
+
+            print(
+                f"order {order}: {len(rows):,} rows, {len(model.words):,} words, {sum(level.size for level in model.levels):,} n-grams, "
+                f"{model.nbytes / 2 ** 20:.1f} MiB, built in {built:.2f}s, {tokens / elapsed:,.0f} tokens/s"
+            )
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report the size and generation speed of a channel's n-gram model")
+    parser.add_argument("channel_id", type=int)
+    parser.add_argument("--db", default="data.db")
+    parser.add_argument("--order", type=int, nargs="+", default=list(range(MIN_ORDER, MAX_ORDER + 1)))
+    parser.add_argument("--max-words", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    asyncio.run(_benchmark(args.db, args.channel_id, args.order, args.max_words, args.seconds))
@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import inspect
+import os
+import re
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from utils.http.client import ResponseTooLarge
+
+MAX_AGE_REGEX = re.compile(r"max-age=(\d+)")
+
+
+@dataclass(frozen=True)
+class CachedImage:
+    hash: str
+    data: bytes
+
+
+class ImageCache:
+    """
+    Two-tier cache of downloaded images.
+
+    Bodies are stored by their sha256, in an in-memory LRU and as files on
+    disk, so an image behind several urls is kept once. The database maps
+    every url to its hash together with the ETag / Last-Modified the server
+    sent. While a url is fresh (Cache-Control max-age, default_ttl without
+    one) it is served without any network I/O; after that it is revalidated
+    with a conditional request. Both tiers have a byte budget and drop the
+    least recently used images first.
+
+    Results computed from an image (average color, petpet gif) are memoized
+    per content hash through derive(), within their own byte budget.
+    """
+
+    def __init__(self, db, http_client, logger, directory="data/cache/images", memory_budget=64 * 1024 * 1024,
+                 disk_budget=512 * 1024 * 1024, default_ttl=24 * 60 * 60, url_capacity=4096, derived_budget=16 * 1024 * 1024):
+        self.db = db
+        self.http_client = http_client
+        self.logger = logger
+        self.directory = directory
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.default_ttl = default_ttl
+        self.url_capacity = url_capacity
+        self.derived_budget = derived_budget
+
+        self._urls = OrderedDict()  # url -> (hash, etag, last_modified, expires_at)
+        self._blobs = OrderedDict()  # hash -> bytes
+        self._memory_size = 0
+        self._derived = OrderedDict()  # (hash, kind) -> (result, size)
+        self._derived_size = 0
+        self._fetching = {}  # url -> task
+
+        os.makedirs(directory, exist_ok=True)
+
+
+    async def get(self, url: str, max_size: int = None) -> CachedImage:
+        """
+        The image behind a url, raising aiohttp.ClientError if it has to be
+        downloaded and that fails, or ResponseTooLarge if it exceeds max_size.
+        """
+        entry = self._urls.get(url)
+        if entry is None:
+            row = await self.db.image_fetch_url(url)
+            if row is not None:
+                entry = self._remember(url, tuple(row))
+
+        image = None
+        if entry is not None and entry[3] > time.time():
+            image = await self._load(entry[0])
+
+        if image is None:
+            # concurrent requests for the same url share one download
+            task = self._fetching.get(url)
+            if task is None:
+                task = asyncio.create_task(self._fetch(url, entry, max_size))
+                self._fetching[url] = task
+                task.add_done_callback(lambda _: self._fetching.pop(url, None))
+            image = await asyncio.shield(task)
+
+        # cached images and shared downloads were fetched under someone else's limit
+        if max_size is not None and len(image.data) > max_size:
+            raise ResponseTooLarge(url, max_size)
+        return image
+
+
+    async def derive(self, image: CachedImage, kind: str, compute):
+        """compute(data) for an image, sync or async, computed once per content hash and kind."""
+        key = (image.hash, kind)
+        if key in self._derived:
+            self._derived.move_to_end(key)
+            return self._derived[key][0]
+
+        result = compute(image.data)
+        if inspect.isawaitable(result):
+            result = await result
+
+        # gifs dominate, the color tuples are small enough to count at their shallow size
+        size = len(result) if isinstance(result, (bytes, bytearray)) else sys.getsizeof(result)
+        if size <= self.derived_budget and key not in self._derived:
+            self._derived[key] = (result, size)
+            self._derived_size += size
+            while self._derived_size > self.derived_budget:
+                _, (_, evicted) = self._derived.popitem(last=False)
+                self._derived_size -= evicted
+        return result
+
+
+    async def _fetch(self, url, entry, max_size):
+        headers = {}
+        if entry is not None:
+            _, etag, last_modified, _ = entry
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        response = await self.http_client.get(url, max_size, headers=headers)
+        if response.status == 304:
+            image = await self._load(entry[0])
+            if image is not None:
+                expires_at = self._expires_at(response.headers)
+                self._remember(url, (*entry[:3], expires_at))
+                await self.db.image_touch(image.hash, url, expires_at)
+                return image
+
+            # evicted since, the validators are useless without the body
+            response = await self.http_client.get(url, max_size)
+
+        data = response.body
+        content_hash = hashlib.sha256(data).hexdigest()
+        await asyncio.to_thread(self._write_file, content_hash, data)
+
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        expires_at = self._expires_at(response.headers)
+        evicted = await self.db.image_save(url, content_hash, len(data), etag, last_modified, expires_at, self.disk_budget)
+        if evicted:
+            await asyncio.to_thread(self._delete_files, evicted)
+
+        self._remember(url, (content_hash, etag, last_modified, expires_at))
+        self._store(content_hash, data)
+        return CachedImage(content_hash, data)
+
+
+    async def _load(self, content_hash):
+        data = self._blobs.get(content_hash)
+        if data is not None:
+            self._blobs.move_to_end(content_hash)
+            return CachedImage(content_hash, data)
+
+        try:
+            data = await asyncio.to_thread(self._read_file, content_hash)
+        except FileNotFoundError:
+            return None
+
+        self._store(content_hash, data)
+        await self.db.image_touch(content_hash)
+        return CachedImage(content_hash, data)
+
+
+    def _expires_at(self, headers):
+        cache_control = headers.get("Cache-Control", "")
+        if "no-cache" in cache_control or "no-store" in cache_control:
+            return int(time.time())
+
+        match = MAX_AGE_REGEX.search(cache_control)
+        return int(time.time()) + (int(match.group(1)) if match else self.default_ttl)
+
+
+    def _remember(self, url, entry):
+        self._urls[url] = entry
+        self._urls.move_to_end(url)
+        while len(self._urls) > self.url_capacity:
+            self._urls.popitem(last=False)
+        return entry
+
+
+    def _store(self, content_hash, data):
+        if len(data) > self.memory_budget or content_hash in self._blobs:
+            return
+
+        self._blobs[content_hash] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_budget:
+            _, evicted = self._blobs.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+
+    def _path(self, content_hash):
+        return os.path.join(self.directory, content_hash)
+
+
+    def _read_file(self, content_hash):
+        with open(self._path(content_hash), "rb") as f:
+            return f.read()
+
+
+    def _write_file(self, content_hash, data):
+        path = self._path(content_hash)
+        if os.path.exists(path):
+            return
+
+        # written under a temporary name so a crash never leaves a truncated image behind
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+
+
+    def _delete_files(self, hashes):
+        for content_hash in hashes:
+            try:
+                os.remove(self._path(content_hash))
+            except FileNotFoundError:
+                pass
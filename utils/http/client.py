@@ -0,0 +1,156 @@
+import argparse
+import asyncio
+import time
+from dataclasses import dataclass
+
+import aiohttp
+from multidict import CIMultiDictProxy
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ResponseTooLarge(aiohttp.ClientError):
+    def __init__(self, url, max_size):
+        super().__init__(f"Response from {url} is larger than {max_size} bytes")
+        self.url = url
+        self.max_size = max_size
+
+
+@dataclass
+class HTTPResponse:
+    status: int
+    headers: CIMultiDictProxy
+    body: bytes
+
+
+class HTTPClient:
+    """
+    One aiohttp session shared by every cog.
+
+    Connections are pooled and kept alive per host, so repeated requests to
+    the same CDN skip the DNS lookup and the TCP/TLS handshake. The pool
+    caps concurrent connections overall and per host, every request has a
+    timeout, and bodies are streamed in chunks and cut off at a size limit
+    instead of being read into memory whole.
+
+    The session is created on first use so it is bound to the running loop.
+    Every failure (status, timeout, size) surfaces as an aiohttp.ClientError.
+    """
+
+    def __init__(self, logger=None, limit=64, limit_per_host=8, timeout=15.0, connect_timeout=5.0, max_size=8 * 1024 * 1024):
+        self.logger = logger
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = aiohttp.ClientTimeout(total=timeout, sock_connect=connect_timeout)
+        self.max_size = max_size
+        self._session = None
+
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host, ttl_dns_cache=300, keepalive_timeout=30)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+    async def stream(self, url: str, max_size: int = None, timeout: float = None, **kwargs):
+        """Yields the body of a successful GET in chunks, raising ResponseTooLarge past max_size bytes."""
+        try:
+            async with self.session.get(url, **self._options(timeout, kwargs)) as response:
+                response.raise_for_status()
+                async for chunk in self._chunks(response, url, max_size or self.max_size):
+                    yield chunk
+        except asyncio.TimeoutError as e:
+            raise aiohttp.ServerTimeoutError(f"Request to {url} timed out") from e
+
+
+    async def get(self, url: str, max_size: int = None, timeout: float = None, **kwargs) -> HTTPResponse:
+        """A successful (or 304 Not Modified) GET with its headers and the whole body."""
+        try:
+            async with self.session.get(url, **self._options(timeout, kwargs)) as response:
+                response.raise_for_status()
+                body = b"".join([chunk async for chunk in self._chunks(response, url, max_size or self.max_size)])
+                return HTTPResponse(response.status, response.headers, body)
+        except asyncio.TimeoutError as e:
+            raise aiohttp.ServerTimeoutError(f"Request to {url} timed out") from e
+
+
+    async def get_bytes(self, url: str, max_size: int = None, timeout: float = None, **kwargs) -> bytes:
+        return (await self.get(url, max_size, timeout, **kwargs)).body
+
+
+    def _options(self, timeout, kwargs):
+        if timeout is not None:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout, sock_connect=self.timeout.sock_connect)
+        return kwargs
+
+
+    @staticmethod
+    async def _chunks(response, url, max_size):
+        if response.content_length is not None and response.content_length > max_size:
+            raise ResponseTooLarge(url, max_size)
+
+        size = 0
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_size:
+                raise ResponseTooLarge(url, max_size)
+            yield chunk
+
+
+async def _benchmark(requests, concurrency, size):
+    from aiohttp import web
+
+    body = b"x" * size
+
+    async def handler(request):
+        return web.Response(body=body)
+
+    app = web.Application()
+    app.router.add_get("/", handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/"
+
+    async def run(fetch):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with semaphore:
+                await fetch()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        return requests / (time.perf_counter() - started)
+
+    async def unpooled():
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url) as response:
+                await response.read()
+
+    client = HTTPClient(limit_per_host=concurrency)
+    try:
+        print(f"session per request: {await run(unpooled):,.0f} requests/s")
+        print(f"shared HTTPClient:   {await run(lambda: client.get_bytes(url)):,.0f} requests/s")
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare a session per request with the shared client against a local server")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--size", type=int, default=16 * 1024, help="response body size in bytes")
+    args = parser.parse_args()
+
+    asyncio.run(_benchmark(args.requests, args.concurrency, args.size))
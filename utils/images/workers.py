@@ -0,0 +1,125 @@
+import asyncio
+import io
+import multiprocessing
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image, ImageStat
+from petpetgif import petpet
+
+# images are scaled down to this before averaging, the mean barely moves
+AVERAGE_COLOR_SIZE = 256
+
+
+class ImageJobError(Exception):
+    pass
+
+
+class CPULimitExceeded(ImageJobError):
+    pass
+
+
+def average_color(data: bytes, size: int = AVERAGE_COLOR_SIZE):
+    """((r, g, b), "#rrggbb") of an image, decoded at reduced size."""
+    # BytesIO shares the bytes object instead of copying it
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEGs are decoded straight at 1/2 to 1/8 scale, the full resolution is never materialized
+        image.draft("RGB", (size, size))
+        image.thumbnail((size, size), Image.Resampling.BOX)
+        color = tuple(int(channel) for channel in ImageStat.Stat(image.convert("RGB")).mean)
+
+    return color, "#{:02x}{:02x}{:02x}".format(*color)
+
+
+def petpet_gif(data: bytes) -> bytes:
+    dest = io.BytesIO()
+    petpet.make(io.BytesIO(data), dest)
+    return dest.getvalue()
+
+
+JOBS = {
+    "average_color": average_color,
+    "petpet": petpet_gif,
+}
+
+
+def _cpu_limit_exceeded(signum, frame):
+    raise CPULimitExceeded("Image job exceeded its CPU time limit")
+
+
+def _init_worker(max_pixels):
+    # larger images raise DecompressionBombError before they are decoded
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    if hasattr(signal, "setitimer"):
+        signal.signal(signal.SIGPROF, _cpu_limit_exceeded)
+
+
+def _run_job(name, cpu_limit, data, kwargs):
+    # ITIMER_PROF counts the CPU time of this worker, so only the job itself is limited
+    limited = hasattr(signal, "setitimer")
+    if limited:
+        signal.setitimer(signal.ITIMER_PROF, cpu_limit)
+
+    try:
+        return JOBS[name](data, **kwargs)
+    except ImageJobError:
+        raise
+    except (Image.DecompressionBombError, OSError, ValueError) as e:
+        # anything PIL raises on a bad or hostile image comes back as one picklable error
+        raise ImageJobError(f"{name} failed: {e}") from None
+    finally:
+        if limited:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+
+
+class ImageWorkers:
+    """
+    Process pool for CPU heavy image work, so decoding a huge upload never
+    blocks the event loop.
+
+    Every job has a CPU time limit enforced inside the worker, which frees
+    the worker even after the caller gave up. The signal only lands between
+    Python bytecodes, a decode running in PIL's C code finishes first, so the
+    caller also waits on a wall clock timeout. Images above max_pixels are
+    refused before decoding.
+    """
+
+    def __init__(self, workers=2, timeout=20.0, cpu_limit=10.0, max_pixels=64_000_000):
+        self.workers = workers
+        self.timeout = timeout
+        self.cpu_limit = cpu_limit
+        self.max_pixels = max_pixels
+        self.pool = self._start_pool()
+
+
+    def _start_pool(self):
+        # spawned workers start clean, forking would copy the event loop and the database threads into them
+        return ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker, initargs=(self.max_pixels,)
+        )
+
+
+    async def run(self, name: str, data: bytes, **kwargs):
+        """Runs JOBS[name](data, **kwargs) in a worker, raising ImageJobError if it fails or runs out of time."""
+        if name not in JOBS:
+            raise ValueError(f"Unknown image job: {name}")
+
+        loop = asyncio.get_running_loop()
+        pool = self.pool
+        try:
+            future = loop.run_in_executor(pool, _run_job, name, self.cpu_limit, data, kwargs)
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise ImageJobError(f"{name} timed out after {self.timeout}s") from None
+        except BrokenProcessPool:
+            # a worker died (out of memory, a crash in PIL) and took the pool with it, later jobs get a fresh one
+            if self.pool is pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = self._start_pool()
+            raise ImageJobError(f"{name} failed, its worker process died") from None
+
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,128 @@
+import asyncio
+import random
+import time
+from collections import deque
+
+import discord
+
+
+class DeliveryPipeline:
+    """
+    Bounded pool of workers that sends due reminders concurrently.
+
+    Sends are bucketed by route (a channel or a user's DMs): each route is
+    delivered in order by one worker at a time, so a busy channel never eats
+    into another channel's rate limit, while different routes go out in
+    parallel. Failed sends are retried with exponential backoff and end up in
+    the dead letter handler once they are out of attempts.
+    """
+
+    def __init__(self, send, dead_letter, workers=32, max_attempts=5, base_delay=1.0, logger=None):
+        self.send = send
+        self.dead_letter = dead_letter
+        self.worker_count = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.logger = logger
+
+        self._queue = asyncio.Queue()
+        self._routes = {}  # route -> deque of pending jobs, only present while the route has work
+        self._workers = []
+
+        self.lag_samples = deque(maxlen=10000)
+        self.delivered = 0
+        self.failed = 0
+
+
+    def start(self):
+        for _ in range(self.worker_count - len(self._workers)):
+            self._workers.append(asyncio.create_task(self._worker()))
+
+
+    def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        self._workers.clear()
+
+
+    def submit(self, route, job, scheduled_at: float):
+        pending = self._routes.get(route)
+        if pending is not None:
+            # a worker already owns this route and will pick the job up in order
+            pending.append((job, scheduled_at))
+            return
+
+        self._routes[route] = deque([(job, scheduled_at)])
+        self._queue.put_nowait(route)
+
+
+    def lag_stats(self) -> dict:
+        """Delivery lag (time sent minus time scheduled) percentiles in seconds."""
+        if not self.lag_samples:
+            return {"p50": 0.0, "p99": 0.0, "max": 0.0}
+
+        samples = sorted(self.lag_samples)
+        return {
+            "p50": samples[len(samples) // 2],
+            "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+            "max": samples[-1]
+        }
+
+
+    async def _worker(self):
+        while True:
+            route = await self._queue.get()
+            pending = self._routes[route]
+
+            while pending:
+                job, scheduled_at = pending.popleft()
+                await self._deliver(job, scheduled_at)
+
+            del self._routes[route]
+            self._queue.task_done()
+
+            if self._queue.empty() and not self._routes and self.logger:
+                stats = self.lag_stats()
+                self.logger.debug(
+                    f"Reminder queue drained ({self.delivered} delivered, {self.failed} failed), "
+                    f"lag p50 {stats['p50']:.3f}s p99 {stats['p99']:.3f}s max {stats['max']:.3f}s"
+                )
+
+
+    async def _deliver(self, job, scheduled_at: float):
+        error = None
+
+        for attempt in range(self.max_attempts):
+            try:
+                await self.send(job)
+                self.delivered += 1
+                self.lag_samples.append(time.time() - scheduled_at)
+                return
+            except (discord.Forbidden, discord.NotFound, LookupError) as e:
+                # retrying won't help, the destination is gone or closed to us
+                error = e
+                break
+            except discord.HTTPException as e:
+                error = e
+                if e.status == 429:
+                    delay = getattr(e, "retry_after", None) or self.base_delay * 2 ** attempt
+                elif e.status >= 500:
+                    delay = self.base_delay * 2 ** attempt
+                else:
+                    break
+            except (OSError, asyncio.TimeoutError) as e:
+                error = e
+                delay = self.base_delay * 2 ** attempt
+            except Exception as e:
+                error = e
+                break
+
+            if attempt < self.max_attempts - 1:
+                await asyncio.sleep(delay + random.uniform(0, self.base_delay))
+
+        self.failed += 1
+        try:
+            await self.dead_letter(job, scheduled_at, attempt + 1, repr(error))
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Could not dead-letter reminder: {e}")
@@ -0,0 +1,111 @@
+from datetime import datetime, timezone, timedelta
+
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+# (min, max) for each cron field: minute, hour, day of month, month, day of week (0 = sunday)
+CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+
+def _parse_clock(value: str):
+    hour, minute = value.split(":")
+    hour, minute = int(hour), int(minute)
+    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+        raise ValueError(f"Invalid time of day: {value}")
+    return hour, minute
+
+
+def _parse_cron_field(field: str, low: int, high: int) -> set:
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step = part.split("/")
+            step = int(step)
+
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = map(int, part.split("-"))
+        else:
+            start = end = int(part)
+
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"Invalid cron field: {field}")
+
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def parse_recurrence(rule: str):
+    """
+    Parses a recurrence rule into a matcher tuple. Supported rules:
+        daily HH:MM
+        weekly <mon..sun> HH:MM
+        <minute> <hour> <day> <month> <weekday>   (cron syntax, UTC)
+    Raises ValueError for anything else.
+    """
+    parts = rule.strip().lower().split()
+
+    if len(parts) == 2 and parts[0] == "daily":
+        hour, minute = _parse_clock(parts[1])
+        return ({minute}, {hour}, None, None, None)
+
+    if len(parts) == 3 and parts[0] == "weekly":
+        if parts[1] not in WEEKDAYS:
+            raise ValueError(f"Invalid weekday: {parts[1]}")
+        hour, minute = _parse_clock(parts[2])
+        # cron counts weekdays from sunday
+        return ({minute}, {hour}, None, None, {(WEEKDAYS.index(parts[1]) + 1) % 7})
+
+    if len(parts) == 5:
+        fields = []
+        for part, (low, high) in zip(parts, CRON_FIELDS):
+            fields.append(None if part == "*" else _parse_cron_field(part, low, high))
+        if fields[0] is None:
+            fields[0] = set(range(60))
+        if fields[1] is None:
+            fields[1] = set(range(24))
+        return tuple(fields)
+
+    raise ValueError(f"Unsupported recurrence rule: {rule}")
+
+
+def recurrence_from_timestamp(kind: str, timestamp: int) -> str:
+    """Builds a daily/weekly rule that repeats at the same UTC time as the timestamp."""
+    moment = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    clock = moment.strftime("%H:%M")
+    if kind == "daily":
+        return f"daily {clock}"
+    if kind == "weekly":
+        return f"weekly {WEEKDAYS[moment.weekday()]} {clock}"
+    return kind
+
+
+def next_occurrence(rule: str, after: float) -> int:
+    """Returns the first timestamp strictly after `after` matching the rule."""
+    minutes, hours, days, months, weekdays = parse_recurrence(rule)
+
+    start = datetime.fromtimestamp(after, tz=timezone.utc).replace(second=0, microsecond=0) + timedelta(minutes=1)
+    sorted_hours = sorted(hours)
+    sorted_minutes = sorted(minutes)
+
+    day = start.replace(hour=0, minute=0)
+    # five years covers every valid combination, including 29th of february
+    for _ in range(366 * 5):
+        day_matches = months is None or day.month in months
+        if day_matches and (days is not None or weekdays is not None):
+            # standard cron: if both day fields are restricted, either one may match
+            dom_match = days is not None and day.day in days
+            dow_match = weekdays is not None and (day.weekday() + 1) % 7 in weekdays
+            day_matches = dom_match or dow_match
+
+        if day_matches:
+            for hour in sorted_hours:
+                for minute in sorted_minutes:
+                    candidate = day.replace(hour=hour, minute=minute)
+                    if candidate >= start:
+                        return int(candidate.timestamp())
+
+        day += timedelta(days=1)
+
+    raise ValueError(f"Recurrence rule never fires: {rule}")
@@ -0,0 +1,68 @@
+import asyncio
+import heapq
+import time
+
+
+class ReminderScheduler:
+    """
+    Keeps pending reminders in a min-heap ordered by due time and sleeps until
+    the earliest one is due, so nothing runs (and nothing touches the database)
+    while no reminder is pending. Every reminder that is due at wake-up is
+    handed to the callback as one batch.
+    """
+
+    def __init__(self, callback, logger=None):
+        self.callback = callback
+        self.logger = logger
+
+        self._heap = []  # (due_at, reminder_id, reminder)
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+    def schedule(self, due_at: float, reminder_id: int, reminder: dict):
+        heapq.heappush(self._heap, (due_at, reminder_id, reminder))
+
+        # only the head of the heap decides how long the loop sleeps
+        if self._heap[0][1] == reminder_id:
+            self._wakeup.set()
+
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            delay = self._heap[0][0] - time.time()
+
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            now = time.time()
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap)[2])
+
+            try:
+                await self.callback(due)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Error while firing {len(due)} reminders: {e}")
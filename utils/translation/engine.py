@@ -0,0 +1,201 @@
+import argparse
+import asyncio
+import random
+import re
+import time
+
+# ">.<" is listed twice on purpose, it comes up twice as often as the others
+KAOMOJI = (">.<", ":3", "^-^", "^.^", ">w<", "^.~", "~.^", ">.<", "^o^", "^_^", ">.>", "^3^")
+KAOMOJI_SET = frozenset(KAOMOJI)
+
+STUTTER_CHANCE = 0.5
+KAOMOJI_CHANCE = 0.5
+
+# whole words no translator may touch: links, mentions, channels, emoji and kaomoji
+PROTECTED = (
+    r"(?<!\S)\S*https?://\S*"
+    r"|(?<!\S)[@#:<]\S*"
+    rf"|(?<!\S)(?:{'|'.join(re.escape(kaomoji) for kaomoji in KAOMOJI)})(?!\S)"
+)
+PROTECTED_REGEX = re.compile(PROTECTED)
+
+
+def match_case(source: str, replacement: str) -> str:
+    if source.isupper() and len(source) > 1:
+        return replacement.upper()
+    if source[0].isupper():
+        return replacement[0].upper() + replacement[1:]
+    return replacement
+
+
+class Translator:
+    """
+    Rewrites a message with a single re.sub.
+
+    Every rule is one alternative of a combined regex, tried in order at each
+    position, with protected words (links, mentions, emoji, kaomoji) as the
+    first alternative so they are matched and returned unchanged. A rule is
+    (pattern, replacement) where the replacement is a string or a function
+    of the match.
+    """
+
+    def __init__(self, rules, flags=0):
+        alternatives = [f"(?P<protected>{PROTECTED})"]
+        self.replacements = {}
+        for i, (pattern, replacement) in enumerate(rules):
+            alternatives.append(f"(?P<rule{i}>{pattern})")
+            self.replacements[f"rule{i}"] = replacement
+
+        self.regex = re.compile("|".join(alternatives), flags)
+
+
+    @classmethod
+    def from_words(cls, words: dict, rules=()):
+        """Case-preserving whole word (or phrase) replacements, longest first, then the extra rules."""
+        def replace(match):
+            return match_case(match.group(), words[match.group().lower()])
+
+        keys = sorted(words, key=len, reverse=True)
+        pattern = rf"\b(?i:{'|'.join(re.escape(key) for key in keys)})\b"
+        return cls([(pattern, replace), *rules])
+
+
+    def __call__(self, text: str) -> str:
+        return self.regex.sub(self._replace, text)
+
+
+    def _replace(self, match):
+        name = match.lastgroup
+        if name == "protected":
+            return match.group()
+
+        replacement = self.replacements[name]
+        return replacement if isinstance(replacement, str) else replacement(match)
+
+
+# lookaheads keep the vowel unconsumed, so "nove" still becomes "nyuv" as with the rules applied one after another
+_uwu_rules = Translator([
+    (r"ove", "uv"),
+    (r"[rl]", "w"),
+    (r"[RL]", "W"),
+    (r"n(?=[aeiou])", "ny"),
+    (r"N(?=[aeiou])", "Ny"),
+    (r"N(?=[AEIOU])", "NY"),
+])
+
+
+def translate_uwu(text: str) -> str:
+    words = _uwu_rules(text).split(" ")
+
+    for i, word in enumerate(words):
+        if not word or word in KAOMOJI_SET or PROTECTED_REGEX.match(word):
+            continue
+
+        if random.random() <= STUTTER_CHANCE:
+            first = word[0].upper() if len(word) > 1 and word[1].isupper() else word[0].lower()
+            word = word[0] + "-" + (first + "-") * random.randrange(1, 3) + first + word[1:]
+
+        if random.random() <= KAOMOJI_CHANCE:
+            word += " " + random.choice(KAOMOJI)
+
+        words[i] = word
+
+    return " ".join(words)
+
+
+translate_lolcat = Translator.from_words(
+    {"you": "u", "have": "haz", "can i": "i can", "cat": "kitteh", "cats": "kittehs", "hello": "oh hai", "hi": "oh hai", "the": "teh", "my": "mah", "please": "plz", "what": "wut", "love": "luv"},
+    rules=[(r"er\b", "r"), (r"th", "d"), (r"(?<=\w)s\b", "z"), (r"(?<=\w)y\b", "eh")]
+)
+
+
+translate_pirate = Translator.from_words(
+    {
+        "hello": "ahoy", "hi": "ahoy", "hey": "ahoy", "my": "me", "friend": "matey", "friends": "mateys",
+        "yes": "aye", "no": "nay", "is": "be", "are": "be", "am": "be", "you": "ye", "your": "yer",
+        "stop": "avast", "money": "doubloons", "boy": "lad", "girl": "lass", "where": "whar",
+        "there": "thar", "wow": "blimey", "the": "th'", "of": "o'", "to": "t'", "and": "an'",
+        "stranger": "scurvy dog", "bathroom": "head", "food": "grub", "drink": "grog",
+    },
+    rules=[(r"(?<=\w\w)ing\b", "in'")]
+)
+
+
+translate_shakespeare = Translator.from_words({
+    "you": "thou", "your": "thy", "yours": "thine", "yourself": "thyself", "are": "art", "have": "hast",
+    "has": "hath", "do": "dost", "does": "doth", "will": "wilt", "hello": "good morrow", "hi": "hail",
+    "yes": "aye", "no": "nay", "why": "wherefore", "before": "ere", "often": "oft", "maybe": "perchance",
+    "perhaps": "perchance", "over": "o'er", "never": "ne'er", "ever": "e'er", "it is": "'tis",
+    "it was": "'twas", "friend": "good sir", "very": "verily", "here": "hither", "there": "thither",
+})
+
+
+_upside_down = str.maketrans(
+    "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789.,!?'\"()[]{}<>&_;",
+    "ɐqɔpǝɟƃɥᴉɾʞlɯuodbɹsʇnʌʍxʎz∀ᗺƆᗡƎℲ⅁HIſꓘ⅂WNOԀΌᴚS⊥∩ΛMX⅄Z0ƖᄅƐㄣϛ9ㄥ86˙'¡¿,„)(][}{><⅋‾؛"
+)
+
+
+def translate_upside_down(text: str) -> str:
+    # protected words stay readable, everything else is flipped and the order reversed
+    parts = PROTECTED_REGEX.split(text)
+    protected = PROTECTED_REGEX.findall(text)
+
+    flipped = [part.translate(_upside_down)[::-1] for part in parts]
+    pieces = [flipped[0]]
+    for word, part in zip(protected, flipped[1:]):
+        pieces += [word, part]
+    return "".join(reversed(pieces))
+
+
+TRANSLATORS = {
+    "uwuspeak": translate_uwu,
+    "lolspeak": translate_lolcat,
+    "pirate": translate_pirate,
+    "shakespeare": translate_shakespeare,
+    "upside_down": translate_upside_down,
+}
+
+
+def translate(mode: str, text: str) -> str:
+    return TRANSLATORS[mode](text)
+
+
+async def _load_corpus(path, limit):
+    from utils.database.database import DBManager
+
+    db = DBManager(path, legacy_paths=())
+    try:
+        def query(cursor):
+            cursor.execute("SELECT content FROM generator_message_cache WHERE content != '' LIMIT ?", (limit,))
+            return [row[0] for row in cursor.fetchall()]
+
+        return await db._read(query)
+    finally:
+        db.close()
+
+
+def _benchmark(messages, seconds):
+    characters = sum(len(message) for message in messages)
+    for mode, translator in TRANSLATORS.items():
+        count = 0
+        started = time.perf_counter()
+        while time.perf_counter() - started < seconds:
+            for message in messages:
+                translator(message)
+            count += 1
+        elapsed = time.perf_counter() - started
+        print(f"{mode:12} {count * len(messages) / elapsed:>10,.0f} messages/s {count * characters / elapsed / 1e6:>6.1f} M chars/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Translator throughput over the cached generator messages")
+    parser.add_argument("--db", default="data.db")
+    parser.add_argument("--limit", type=int, default=50_000)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    corpus = asyncio.run(_load_corpus(args.db, args.limit))
+    print(f"{len(corpus):,} messages")
+    if corpus:
+        _benchmark(corpus, args.seconds)
@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import time
+
+import discord
+
+WEBHOOK_NAME = "mechabot"
+
+
+class WebhookRelay:
+    """
+    Reposts a user's message through a channel webhook, under their name and
+    avatar.
+
+    Webhooks are cached per channel, so only the first relay in a channel
+    lists (or creates) its webhooks; on_webhooks_update must call
+    invalidate() so a deleted or edited webhook is looked up again. Deleting
+    the original and sending the copy are two independent API calls and run
+    concurrently, a relay with a warm cache costs a single round trip.
+    """
+
+    def __init__(self, logger):
+        self.logger = logger
+        self._webhooks = {}  # channel id -> discord.Webhook
+        self._fetching = {}  # channel id -> task
+
+
+    def invalidate(self, channel_id: int):
+        self._webhooks.pop(channel_id, None)
+
+
+    async def webhook(self, channel) -> discord.Webhook:
+        webhook = self._webhooks.get(channel.id)
+        if webhook is not None:
+            return webhook
+
+        # a burst of messages in a fresh channel shares one lookup, and creates at most one webhook
+        task = self._fetching.get(channel.id)
+        if task is None:
+            task = asyncio.create_task(self._find_or_create(channel))
+            self._fetching[channel.id] = task
+            task.add_done_callback(lambda _: self._fetching.pop(channel.id, None))
+        return await asyncio.shield(task)
+
+
+    async def relay(self, message: discord.Message, content: str):
+        """Replaces message with content sent as its author, raising discord.HTTPException if the send fails."""
+        channel = message.channel
+        thread = channel if isinstance(channel, discord.Thread) else discord.utils.MISSING
+        parent = channel.parent if thread else channel
+
+        webhook, header = await asyncio.gather(self.webhook(parent), self._reply_header(message))
+        options = dict(
+            content=header + content,
+            username=message.author.display_name,
+            avatar_url=message.author.display_avatar.url,
+            allowed_mentions=discord.AllowedMentions(users=False, roles=False, everyone=False),
+            thread=thread,
+        )
+
+        deleted, sent = await asyncio.gather(message.delete(), webhook.send(**options), return_exceptions=True)
+        if isinstance(sent, discord.NotFound):
+            # the webhook was deleted before on_webhooks_update reached us, concurrent relays may have replaced it already
+            if self._webhooks.get(parent.id) is webhook:
+                self.invalidate(parent.id)
+            sent = await (await self.webhook(parent)).send(**options)
+
+        if isinstance(deleted, Exception):
+            self.logger.warning(f"Could not delete relayed message {message.id}: {deleted}")
+        if isinstance(sent, Exception):
+            raise sent
+
+
+    async def _find_or_create(self, channel):
+        webhooks = await channel.webhooks()
+        # without a token the webhook belongs to another application and cannot be sent through
+        webhook = next((wh for wh in webhooks if wh.name == WEBHOOK_NAME and wh.token), None)
+        if webhook is None:
+            webhook = await channel.create_webhook(name=WEBHOOK_NAME)
+
+        self._webhooks[channel.id] = webhook
+        return webhook
+
+
+    @staticmethod
+    async def _reply_header(message):
+        if message.reference is None or not message.mentions:
+            return ""
+
+        # replies arrive with the referenced message resolved, fetching is only a fallback
+        reference = message.reference.resolved
+        if not isinstance(reference, discord.Message):
+            try:
+                reference = await message.channel.fetch_message(message.reference.message_id)
+            except discord.HTTPException:
+                return ""
+
+        return f"-# [↪]({reference.jump_url}) {message.mentions[0].mention} {reference.content}\n"
+
+
+async def _benchmark(messages, latency):
+    import logging
+    from types import SimpleNamespace
+
+    async def call(result=None):
+        await asyncio.sleep(latency)
+        return result
+
+    webhook = SimpleNamespace(name=WEBHOOK_NAME, token="token", send=lambda **_: call())
+    channel = SimpleNamespace(id=1, webhooks=lambda: call([webhook]), create_webhook=lambda **_: call(webhook))
+    author = SimpleNamespace(display_name="user", display_avatar=SimpleNamespace(url="https://cdn.discordapp.com/avatar.png"))
+
+    def message():
+        return SimpleNamespace(id=1, channel=channel, author=author, reference=None, mentions=[], delete=call)
+
+    async def uncached(msg, content):
+        # the previous relay: list the webhooks, delete, then send, one after another
+        hook = next((wh for wh in await msg.channel.webhooks() if wh.name == WEBHOOK_NAME), None)
+        await msg.delete()
+        await hook.send(content=content, username=msg.author.display_name, avatar_url=msg.author.display_avatar.url)
+
+    relay = WebhookRelay(logging.getLogger(__name__))
+    for name, fn in (("sequential, uncached", uncached), ("WebhookRelay", relay.relay)):
+        started = time.perf_counter()
+        for _ in range(messages):
+            await fn(message(), "hewwo")
+        print(f"{name:22} {(time.perf_counter() - started) / messages * 1000:6.1f} ms per message")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Relay latency against a fake channel with a fixed API round trip")
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per API call")
+    args = parser.parse_args()
+
+    asyncio.run(_benchmark(args.messages, args.latency))